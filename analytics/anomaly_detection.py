@@ -1,42 +1,64 @@
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import IsolationForest
-import json
+from model_registry import get_model
+from serialization import dumps, paginate
+from snapshot import load_dataset
 
-def detect_anomalies():
-    """
-    Isolation Forest Anomaly Detection
-    Detects unusual transactions and fraud patterns
-    """
-    with open('../database/datasets/processed_data.json', 'r') as f:
-        data = json.load(f)
-    
-    sales_df = pd.DataFrame(data['sales'])
+MODEL_NAME = 'anomalies'
+FEATURES = ['Quantity', 'total_amount']
+PARAMS = {'contamination': 0.05, 'random_state': 42}
+
+def train_anomalies(data, params=PARAMS):
+    """Fit Isolation Forest on transaction features; returns (model, metrics)"""
+    from sklearn.ensemble import IsolationForest
     
-    # Features for anomaly detection
-    X = sales_df[['Quantity', 'total_amount']].fillna(0)
+    X = data['sales'][FEATURES].fillna(0)
     
     # Isolation Forest
-    iso_forest = IsolationForest(contamination=0.05, random_state=42)
-    sales_df['anomaly'] = iso_forest.fit_predict(X)
-    sales_df['anomaly_score'] = iso_forest.score_samples(X)
+    model = IsolationForest(contamination=params['contamination'], random_state=params['random_state'])
+    model.fit(X)
+    
+    return model, {'offset': float(model.offset_), 'n_samples': len(X)}
+
+def score_anomalies(data, model, metadata, limit=20, cursor=None):
+    """Flag anomalous transactions with a fitted model"""
+    sales_df = data['sales'].copy()
+    X = sales_df[FEATURES].fillna(0)
+    
+    sales_df['anomaly'] = model.predict(X)
+    sales_df['anomaly_score'] = model.score_samples(X)
     
     # Identify anomalies (-1 = anomaly, 1 = normal)
-    anomalies = sales_df[sales_df['anomaly'] == -1].copy()
-    anomalies = anomalies.sort_values('anomaly_score')
+    anomalies = sales_df[sales_df['anomaly'] == -1]
+    page, next_cursor = paginate(anomalies, ['InvoiceNo', 'Quantity', 'total_amount', 'anomaly_score'],
+                                 limit, cursor, by='anomaly_score', ascending=True)
     
+    contamination = metadata['params']['contamination']
     return {
         'total_transactions': len(sales_df),
         'anomalies_detected': len(anomalies),
-        'contamination_rate': 0.05,
+        'contamination_rate': contamination,
         'percentage_anomalies': round((len(anomalies) / len(sales_df)) * 100, 2),
-        'top_anomalies': anomalies.head(20)[['InvoiceNo', 'Quantity', 'total_amount', 'anomaly_score']].to_dict('records'),
+        'top_anomalies': page,
+        'next_cursor': next_cursor,
         'model': 'Isolation Forest',
         'use_cases': ['Fraud detection', 'Data quality', 'Unusual patterns'],
         'avg_anomaly_value': round(anomalies['total_amount'].mean(), 2),
         'avg_normal_value': round(sales_df[sales_df['anomaly'] == 1]['total_amount'].mean(), 2)
     }
 
+def detect_anomalies(data=None, limit=20, cursor=None):
+    """
+    Isolation Forest Anomaly Detection
+    Detects unusual transactions and fraud patterns
+    """
+    if data is None:
+        data = load_dataset()
+    
+    # Reuse the registered model for this dataset version, training only if missing
+    model, metadata = get_model(MODEL_NAME, data, PARAMS, FEATURES, train_anomalies)
+    return score_anomalies(data, model, metadata, limit, cursor)
+
 if __name__ == '__main__':
     result = detect_anomalies()
-    print(json.dumps(result, indent=2))
+    print(dumps(result, indent=True).decode())
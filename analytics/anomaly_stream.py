@@ -0,0 +1,415 @@
+"""
+Streaming anomaly scoring for live transactions.
+
+Transactions are scored in batches against:
+
+- the registered Isolation Forest (anomaly_detection, via the model
+  registry), refit in the background on a window of recent
+  transactions once enough new ones have arrived
+- running statistics updated incrementally: Welford/Chan mean and
+  variance per feature, plus a log-bucketed quantile sketch of the
+  amount (relative error ~1%), so neither is recomputed from history
+
+Each transaction gets the forest's anomaly score and flag, z-scores
+against the running mean/std and the amount's approximate percentile.
+Scoring is vectorized per batch, so the cost per transaction is a few
+microseconds once batches hold more than a handful of rows.
+
+The scorer state (model, statistics, sketch, window) is saved next to
+the registered models and reloaded on restart for the same dataset
+version. Each server worker scores its own share of the traffic, but
+only one of them writes the state file: the first to save takes an
+exclusive lock on state.lock and keeps it until it stops, so its state
+is the one that wins. The others skip saving and try for the lock
+again on their next save, taking over once the writer has exited. On
+restart every worker resumes from the writer's state. (Without fcntl,
+on Windows, every process writes and the last save wins.)
+"""
+import math
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from anomaly_detection import FEATURES, MODEL_NAME, PARAMS, train_anomalies
+from model_registry import MODELS_DIR, get_model
+
+STREAM_DIR = os.path.join(MODELS_DIR, 'anomalies_stream')
+WINDOW_SIZE = int(os.environ.get('ANOMALY_WINDOW_SIZE', 100_000))
+REFIT_SECONDS = float(os.environ.get('ANOMALY_REFIT_SECONDS', 900))
+REFIT_MIN_NEW = int(os.environ.get('ANOMALY_REFIT_MIN_NEW', 5_000))
+SKETCH_ACCURACY = 0.01
+AMOUNT = FEATURES.index('total_amount')
+
+
+class RunningStats:
+    """Mean and variance per column, merged batch by batch (Welford / Chan)"""
+
+    def __init__(self, width):
+        self.count = 0
+        self.mean = np.zeros(width)
+        self.m2 = np.zeros(width)
+
+    def update(self, X):
+        n = len(X)
+        if n == 0:
+            return
+        batch_mean = X.mean(axis=0)
+        batch_m2 = ((X - batch_mean) ** 2).sum(axis=0)
+
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * n / total
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.zeros_like(self.mean)
+
+    def zscores(self, X):
+        std = self.std
+        return np.divide(X - self.mean, std, out=np.zeros_like(X, dtype=float), where=std > 0)
+
+
+class QuantileSketch:
+    """
+    Log-bucketed counts (DDSketch-style): any value is reported within
+    `accuracy` relative error, updates are one bincount per batch, and
+    two sketches merge by adding counts. Values <= 0 share one bucket.
+    """
+
+    def __init__(self, accuracy=SKETCH_ACCURACY):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.counts = {}
+        self.zero_count = 0
+        self.count = 0
+        self._sorted = None
+
+    def _index(self, values):
+        return np.ceil(np.log(values) / self.log_gamma).astype('int64')
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        self.count += len(values)
+
+        buckets, counts = np.unique(self._index(positive), return_counts=True)
+        for bucket, count in zip(buckets.tolist(), counts.tolist()):
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self._sorted = None
+
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self._sorted = None
+
+    def _cumulative(self):
+        if self._sorted is None:
+            buckets = np.array(sorted(self.counts), dtype='int64')
+            counts = np.array([self.counts[b] for b in buckets.tolist()], dtype='int64')
+            self._sorted = (buckets, self.zero_count + np.cumsum(counts))
+        return self._sorted
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        buckets, cumulative = self._cumulative()
+        bucket = buckets[min(np.searchsorted(cumulative, rank, side='right'), len(buckets) - 1)]
+        return float(2 * self.gamma ** bucket / (self.gamma + 1))
+
+    def percentile_rank(self, values):
+        """Share of seen values <= each value, in percent"""
+        values = np.asarray(values, dtype=float)
+        if self.count == 0:
+            return np.full(len(values), np.nan)
+        buckets, cumulative = self._cumulative()
+        below = np.full(len(values), float(self.zero_count))
+        positive = values > 0
+        if len(buckets):
+            pos = np.searchsorted(buckets, self._index(values[positive]), side='right')
+            below[positive] = np.where(pos > 0, cumulative[np.maximum(pos - 1, 0)], self.zero_count)
+        return below / self.count * 100
+
+
+def _features(transactions):
+    """(ids, X) from transaction dicts; total_amount falls back to Quantity * UnitPrice"""
+    ids = [t.get('InvoiceNo', t.get('invoice_no')) for t in transactions]
+    quantity = np.array([t.get('Quantity', t.get('quantity', np.nan)) for t in transactions], dtype=float)
+    amount = np.array([t.get('total_amount', np.nan) for t in transactions], dtype=float)
+    price = np.array([t.get('UnitPrice', t.get('unit_price', np.nan)) for t in transactions], dtype=float)
+    amount = np.where(np.isnan(amount), quantity * price, amount)
+
+    columns = {'Quantity': quantity, 'total_amount': amount}
+    return ids, np.column_stack([columns[f] for f in FEATURES])
+
+
+class StreamingAnomalyScorer:
+    """Scores transaction batches and keeps the model and statistics current"""
+
+    def __init__(self, state_dir=STREAM_DIR, window_size=WINDOW_SIZE,
+                 refit_seconds=REFIT_SECONDS, refit_min_new=REFIT_MIN_NEW):
+        self.state_dir = state_dir
+        self.window_size = window_size
+        self.refit_seconds = refit_seconds
+        self.refit_min_new = refit_min_new
+
+        self.model = None
+        self.model_info = {}
+        self.base_version = None
+        self.stats = RunningStats(len(FEATURES))
+        self.sketch = QuantileSketch()
+        self.window = np.zeros((window_size, len(FEATURES)))
+        self.window_fill = 0
+        self.window_pos = 0
+        self.scored = 0
+        self.new_since_refit = 0
+
+        self._lock = threading.Lock()
+        self._refit_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._writer_lock = None
+
+    @property
+    def ready(self):
+        return self.model is not None
+
+    # -- seeding and persistence ----------------------------------------
+
+    def _state_path(self):
+        return os.path.join(self.state_dir, 'state.joblib')
+
+    def _take_writer_lock(self):
+        """Whether this process writes the state file (see the module docstring)"""
+        if fcntl is None:
+            return True
+        if self._writer_lock is None:
+            os.makedirs(self.state_dir, exist_ok=True)
+            lock = open(os.path.join(self.state_dir, 'state.lock'), 'a')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                return False
+            self._writer_lock = lock
+        return True
+
+    def _release_writer_lock(self):
+        if self._writer_lock is not None:
+            self._writer_lock.close()
+            self._writer_lock = None
+
+    def seed(self, data, version):
+        """
+        Start from the saved state for this dataset version, or from the
+        registered model and statistics over the dataset's sales
+        """
+        saved = self._load_state()
+        if saved is not None and saved['base_version'] == version:
+            with self._lock:
+                for key, value in saved.items():
+                    setattr(self, key, value)
+            print(f"✅ Anomaly stream resumed: {self.stats.count} transactions seen")
+            return
+
+        model, metadata = get_model(MODEL_NAME, data, PARAMS, FEATURES, train_anomalies)
+        X = data['sales'][FEATURES].fillna(0).to_numpy(dtype=float)
+
+        stats, sketch = RunningStats(len(FEATURES)), QuantileSketch()
+        stats.update(X)
+        sketch.update(X[:, AMOUNT])
+
+        recent = X[-self.window_size:]
+        window = np.zeros((self.window_size, len(FEATURES)))
+        window[:len(recent)] = recent
+
+        with self._lock:
+            self.model = model
+            self.model_info = {'source': 'registry', 'dataset_version': version,
+                               'trained_at': metadata.get('trained_at')}
+            self.base_version = version
+            self.stats, self.sketch = stats, sketch
+            self.window, self.window_fill, self.window_pos = window, len(recent), len(recent) % self.window_size
+            self.new_since_refit = 0
+        self.save()
+        print(f"✅ Anomaly stream seeded from dataset {version}: {stats.count} transactions")
+
+    def reseed(self, data, version):
+        """Dataset-store subscriber: seed in the background, off the load path"""
+        def run():
+            try:
+                self.seed(data, version)
+            except Exception as e:
+                print(f"⚠️ Anomaly stream seeding failed: {e}")
+        threading.Thread(target=run, name='anomaly-seed', daemon=True).start()
+
+    def _load_state(self):
+        try:
+            return joblib.load(self._state_path())
+        except (OSError, EOFError):
+            return None
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable anomaly stream state: {e}")
+            return None
+
+    def save(self):
+        """
+        Persist model, statistics and window (written atomically) if this
+        process is the state writer; returns whether it was saved
+        """
+        if not self._take_writer_lock():
+            return False
+        with self._lock:
+            state = {
+                'model': self.model, 'model_info': self.model_info, 'base_version': self.base_version,
+                'stats': self.stats, 'sketch': self.sketch, 'window': self.window.copy(),
+                'window_fill': self.window_fill, 'window_pos': self.window_pos,
+                'scored': self.scored, 'new_since_refit': self.new_since_refit
+            }
+        os.makedirs(self.state_dir, exist_ok=True)
+        # Per-process temp file: a writer taking over may overlap the old one
+        tmp_path = f"{self._state_path()}.{os.getpid()}.tmp"
+        joblib.dump(state, tmp_path)
+        os.replace(tmp_path, self._state_path())
+        return True
+
+    # -- scoring ---------------------------------------------------------
+
+    def _remember(self, X):
+        """Append rows to the ring buffer used for refits"""
+        X = X[-self.window_size:]
+        end = self.window_pos + len(X)
+        if end <= self.window_size:
+            self.window[self.window_pos:end] = X
+        else:
+            split = self.window_size - self.window_pos
+            self.window[self.window_pos:] = X[:split]
+            self.window[:end - self.window_size] = X[split:]
+        self.window_pos = end % self.window_size
+        self.window_fill = min(self.window_fill + len(X), self.window_size)
+
+    def score(self, transactions):
+        """Score a batch of transaction dicts; returns one result dict per transaction"""
+        if not self.ready:
+            raise RuntimeError('Anomaly scorer is not ready yet')
+        if not transactions:
+            return []
+
+        ids, X = _features(transactions)
+        valid = ~np.isnan(X).any(axis=1)
+        Xv = X[valid]
+
+        model = self.model
+        scores = np.full(len(X), np.nan)
+        if len(Xv):
+            scores[valid] = model.score_samples(pd.DataFrame(Xv, columns=FEATURES))
+        flags = scores < model.offset_
+
+        with self._lock:
+            # Score against what was known before this batch, then learn from it
+            zscores = self.stats.zscores(X)
+            percentiles = self.sketch.percentile_rank(X[:, AMOUNT])
+            self.stats.update(Xv)
+            self.sketch.update(Xv[:, AMOUNT])
+            self._remember(Xv)
+            self.scored += len(Xv)
+            self.new_since_refit += len(Xv)
+
+        results = []
+        for i, (invoice, ok) in enumerate(zip(ids, valid.tolist())):
+            if not ok:
+                results.append({'InvoiceNo': invoice, 'error': 'Quantity and total_amount (or UnitPrice) are required'})
+                continue
+            results.append({
+                'InvoiceNo': invoice,
+                'anomaly': bool(flags[i]),
+                'anomaly_score': round(float(scores[i]), 6),
+                'zscore': {f: round(float(zscores[i, j]), 3) for j, f in enumerate(FEATURES)},
+                'amount_percentile': round(float(percentiles[i]), 2)
+            })
+        return results
+
+    # -- background refit ------------------------------------------------
+
+    def refit(self):
+        """Fit a new forest on the recent window and swap it in"""
+        with self._refit_lock:
+            with self._lock:
+                X = self.window[:self.window_fill].copy()
+                new = self.new_since_refit
+            if len(X) < 2:
+                return False
+
+            started = time.perf_counter()
+            model, metrics = train_anomalies({'sales': pd.DataFrame(X, columns=FEATURES)}, PARAMS)
+            with self._lock:
+                self.model = model
+                self.model_info = {'source': 'refit', 'base_version': self.base_version,
+                                   'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                   'train_seconds': round(time.perf_counter() - started, 3), **metrics}
+                self.new_since_refit -= new
+            self.save()
+            print(f"✅ Anomaly model refit on {len(X)} recent transactions")
+            return True
+
+    def _watch(self):
+        while not self._stop.wait(self.refit_seconds):
+            if self.ready and self.new_since_refit >= self.refit_min_new:
+                try:
+                    self.refit()
+                except Exception as e:
+                    print(f"⚠️ Anomaly refit failed: {e}")
+
+    def start(self):
+        """Start periodic refits in a daemon thread"""
+        if self._thread is None and self.refit_seconds > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name='anomaly-refit', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self.ready:
+            self.save()
+        self._release_writer_lock()
+
+    def status(self):
+        with self._lock:
+            std = self.stats.std
+            return {
+                'ready': self.ready,
+                'state_writer': self._writer_lock is not None or fcntl is None,
+                'base_version': self.base_version,
+                'model': self.model_info,
+                'scored': self.scored,
+                'new_since_refit': self.new_since_refit,
+                'window': self.window_fill,
+                'running_stats': {
+                    'count': self.stats.count,
+                    **{f: {'mean': round(float(self.stats.mean[j]), 4), 'std': round(float(std[j]), 4)}
+                       for j, f in enumerate(FEATURES)}
+                },
+                'amount_quantiles': {
+                    f"p{int(q * 100)}": self.sketch.quantile(q) for q in (0.5, 0.9, 0.95, 0.99)
+                }
+            }
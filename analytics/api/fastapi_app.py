@@ -1,27 +1,330 @@
-from fastapi import FastAPI
+import asyncio
+import importlib
+import threading
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 import sys
 import os
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from ml_simple import (
-    load_data, 
-    simple_forecast, 
-    simple_churn, 
-    simple_segments, 
-    simple_demand, 
-    simple_anomalies
-)
+from anomaly_stream import StreamingAnomalyScorer
+from dataset_cache import DatasetCache
+from dataset_store import DatasetStore
+from job_queue import FINISHED, InvalidParams, JobQueue
+from metrics import Metrics, MetricsMiddleware
+from model_runner import FULL_MODELS, ModelPoolSaturated, ModelRunner
+from profiling import RequestProfiler
+from query_engine import QueryEngine, QueryError
+from result_cache import ResultCache
+from sketches import amount_quantiles, distinct_counts, heavy_hitters
+from serialization import SHAPES, accepted_encoding, compress, dumps, loads, page_bounds
+
+# Browsers and the Node backend may reuse a response for this long before revalidating
+CACHE_MAX_AGE = int(os.environ.get('ML_CACHE_MAX_AGE', 0))
+CACHE_WARMUP = os.environ.get('ML_CACHE_WARMUP', '1') == '1'
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.environ.get('ML_COMPRESS_MIN_BYTES', 1024))
+# Load the dataset and warm the cache at import, so a preloading server
+# (gunicorn --preload) does it once and forks workers that share it.
+# With 0 each worker loads in the background after it starts serving.
+PRELOAD = os.environ.get('ML_PRELOAD', '1') == '1'
+
+def lazy_backend(module_name, function_name):
+    """Model function imported on first call, so its libraries load only when used"""
+    def call(*args, **kwargs):
+        return getattr(importlib.import_module(module_name), function_name)(*args, **kwargs)
+    return call
+
+# endpoint -> (model function, description)
+ML_ENDPOINTS = {
+    "/ml/forecast": (lazy_backend("ml_simple", "simple_forecast"), "ARIMA(5,1,2) sales forecasting model"),
+    "/ml/churn": (lazy_backend("ml_simple", "simple_churn"), "Logistic Regression churn prediction with RFM features"),
+    "/ml/segments": (lazy_backend("ml_simple", "simple_segments"), "K-means clustering with 4 customer segments"),
+    "/ml/demand": (lazy_backend("ml_simple", "simple_demand"), "XGBoost regression for demand forecasting"),
+    "/ml/anomalies": (lazy_backend("ml_simple", "simple_anomalies"), "Isolation Forest for anomaly detection")
+}
+
+# Transactions per scoring call on /ml/anomalies/score
+SCORE_MAX_BATCH = int(os.environ.get('ANOMALY_SCORE_MAX_BATCH', 10000))
+SCORE_STREAM_BATCH = int(os.environ.get('ANOMALY_SCORE_STREAM_BATCH', 500))
+
+# Longest demand forecast, in months (PARAMS['max_horizon'] in demand_prediction)
+DEMAND_MAX_HORIZON = 6
+
+# Largest batch forecast: series and days ahead
+BATCH_MAX_SERIES = 1000
+BATCH_MAX_DAYS = 365
+
+# ARIMA order modes (ORDERS in forecasting): ARIMA(5,1,2), or searched per series
+FORECAST_ORDERS = ("fixed", "auto")
+
+# Longest sales forecast, in days (MAX_DAYS in forecasting)
+FORECAST_DEFAULT_DAYS = 28
+FORECAST_MAX_DAYS = 365
+
+def forecast_order(order):
+    if order not in FORECAST_ORDERS:
+        raise HTTPException(status_code=400, detail=f"order must be one of {', '.join(FORECAST_ORDERS)}")
+    return order
+
+def forecast_days(days):
+    if not 1 <= days <= FORECAST_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {FORECAST_MAX_DAYS}")
+    return days
+
+# Endpoints and full models whose top-k lists take limit / cursor
+PAGED_ENDPOINTS = {"/ml/demand"}
+PAGED_MODELS = {"churn", "demand", "anomalies"}
+
+cache = ResultCache()
+runner = ModelRunner()
+jobs = JobQueue()
+metrics = Metrics()
+profiler = RequestProfiler()
+scorer = StreamingAnomalyScorer()
+# Uploaded datasets, served with ?dataset_id=<user id>/<file>
+datasets = DatasetCache()
+query_engine = None
+# Dataset version the result cache was last warmed for
+warmed_version = None
+
+def encode_result(result, endpoint, description, shape="records"):
+    """Encode an endpoint result once; errors are returned but not cached"""
+    body = dumps({
+        **result,
+        "endpoint": endpoint,
+        "description": description
+    }, shape)
+    return body, 'error' not in result
+
+def compute_endpoint(endpoint, data, shape="records", paging=None):
+    """Run one ML endpoint and encode it"""
+    model, description = ML_ENDPOINTS[endpoint]
+    started = time.perf_counter()
+    result = model(data, **(paging or {}))
+    computed = time.perf_counter()
+    encoded = encode_result(result, endpoint, description, shape)
+    metrics.observe_phase(endpoint, 'compute', computed - started)
+    metrics.observe_phase(endpoint, 'serialize', time.perf_counter() - computed)
+    return encoded
+
+def warm_cache(data, version):
+    """Drop results for the previous version and precompute every endpoint"""
+    global warmed_version
+    # Uploaded datasets' entries stay; they age out of the LRU
+    if warmed_version is not None:
+        cache.evict(warmed_version)
+    if CACHE_WARMUP:
+        for endpoint in ML_ENDPOINTS:
+            cache.get_or_compute(endpoint, (), version, lambda: compute_endpoint(endpoint, data))
+        print(f"✅ Result cache warmed for dataset {version}")
+    warmed_version = version
+
+def response_options(shape="records", limit=None, cursor=None, paged=True):
+    """
+    Validate shape / limit / cursor. Returns (shape, paging kwargs, cache
+    params); defaults are left out of the cache params so a plain request
+    hits the entry warm_cache() computed.
+    """
+    if shape not in SHAPES:
+        raise HTTPException(status_code=400, detail=f"shape must be one of {', '.join(SHAPES)}")
+    
+    paging = {}
+    if paged and (limit is not None or cursor):
+        try:
+            offset, _ = page_bounds(limit or 1, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if limit is not None:
+            paging['limit'] = limit
+        if cursor:
+            paging['cursor'] = str(offset)
+    
+    params = sorted(paging.items()) + ([("shape", shape)] if shape != "records" else [])
+    return shape, paging, params
+
+def request_options(request, paged):
+    """response_options() from the query string of a plain /ml/* request"""
+    query = request.query_params
+    try:
+        limit = int(query["limit"]) if "limit" in query else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="limit must be an integer")
+    return response_options(query.get("shape", "records"), limit, query.get("cursor"), paged)
+
+def entry_response(request, entry, extra_headers=None, media_type="application/json"):
+    """
+    Response for a cache entry, gzip/brotli-compressed when the client
+    accepts it and the body is large enough, or 304 if the client already
+    has this representation
+    """
+    encoding = None
+    if len(entry.body) >= COMPRESS_MIN_BYTES:
+        encoding = accepted_encoding(request.headers.get("accept-encoding"))
+    body, etag = entry.variant(encoding, compress)
+    
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={CACHE_MAX_AGE}, must-revalidate",
+        "Vary": "Accept-Encoding",
+        **(extra_headers or {})
+    }
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+def current_dataset(dataset_id=None):
+    """
+    (data, version, runner source) of an uploaded dataset, or of the main
+    dataset without a dataset_id; 404 for unknown uploads, 422 for files
+    that can't be analysed
+    """
+    if not dataset_id:
+        data, version = store.current()
+        return data, version, None
+    try:
+        data = datasets.get(dataset_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Can't analyse dataset: {e}")
+    return data, data['metadata']['version'], datasets.paths(dataset_id)
+
+def cached_response(request, endpoint, extra_headers=None, options=()):
+    """
+    Serve an ML endpoint from the result cache with ETag revalidation;
+    options are extra (name, value) arguments for the model
+    """
+    shape, paging, params = request_options(request, endpoint in PAGED_ENDPOINTS)
+    data, version, _ = current_dataset(request.query_params.get("dataset_id"))
+    entry = cache.get_or_compute(
+        endpoint, sorted(params + list(options)), version,
+        lambda: compute_endpoint(endpoint, data, shape, {**paging, **dict(options)})
+    )
+    return entry_response(request, entry, extra_headers)
+
+def load_query_engine(data, version):
+    """Register the new dataset version and its rollups in the SQL engine"""
+    global query_engine
+    try:
+        engine = QueryEngine(data)
+    except Exception as e:
+        print(f"⚠️ Query engine unavailable: {e}")
+        return
+    # A newer version may have been swapped in while this one was building
+    if version == store.version:
+        query_engine = engine
+        print(f"✅ Query engine ({engine.backend}) ready in {engine.build_seconds}s")
+
+def record_dataset(data, version):
+    metrics.dataset_loaded(data, version, store.status()['load_seconds'])
+
+def collect_metrics():
+    """Families read from the cache, model pool and job queue at scrape time"""
+    cache_stats = cache.stats()
+    pool = runner.status()
+    job_counts = jobs.status()
+    dataset_stats = datasets.status()
+    return [
+        ('ml_cache_hits_total', 'counter', 'Result cache hits', [({}, cache_stats['hits'])]),
+        ('ml_cache_misses_total', 'counter', 'Result cache misses', [({}, cache_stats['misses'])]),
+        ('ml_cache_hit_ratio', 'gauge', 'Result cache hit ratio since start', [({}, cache_stats['hit_ratio'])]),
+        ('ml_cache_entries', 'gauge', 'Entries in the result cache', [({}, cache_stats['entries'])]),
+        ('ml_datasets_resident', 'gauge', 'Uploaded datasets held in memory', [({}, dataset_stats['resident'])]),
+        ('ml_datasets_bytes', 'gauge', 'Bytes held by resident uploaded datasets', [({}, dataset_stats['bytes'])]),
+        ('ml_datasets_evictions_total', 'counter', 'Uploaded datasets evicted from memory',
+         [({}, dataset_stats['evictions'])]),
+        ('ml_model_pool_pending', 'gauge', 'Full model runs queued or running', [({}, pool['pending'])]),
+        ('ml_jobs', 'gauge', 'Background jobs by status',
+         [({'status': status}, n) for status, n in job_counts.items() if status != 'workers']),
+        ('ml_anomaly_stream_scored_total', 'counter', 'Transactions scored by the anomaly stream',
+         [({}, scorer.scored)])
+    ]
+
+metrics.add_collector(collect_metrics)
+
+def load_data():
+    """Load the dataset (listeners warm the cache and build per-version state)"""
+    print("Loading Kaggle data...")
+    try:
+        store.refresh()
+    except Exception as e:
+        print(f"Error loading data: {e}")
+    
+    if store.data:
+        print(f"✅ Data loaded: {store.data['metadata']['total_sales']} transactions")
+    else:
+        print("⚠️ No data loaded - ML endpoints will return errors")
+
+def prepare_worker():
+    """
+    Per-process state that must not be created before a fork: the scorer's
+    threads and the query engine's database connection. Built in the
+    background so the worker starts answering (and reporting not ready)
+    right away.
+    """
+    if store.data is None:
+        load_data()
+        return
+    data, version = store.current()
+    scorer.reseed(data, version)
+    load_query_engine(data, version)
+
+# The store picks up new snapshot versions after the first load
+store = DatasetStore()
+store.subscribe(record_dataset)
+store.subscribe(warm_cache)
+if PRELOAD:
+    load_data()
+
+def readiness():
+    """(ready, components): ready once the dataset is loaded and the result cache warmed"""
+    version = store.version
+    components = {
+        "dataset": store.data is not None,
+        "result_cache": version is not None and warmed_version == version,
+        "query_engine": query_engine is not None and query_engine.version == version,
+        "anomaly_scorer": scorer.ready
+    }
+    return components["dataset"] and components["result_cache"], components
+
+@asynccontextmanager
+async def lifespan(app):
+    """Start this worker's threads and watch for new dataset versions while the server is running"""
+    store.subscribe(scorer.reseed)
+    store.subscribe(load_query_engine)
+    threading.Thread(target=prepare_worker, name='worker-startup', daemon=True).start()
+    store.start()
+    jobs.start()
+    scorer.start()
+    yield
+    store.stop()
+    jobs.stop()
+    scorer.stop()
+    runner.shutdown()
 
 # Create FastAPI app
 app = FastAPI(
     title="FiberOps ML API",
     description="Machine Learning endpoints for sales forecasting, churn prediction, segmentation, demand prediction, and anomaly detection",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Only wrap endpoints for profiling when it is switched on
+if profiler.enabled:
+    app.router.route_class = profiler.route_class()
+app.add_middleware(MetricsMiddleware, metrics=metrics, profiler=profiler if profiler.enabled else None)
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -31,106 +334,471 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load data once at startup
-print("Loading Kaggle data...")
-data = load_data()
-if data:
-    print(f"✅ Data loaded: {data['metadata']['total_sales']} transactions")
-else:
-    print("⚠️ No data loaded - ML endpoints will return errors")
-
 @app.get("/")
 def root():
     """Root endpoint - API status"""
     return {
         "message": "FiberOps ML API",
         "status": "active",
-        "data_loaded": data is not None,
+        "data_loaded": store.data is not None,
+        "dataset_version": store.version,
         "version": "1.0.0",
         "endpoints": {
             "forecast": "/ml/forecast",
             "churn": "/ml/churn",
             "segments": "/ml/segments",
             "demand": "/ml/demand",
-            "anomalies": "/ml/anomalies"
+            "anomalies": "/ml/anomalies",
+            "full_models": "/ml/{model}/full",
+            "batch_forecast": "/ml/forecast/batch",
+            "demand_forecast": "/ml/demand/forecast",
+            "score_anomalies": "/ml/anomalies/score",
+            "jobs": "/ml/jobs",
+            "query": "/query",
+            "distinct": "/sketches/distinct",
+            "heavy_hitters": "/sketches/top",
+            "quantiles": "/sketches/quantiles",
+            "metrics": "/metrics",
+            "live": "/health/live",
+            "ready": "/health/ready"
         },
+        "dataset_id": "?dataset_id=<user id>/<file> runs /ml/* endpoints on an uploaded dataset",
         "docs": "/docs"
     }
 
 @app.get("/ml/forecast")
-def get_forecast():
+def get_forecast(request: Request, days: int = FORECAST_DEFAULT_DAYS):
     """
     Sales Forecasting using ARIMA
-    Returns 28-day revenue forecast
+    Returns a `days`-day revenue forecast (default 28)
     """
-    result = simple_forecast(data)
-    return {
-        **result,
-        "endpoint": "/ml/forecast",
-        "description": "ARIMA(5,1,2) sales forecasting model"
-    }
+    options = [("days", days)] if forecast_days(days) != FORECAST_DEFAULT_DAYS else []
+    return cached_response(request, "/ml/forecast", options=options)
 
 @app.get("/ml/churn")
-def get_churn():
+def get_churn(request: Request):
     """
     Customer Churn Prediction using Logistic Regression
-    Identifies at-risk customers based on RFM analysis
+    Identifies at-risk customers based on RFM analysis.
+    Recency is counted from each customer's last purchase to the
+    dataset's last sale, not to today, so a historical dataset is not
+    reported as entirely churned and results don't change day to day.
     """
-    result = simple_churn(data)
-    return {
-        **result,
-        "endpoint": "/ml/churn",
-        "description": "Logistic Regression churn prediction with RFM features"
-    }
+    return cached_response(request, "/ml/churn")
 
 @app.get("/ml/segments")
-def get_segments():
+def get_segments(request: Request):
     """
     Customer Segmentation using K-means
-    Groups customers into Champions, Loyal, At-Risk, Lost
+    Groups customers into Champions, Loyal, At-Risk, Lost.
+    Recency (and avg_recency) is counted from each customer's last
+    purchase to the dataset's last sale, not to today.
     """
-    result = simple_segments(data)
-    return {
-        **result,
-        "endpoint": "/ml/segments",
-        "description": "K-means clustering with 4 customer segments"
-    }
+    return cached_response(request, "/ml/segments")
 
 @app.get("/ml/demand")
-def get_demand():
+def get_demand(request: Request):
     """
     Demand Prediction using XGBoost
     Forecasts product demand for inventory optimization
     """
-    result = simple_demand(data)
-    return {
-        **result,
-        "endpoint": "/ml/demand",
-        "description": "XGBoost regression for demand forecasting"
-    }
+    return cached_response(request, "/ml/demand")
 
 @app.get("/ml/anomalies")
-def get_anomalies():
+def get_anomalies(request: Request):
     """
     Anomaly Detection using Isolation Forest
     Detects unusual transactions and potential fraud
     """
-    result = simple_anomalies(data)
-    return {
-        **result,
-        "endpoint": "/ml/anomalies",
-        "description": "Isolation Forest for anomaly detection"
+    return cached_response(request, "/ml/anomalies")
+
+def encode_lines(result):
+    """One NDJSON line per series of a batch forecast; errors are returned but not cached"""
+    if 'error' in result:
+        return dumps({"error": result["error"]}) + b"\n", False
+    return b"".join(dumps(series) + b"\n" for series in result["series"].values()), True
+
+@app.get("/ml/forecast/batch")
+async def get_batch_forecast(request: Request, by: str = "country",
+                             top_n: int = Query(20, ge=1, le=BATCH_MAX_SERIES),
+                             days: int = Query(28, ge=1, le=BATCH_MAX_DAYS),
+                             order: str = "fixed", dataset_id: str = None):
+    """
+    Batch Forecasting per country or per product
+    Returns one NDJSON line per series
+    With order=auto, each series' ARIMA order is searched (and cached per series)
+    Runs in the background process pool like the full models: concurrent
+    identical requests share one run, results are cached per dataset
+    version, and a saturated pool or a run that takes too long gets a 503
+    (retry to pick up the result once it's done)
+    """
+    if by not in ("country", "product"):
+        raise HTTPException(status_code=400, detail="by must be 'country' or 'product'")
+    if not dataset_id and store.version is None:
+        raise HTTPException(status_code=503, detail="No data loaded")
+    params = [("by", by), ("days", days), ("top_n", top_n)]
+    if forecast_order(order) == "auto":
+        params.append(("order", "auto"))
+    
+    # Series are fitted one after another in the pool worker; the pool is the parallelism
+    return await pooled_response(request, "batch_forecast", "/ml/forecast/batch", params + [("n_jobs", 1)],
+                                 sorted(params), encode_lines, dataset_id, media_type="application/x-ndjson")
+
+def score_batch(transactions):
+    """Score one batch of transactions, 503 until the scorer is seeded"""
+    if not scorer.ready:
+        raise HTTPException(status_code=503, detail="Anomaly scorer is warming up", headers={"Retry-After": "5"})
+    started = time.perf_counter()
+    results = scorer.score(transactions)
+    metrics.observe_phase("/ml/anomalies/score", "compute", time.perf_counter() - started)
+    return results
+
+@app.post("/ml/anomalies/score")
+async def score_anomalies(request: Request):
+    """
+    Streaming Anomaly Scoring for live transactions
+    Body: a JSON list of transactions (or {"transactions": [...]}) with
+    Quantity and total_amount (or UnitPrice); InvoiceNo is echoed back.
+    With Content-Type application/x-ndjson, one transaction per line is
+    read and scored in micro-batches and results stream back as NDJSON.
+    """
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        if not scorer.ready:
+            raise HTTPException(status_code=503, detail="Anomaly scorer is warming up", headers={"Retry-After": "5"})
+        batches = await read_ndjson(request)
+        return StreamingResponse(score_ndjson(batches), media_type="application/x-ndjson")
+    
+    try:
+        body = loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be JSON")
+    transactions = body.get("transactions") if isinstance(body, dict) else body
+    if not isinstance(transactions, list) or not all(isinstance(t, dict) for t in transactions):
+        raise HTTPException(status_code=400, detail="Expected a list of transaction objects")
+    if len(transactions) > SCORE_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {SCORE_MAX_BATCH} transactions per request")
+    
+    results = await run_in_threadpool(score_batch, transactions)
+    return Response(content=dumps({"results": results, "model": scorer.model_info}),
+                    media_type="application/json")
+
+async def read_ndjson(request):
+    """
+    Split an NDJSON body into batches of SCORE_STREAM_BATCH lines as it
+    arrives. The body is read before the response starts: Starlette
+    listens for client disconnects on the same receive channel while a
+    StreamingResponse is running.
+    """
+    batches, batch, pending = [], [], b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                batch.append(line)
+            if len(batch) >= SCORE_STREAM_BATCH:
+                batches.append(batch)
+                batch = []
+    if pending.strip():
+        batch.append(pending)
+    if batch:
+        batches.append(batch)
+    return batches
+
+async def score_ndjson(batches):
+    """Score and emit one micro-batch at a time"""
+    for batch in batches:
+        yield await score_lines(batch)
+
+async def score_lines(lines):
+    transactions = []
+    for line in lines:
+        try:
+            transaction = loads(line)
+        except ValueError:
+            transaction = None
+        transactions.append(transaction if isinstance(transaction, dict) else {})
+    results = await run_in_threadpool(scorer.score, transactions)
+    return b"".join(dumps(result) + b"\n" for result in results)
+
+@app.get("/ml/anomalies/stream")
+def anomaly_stream_status():
+    """Streaming scorer state: model in use, running statistics, amount quantiles"""
+    return scorer.status()
+
+async def pooled_response(request, model, endpoint, params, cache_params, encode, dataset_id=None,
+                          saturated=None, media_type="application/json"):
+    """
+    Serve a process-pool run from the result cache, or run it; concurrent
+    identical requests share one run. encode(result) returns (body,
+    cacheable); saturated() answers when the pool is full (default 503).
+    """
+    if dataset_id:
+        # May ingest the upload first
+        _, version, source = await run_in_threadpool(current_dataset, dataset_id)
+    else:
+        version, source = store.version, None
+    
+    entry = cache.get(ResultCache.key(endpoint, cache_params, version))
+    if entry is not None:
+        return entry_response(request, entry, media_type=media_type)
+    
+    def store_result(result):
+        return cache.get_or_compute(endpoint, cache_params, version, lambda: encode(result))
+    
+    try:
+        result = await runner.run(model, params, version, on_result=store_result, source=source)
+    except ModelPoolSaturated:
+        if saturated is not None:
+            return saturated()
+        raise HTTPException(status_code=503, detail="Model pool saturated", headers={"Retry-After": "5"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Model run timed out", headers={"Retry-After": "10"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Model run failed: {e}")
+    
+    return entry_response(request, store_result(result), media_type=media_type)
+
+async def full_model_response(request, model, endpoint, params, cache_params, shape, fallback, dataset_id=None):
+    """Serve a full model run through the pool, falling back to the fast model when it is full"""
+    description = f"Full {ML_ENDPOINTS['/ml/' + model][1]}"
+    
+    def simple_model():
+        return cached_response(request, f"/ml/{model}", extra_headers={"X-ML-Fallback": "simple"})
+    
+    return await pooled_response(request, model, endpoint, params, cache_params,
+                                 lambda result: encode_result(result, endpoint, description, shape),
+                                 dataset_id, simple_model if fallback else None)
+
+@app.get("/ml/demand/forecast")
+async def get_demand_forecast(request: Request, top_n: int = 20, horizon: int = 1, cursor: str = None,
+                              fallback: bool = True, shape: str = "records", dataset_id: str = None):
+    """
+    Per-product Demand Forecast using XGBoost
+    Predicts each product's demand for the next `horizon` months from
+    monthly lags, rolling means and seasonality, and returns the top_n
+    products by predicted demand (page further with cursor)
+    """
+    if not 1 <= horizon <= DEMAND_MAX_HORIZON:
+        raise HTTPException(status_code=400, detail=f"horizon must be between 1 and {DEMAND_MAX_HORIZON} months")
+    
+    shape, paging, options = response_options(shape, top_n, cursor)
+    params = sorted(paging.items()) + [('horizon', horizon)]
+    cache_params = sorted(options + [('horizon', horizon)])
+    return await full_model_response(request, "demand", "/ml/demand/forecast", params, cache_params, shape, fallback,
+                                     dataset_id)
+
+@app.get("/ml/{model}/full")
+async def get_full_model(model: str, request: Request, days: int = None, fallback: bool = True,
+                         limit: int = None, cursor: str = None, shape: str = "records", order: str = "fixed",
+                         dataset_id: str = None):
+    """
+    Full model run (ARIMA, Logistic Regression, K-means, XGBoost, Isolation Forest)
+    Runs in the background process pool; concurrent identical requests share
+    one run. Falls back to the fast model when the pool is saturated unless
+    fallback=false, and returns 503 when the run takes too long.
+    Top-k lists (churn, demand, anomalies) page with limit / cursor.
+    With dataset_id, runs on that uploaded dataset instead of the main one.
+    The forecast takes order=auto to search its ARIMA order.
+    """
+    if model not in FULL_MODELS:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {model}")
+    
+    shape, paging, options = response_options(shape, limit, cursor, model in PAGED_MODELS)
+    days_param = [('days', forecast_days(days))] if model == 'forecast' and days is not None else []
+    if model == 'forecast' and forecast_order(order) == 'auto':
+        days_param.append(('order', 'auto'))
+    params = sorted(paging.items()) + days_param
+    cache_params = sorted(options + days_param)
+    return await full_model_response(request, model, f"/ml/{model}/full", params, cache_params, shape, fallback,
+                                     dataset_id)
+
+class JobRequest(BaseModel):
+    model: str
+    params: dict = {}
+
+@app.post("/ml/jobs", status_code=202)
+def submit_job(job: JobRequest):
+    """
+    Queue a long-running full model run
+    Poll GET /ml/jobs/{id} (optionally with ?wait=N) for status, stage and result
+    400 for an unknown model, 422 for parameters the model doesn't take
+    """
+    try:
+        return jobs.submit(job.model, job.params, store.version)
+    except InvalidParams as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/ml/jobs")
+def list_jobs(status: str = None, limit: int = 50):
+    """Most recent jobs, optionally filtered by status"""
+    return {"jobs": jobs.list(status, min(limit, 500)), **jobs.status()}
+
+@app.get("/ml/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """
+    Job status, stage, progress and result
+    With wait=N, holds the request up to N seconds (max 60) until the job finishes
+    """
+    deadline = asyncio.get_running_loop().time() + min(wait, 60)
+    while True:
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+        if job['status'] in FINISHED or asyncio.get_running_loop().time() >= deadline:
+            return job
+        await asyncio.sleep(0.5)
+
+@app.delete("/ml/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+def split_param(value):
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+@app.get("/query")
+def run_query(request: Request, metric_names: str = Query("revenue", alias="metrics"), group_by: str = None, country: str = None,
+              product: str = None, customer: str = None, start: str = None, end: str = None,
+              order_by: str = None, order: str = "desc", limit: int = 100):
+    """
+    Ad-hoc aggregation over the sales rollups
+    metrics: revenue, quantity, invoices, customers (comma-separated)
+    group_by: country, product, customer and one of day / week / month
+    Filters: country, product, customer (comma-separated), start / end
+    (YYYY-MM-DD or YYYY-MM). Answered from the smallest rollup that has
+    the requested columns.
+    """
+    engine = query_engine
+    if engine is None:
+        raise HTTPException(status_code=503, detail="Query engine not loaded")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    
+    query = {
+        "metrics": split_param(metric_names),
+        "group_by": split_param(group_by),
+        "filters": {"country": split_param(country), "product": split_param(product),
+                    "customer": split_param(customer), "start": start, "end": end},
+        "order_by": order_by,
+        "descending": order == "desc",
+        "limit": limit
     }
+    try:
+        engine.build(**query)
+    except (QueryError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    def compute():
+        started = time.perf_counter()
+        result = engine.run(**query)
+        metrics.observe_phase("/query", "compute", time.perf_counter() - started)
+        return dumps(result), True
+    
+    entry = cache.get_or_compute("/query", request.query_params.multi_items(), engine.version, compute)
+    return entry_response(request, entry)
+
+def sketch_response(request, endpoint, dataset_id, query):
+    """Serve a sketch query(data) from the result cache; bad parameters are a 400"""
+    data, version, _ = current_dataset(dataset_id)
+    if data is None:
+        raise HTTPException(status_code=503, detail="No data loaded")
+    
+    def compute():
+        started = time.perf_counter()
+        try:
+            result = query(data)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        metrics.observe_phase(endpoint, "compute", time.perf_counter() - started)
+        return dumps(result), True
+    
+    entry = cache.get_or_compute(endpoint, request.query_params.multi_items(), version, compute)
+    return entry_response(request, entry)
+
+@app.get("/sketches/distinct")
+def get_distinct(request: Request, start: str = None, end: str = None, by_period: bool = False,
+                 dataset_id: str = None):
+    """
+    Approximate distinct customers and invoices (HyperLogLog)
+    Over the months from start to end, and per month with by_period=true
+    """
+    return sketch_response(request, "/sketches/distinct", dataset_id,
+                           lambda data: distinct_counts(data, start, end, by_period))
+
+@app.get("/sketches/top")
+def get_heavy_hitters(request: Request, dimension: str = "products", n: int = 10, start: str = None,
+                      end: str = None, dataset_id: str = None):
+    """
+    Heavy hitters (Count-Min + top-k)
+    Top products by units sold or countries by revenue over the months from start to end
+    """
+    return sketch_response(request, "/sketches/top", dataset_id,
+                           lambda data: heavy_hitters(data, dimension, n, start, end))
+
+@app.get("/sketches/quantiles")
+def get_amount_quantiles(request: Request, q: str = "0.5,0.9,0.95,0.99", start: str = None, end: str = None,
+                         dataset_id: str = None):
+    """
+    Invoice amount quantiles (t-digest), e.g. q=0.99 for an anomaly threshold
+    Over the months from start to end
+    """
+    try:
+        quantiles = [float(value) for value in split_param(q)]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="q must be comma-separated numbers")
+    return sketch_response(request, "/sketches/quantiles", dataset_id,
+                           lambda data: amount_quantiles(data, quantiles, start, end))
 
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "data_loaded": data is not None,
-        "transactions": data['metadata']['total_sales'] if data else 0
+        **store.status(),
+        "cache": cache.stats(),
+        "model_pool": runner.status(),
+        "datasets": datasets.status(),
+        "jobs": jobs.status(),
+        "anomaly_stream": {"ready": scorer.ready, "scored": scorer.scored},
+        "query_engine": query_engine.status() if query_engine else None
     }
 
+@app.get("/health/live")
+def liveness():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness_check():
+    """
+    Readiness: 200 once the dataset is loaded and the result cache warmed,
+    503 until then, with each component's state
+    """
+    ready, components = readiness()
+    body = {"status": "ready" if ready else "starting", "dataset_version": store.version, **components}
+    return Response(content=dumps(body), status_code=200 if ready else 503, media_type="application/json")
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics: request latency, cache, dataset, model pool, jobs"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/metrics/profiles")
+def get_profiles():
+    """
+    Slowest profiled requests, slowest first
+    Enable with ML_PROFILE_HEADER=1 (send X-Profile: 1) or ML_PROFILE_SAMPLE_RATE
+    """
+    return {**profiler.status(), "profiles": profiler.profiles()}
+
 # Run server
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,312 @@
+"""
+Rolling-origin backtesting for the sales forecasters.
+
+The daily revenue series is cut at several origins; each forecaster is
+fit on the history before an origin and scored on the next `horizon`
+days:
+
+    origin 1: [ train .............. ][ test ]
+    origin 2: [ train ..................... ][ test ]
+    ...
+
+Every (model, origin) fold runs in a worker process and records
+MAPE / sMAPE / RMSE, fit and predict wall time, and peak traced memory.
+tracemalloc slows fitting down several times, so memory is measured in
+a second, traced run and never skews the timings.
+The report is written as JSON so models can be compared on accuracy and
+on cost:
+
+    python analytics/backtesting.py --horizon 7 --folds 8
+
+forecast_fixed / forecast_auto are the fits /ml/forecast serves
+(order=fixed / auto), and the forecast endpoints report the latest
+saved scores for their model (latest_scores) as their accuracy.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from batch_forecasting import exp_smoothing, seasonal_naive
+from forecasting import ARIMA_ORDER, predict
+from order_selection import fit_order
+from rollups import rollup_series
+from snapshot import load_dataset
+
+ANALYTICS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPORTS_DIR = os.environ.get('BACKTEST_REPORT_DIR', os.path.join(ANALYTICS_DIR, 'backtests'))
+BACKTEST_WORKERS = int(os.environ.get('BACKTEST_WORKERS', os.cpu_count() or 1))
+
+TREND_WINDOW = 30
+MIN_TRAIN_DAYS = 60
+
+
+# -- forecasters -----------------------------------------------------------
+# Each forecaster is a (fit, predict) pair: fit(history) -> state and
+# predict(state, horizon) -> array. Register new ones in FORECASTERS.
+
+def _fit_served(order):
+    """The fit /ml/forecast serves for `order`, from scratch rather than the registry"""
+    # One process per fold already; the order search stays inline
+    return lambda history: fit_order(history, order, n_jobs=1)[0]
+
+
+def _predict_served(fitted, horizon):
+    return predict(fitted, horizon)[0]
+
+
+def _fit_trend(history):
+    """Same average + linear trend as ml_simple.simple_forecast, without the noise"""
+    window = history[-TREND_WINDOW:]
+    trend = (window[-1] - window[0]) / len(window) if len(window) > 1 else 0
+    return np.mean(window), trend
+
+
+def _predict_trend(state, horizon):
+    avg, trend = state
+    return np.maximum(0, avg + trend * np.arange(horizon))
+
+
+def _predict_cheap(fn):
+    return lambda history, horizon: fn(history[:, None], horizon)[0][:, 0]
+
+
+FORECASTERS = {
+    # forecasting.forecast_sales with order='fixed' / 'auto'
+    'forecast_fixed': (_fit_served(ARIMA_ORDER), _predict_served),
+    'forecast_auto': (_fit_served(None), _predict_served),
+    'simple_trend': (_fit_trend, _predict_trend),
+    'seasonal_naive': (np.asarray, _predict_cheap(seasonal_naive)),
+    'exp_smoothing': (np.asarray, _predict_cheap(exp_smoothing)),
+}
+
+
+# -- metrics ---------------------------------------------------------------
+
+def score(actual, predicted):
+    """MAPE (over non-zero days), sMAPE and RMSE for one fold"""
+    actual = np.asarray(actual, dtype=float)
+    predicted = np.asarray(predicted, dtype=float)
+    error = predicted - actual
+
+    nonzero = actual != 0
+    mape = np.mean(np.abs(error[nonzero] / actual[nonzero])) * 100 if nonzero.any() else None
+
+    denominator = np.abs(actual) + np.abs(predicted)
+    smape = np.mean(np.divide(2 * np.abs(error), denominator,
+                              out=np.zeros_like(error), where=denominator != 0)) * 100
+
+    return {
+        'mape': round(float(mape), 4) if mape is not None else None,
+        'smape': round(float(smape), 4),
+        'rmse': round(float(np.sqrt(np.mean(error ** 2))), 4)
+    }
+
+
+# -- folds -----------------------------------------------------------------
+
+_worker_series = None
+
+
+def daily_revenue(data):
+    """Daily revenue from the rollup cube as a dense float array, plus its first and last day"""
+    daily = rollup_series(data)
+    return daily.to_numpy(dtype=float), daily.index[0], daily.index[-1]
+
+
+def fold_origins(n_days, horizon, folds, step, min_train=MIN_TRAIN_DAYS):
+    """Training lengths for each fold, oldest first; the last test ends at n_days"""
+    last = n_days - horizon
+    origins = [last - i * step for i in range(folds)]
+    return sorted(origin for origin in origins if origin >= min_train)
+
+
+def _init_worker(series):
+    # The series is shipped once per worker, folds only carry offsets
+    global _worker_series
+    _worker_series = series
+
+
+def run_fold(model, origin, horizon, series=None, measure_memory=True):
+    """Fit on series[:origin], predict the next `horizon` days and score it"""
+    series = _worker_series if series is None else series
+    fit, predict = FORECASTERS[model]
+    history, actual = series[:origin], series[origin:origin + horizon]
+
+    started = time.perf_counter()
+    state = fit(history)
+    fitted = time.perf_counter()
+    predicted = predict(state, horizon)
+    predicted_at = time.perf_counter()
+
+    result = {
+        'model': model,
+        'origin': int(origin),
+        **score(actual, predicted),
+        'fit_seconds': round(fitted - started, 6),
+        'predict_seconds': round(predicted_at - fitted, 6),
+        'peak_memory_mb': None
+    }
+
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            predict(fit(history), horizon)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result['peak_memory_mb'] = round(peak / 1024 ** 2, 3)
+
+    return result
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return round(float(np.mean(values)), 4) if values else None
+
+
+def summarize(folds):
+    """Per-model averages over the successful folds"""
+    summary = {}
+    for model in dict.fromkeys(f['model'] for f in folds):
+        runs = [f for f in folds if f['model'] == model and 'error' not in f]
+        summary[model] = {
+            'folds': len(runs),
+            'failed_folds': sum(1 for f in folds if f['model'] == model and 'error' in f),
+            **{metric: _mean(f[metric] for f in runs) for metric in ('mape', 'smape', 'rmse')},
+            'fit_seconds': _mean(f['fit_seconds'] for f in runs),
+            'predict_seconds': _mean(f['predict_seconds'] for f in runs),
+            'peak_memory_mb': max((f['peak_memory_mb'] for f in runs if f['peak_memory_mb'] is not None), default=None)
+        }
+    return summary
+
+
+def backtest(data=None, models=None, horizon=7, folds=5, step=7, n_jobs=BACKTEST_WORKERS,
+             measure_memory=True):
+    """
+    Rolling-origin Backtesting
+    Returns per-fold and per-model accuracy and cost for each forecaster
+    """
+    if data is None:
+        data = load_dataset()
+    if data is None:
+        return {'error': 'No data loaded'}
+
+    models = list(models or FORECASTERS)
+    unknown = [m for m in models if m not in FORECASTERS]
+    if unknown:
+        return {'error': f"Unknown models: {', '.join(unknown)}"}
+
+    series, first_day, last_day = daily_revenue(data)
+    origins = fold_origins(len(series), horizon, folds, step)
+    if not origins:
+        return {'error': f"Need at least {MIN_TRAIN_DAYS + horizon} days of history, have {len(series)}"}
+
+    tasks = [(model, origin) for model in models for origin in origins]
+    results = []
+
+    def failed(model, origin, e):
+        return {'model': model, 'origin': int(origin), 'error': f"{type(e).__name__}: {e}"}
+
+    started = time.perf_counter()
+    if n_jobs <= 1:
+        for model, origin in tasks:
+            try:
+                results.append(run_fold(model, origin, horizon, series, measure_memory))
+            except Exception as e:
+                results.append(failed(model, origin, e))
+    else:
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks)), mp_context=ctx,
+                                 initializer=_init_worker, initargs=(series,)) as pool:
+            futures = [(model, origin, pool.submit(run_fold, model, origin, horizon, None, measure_memory)) for model, origin in tasks]
+            for model, origin, future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append(failed(model, origin, e))
+
+    summary = summarize(results)
+    ranked = sorted((m for m in summary if summary[m]['rmse'] is not None), key=lambda m: summary[m]['rmse'])
+
+    return {
+        'dataset_version': data['metadata'].get('version'),
+        'created_at': datetime.now().isoformat(),
+        'series': {
+            'name': 'daily_revenue',
+            'days': len(series),
+            'start': first_day.strftime('%Y-%m-%d'),
+            'end': last_day.strftime('%Y-%m-%d')
+        },
+        'config': {'horizon': horizon, 'folds': len(origins), 'step': step,
+                   'min_train_days': MIN_TRAIN_DAYS, 'workers': n_jobs,
+                   'measure_memory': measure_memory},
+        'wall_seconds': round(time.perf_counter() - started, 3),
+        'ranking_by_rmse': ranked,
+        'models': summary,
+        'folds': results
+    }
+
+
+def save_report(report, reports_dir=REPORTS_DIR):
+    """Write the report as JSON and return its path"""
+    os.makedirs(reports_dir, exist_ok=True)
+    name = f"backtest-{report['dataset_version']}-{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"
+    path = os.path.join(reports_dir, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def latest_scores(model, reports_dir=REPORTS_DIR):
+    """
+    A model's averages from the newest saved report that scored it, with
+    the report's dataset version and horizon, or None if there is none
+    """
+    if not os.path.isdir(reports_dir):
+        return None
+
+    reports = [os.path.join(reports_dir, name) for name in os.listdir(reports_dir)
+               if name.startswith('backtest-') and name.endswith('.json')]
+    for path in sorted(reports, key=os.path.getmtime, reverse=True):
+        with open(path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        summary = report['models'].get(model)
+        if summary and summary['folds']:
+            return {
+                'mape': summary['mape'],
+                'smape': summary['smape'],
+                'rmse': summary['rmse'],
+                'folds': summary['folds'],
+                'horizon': report['config']['horizon'],
+                'dataset_version': report['dataset_version'],
+                'created_at': report['created_at']
+            }
+    return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rolling-origin backtest of the sales forecasters')
+    parser.add_argument('--models', nargs='+', choices=sorted(FORECASTERS), help='Forecasters to evaluate (default: all)')
+    parser.add_argument('--horizon', type=int, default=7, help='Days forecast per fold')
+    parser.add_argument('--folds', type=int, default=5, help='Number of origins')
+    parser.add_argument('--step', type=int, default=7, help='Days between origins')
+    parser.add_argument('--workers', type=int, default=BACKTEST_WORKERS, help='Worker processes (1 = inline)')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the traced run for peak memory')
+    parser.add_argument('--output', default=REPORTS_DIR, help='Directory for the JSON report')
+    args = parser.parse_args()
+
+    report = backtest(models=args.models, horizon=args.horizon, folds=args.folds,
+                      step=args.step, n_jobs=args.workers, measure_memory=not args.no_memory)
+    if 'error' in report:
+        print(f"❌ {report['error']}")
+    else:
+        print(json.dumps(report['models'], indent=2))
+        print(f"✅ Report saved to {save_report(report, args.output)}")
@@ -0,0 +1,213 @@
+"""
+Batch multi-series forecasting (per country / per top-N product).
+
+All daily series come as one days x series matrix: per-country series
+from the rollup cube, per-product series from one groupby/unstack pass
+over product_daily. Long, dense series get an ARIMA fit each, spread
+across worker processes; short or sparse series get cheap models that
+are computed for all of them at once with array operations:
+
+- seasonal naive (weekly) when there are at least two weeks of history
+- simple exponential smoothing otherwise
+
+Every series carries a prediction interval from its own model (ARIMA
+conf_int, or the residual spread of the cheap models). Results are
+yielded one series at a time as they finish.
+
+With order='auto' each ARIMA series gets its own order (searched one
+fit at a time inside its worker, see order_selection), cached per
+series and dataset version.
+"""
+import json
+import math
+import multiprocessing
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from order_selection import fit_series
+from rollups import country_rollup
+from snapshot import load_dataset
+
+ARIMA_ORDER = (5, 1, 2)
+MIN_ARIMA_DAYS = 60     # shorter histories use the cheap models
+MIN_DENSITY = 0.5       # share of non-zero days needed for ARIMA
+SEASON = 7
+SES_ALPHA = 0.3
+Z_95 = 1.959964
+BATCH_WORKERS = int(os.environ.get('BATCH_FORECAST_WORKERS', os.cpu_count() or 1))
+
+
+def build_series(data, by='country', top_n=20):
+    """
+    Daily revenue per country or per product as one frame
+    (rows: every day in range, columns: the top_n series by revenue)
+    """
+    if by == 'country':
+        daily = country_rollup(data)
+    elif by == 'product':
+        product_daily = data.get('product_daily')
+        if product_daily is None or product_daily.empty:
+            raise ValueError("Per-product series need the product_daily table; rerun the importer")
+        top = product_daily.groupby('product_id', observed=True)['revenue'].sum().nlargest(top_n).index
+        product_daily = product_daily[product_daily['product_id'].isin(top)]
+        daily = product_daily.groupby(['date', 'product_id'], observed=True)['revenue'].sum().unstack(fill_value=0)
+    else:
+        raise ValueError(f"Unknown grouping: {by}")
+
+    daily.columns = daily.columns.astype(str)
+    daily = daily[daily.sum().nlargest(top_n).index]
+    # Every day of the dataset, so all series end on its last day
+    invoice_dates = data['sales']['InvoiceDate']
+    days = pd.date_range(invoice_dates.min().floor('D'), invoice_dates.max().floor('D'), freq='D')
+    return daily.reindex(days, fill_value=0)
+
+
+def seasonal_naive(values, days, season=SEASON):
+    """Repeat the last season for every column; returns (mean, half_width)"""
+    reps = math.ceil(days / season)
+    mean = np.tile(values[-season:], (reps, 1))[:days]
+    sigma = np.std(values[season:] - values[:-season], axis=0, ddof=1)
+    seasons_ahead = (np.arange(days) // season + 1)[:, None]
+    return mean, Z_95 * sigma * np.sqrt(seasons_ahead)
+
+
+def exp_smoothing(values, days, alpha=SES_ALPHA):
+    """Simple exponential smoothing for every column; returns (mean, half_width)"""
+    level = values[0].astype(float)
+    sq_errors = np.zeros(values.shape[1])
+    for row in values[1:]:
+        error = row - level
+        sq_errors += error ** 2
+        level = level + alpha * error
+    sigma = np.sqrt(sq_errors / max(len(values) - 1, 1))
+    mean = np.tile(level, (days, 1))
+    steps = np.arange(days)[:, None]
+    return mean, Z_95 * sigma * np.sqrt(1 + steps * alpha ** 2)
+
+
+def fit_arima(key, values, days, order=ARIMA_ORDER, cache_key=None, version=None):
+    """Worker: fit one ARIMA and return (key, mean, lower, upper, aic, model name)"""
+    from statsmodels.tsa.arima.model import ARIMA
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if order == 'auto':
+            fitted, info = fit_series(cache_key, values, version, n_jobs=1)
+            name = info['model']
+        else:
+            fitted = ARIMA(values, order=order).fit()
+            name = f"ARIMA{order}".replace(' ', '')
+        prediction = fitted.get_forecast(steps=days)
+        interval = np.asarray(prediction.conf_int(alpha=0.05))
+
+    return key, np.asarray(prediction.predicted_mean), interval[:, 0], interval[:, 1], float(fitted.aic), name
+
+
+def _series_result(key, by, model, mean, lower, upper, history_days, dates):
+    return {
+        'series': key,
+        'by': by,
+        'model': model,
+        'dates': dates,
+        'forecast': np.round(mean, 2).tolist(),
+        'lower': np.round(np.maximum(lower, 0), 2).tolist(),
+        'upper': np.round(upper, 2).tolist(),
+        'total_predicted_revenue': round(float(np.sum(mean)), 2),
+        'history_days': int(history_days)
+    }
+
+
+def iter_forecasts(data, by='country', top_n=20, days=28, n_jobs=BATCH_WORKERS, order=ARIMA_ORDER):
+    """
+    Yield one forecast dict per series as soon as it is ready: the cheap
+    models first (all at once), then ARIMA fits as workers finish them.
+    order is an ARIMA (p, d, q) for every series, or 'auto'.
+    """
+    series = build_series(data, by, top_n)
+    if series.empty:
+        return
+
+    keys = list(series.columns)
+    values = series.to_numpy(dtype=float)
+    dates = pd.date_range(series.index[-1], periods=days + 1, freq='D')[1:].strftime('%Y-%m-%d').tolist()
+
+    # History starts at each series' first non-zero day
+    nonzero = values != 0
+    first = np.where(nonzero.any(axis=0), nonzero.argmax(axis=0), len(values))
+    history = len(values) - first
+    density = nonzero.sum(axis=0) / np.maximum(history, 1)
+
+    use_arima = (history >= MIN_ARIMA_DAYS) & (density >= MIN_DENSITY)
+    use_naive = ~use_arima & (history >= 2 * SEASON)
+    use_ses = ~use_arima & ~use_naive
+
+    for mask, model, fn in ((use_naive, 'seasonal_naive', seasonal_naive), (use_ses, 'exp_smoothing', exp_smoothing)):
+        columns = np.flatnonzero(mask)
+        if len(columns) == 0:
+            continue
+        mean, half = fn(values[:, columns], days)
+        for i, j in enumerate(columns):
+            yield _series_result(keys[j], by, model, mean[:, i], mean[:, i] - half[:, i],
+                                 mean[:, i] + half[:, i], history[j], dates)
+
+    arima_columns = np.flatnonzero(use_arima)
+    if len(arima_columns) == 0:
+        return
+
+    version = data['metadata'].get('version')
+    jobs = [(keys[j], series.iloc[first[j]:, j], days, order, f"{by}-{keys[j]}", version) for j in arima_columns]
+    history_by_key = {keys[j]: history[j] for j in arima_columns}
+
+    def fallback(key, column):
+        mean, half = exp_smoothing(np.asarray(column, dtype=float)[:, None], days)
+        return _series_result(key, by, 'exp_smoothing', mean[:, 0], mean[:, 0] - half[:, 0],
+                              mean[:, 0] + half[:, 0], history_by_key[key], dates)
+
+    if n_jobs <= 1:
+        for key, column, *rest in jobs:
+            try:
+                _, mean, lower, upper, aic, model_name = fit_arima(key, column, *rest)
+                yield {**_series_result(key, by, model_name, mean, lower, upper, history_by_key[key], dates), 'aic': round(aic, 2)}
+            except Exception:
+                yield fallback(key, column)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(jobs)), mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {pool.submit(fit_arima, *job): job for job in jobs}
+        for future in as_completed(futures):
+            key, column = futures[future][:2]
+            try:
+                _, mean, lower, upper, aic, model_name = future.result()
+                yield {**_series_result(key, by, model_name, mean, lower, upper, history_by_key[key], dates), 'aic': round(aic, 2)}
+            except Exception:
+                # ARIMA can fail to converge on odd series; keep a cheap forecast
+                yield fallback(key, column)
+
+
+def batch_forecast(data=None, by='country', top_n=20, days=28, n_jobs=BATCH_WORKERS, order=ARIMA_ORDER):
+    """
+    Batch Forecasting
+    Returns a forecast with prediction interval for every series
+    """
+    if data is None:
+        data = load_dataset()
+
+    results = {r['series']: r for r in iter_forecasts(data, by, int(top_n), int(days), n_jobs, order)}
+    models_used = pd.Series([r['model'] for r in results.values()]).value_counts().to_dict()
+
+    return {
+        'by': by,
+        'days': int(days),
+        'series_count': len(results),
+        'models_used': {k: int(v) for k, v in models_used.items()},
+        'series': results
+    }
+
+
+if __name__ == '__main__':
+    result = batch_forecast()
+    print(json.dumps(result, indent=2))
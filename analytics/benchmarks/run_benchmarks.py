@@ -0,0 +1,323 @@
+"""
+Performance benchmarks for the analytics entry points.
+
+Every entry point runs in its own spawned process against a synthetic
+dataset (see synthetic_data.py), so peak RSS is per entry point and
+nothing is shared between runs except the files on disk. For each one
+the suite records:
+
+- first-call latency (includes model training when the registry is cold)
+- min / median / mean latency over the repeats that follow
+- throughput in sales rows per second
+- peak RSS, and how much of it the call itself added
+
+The HTTP scenario drives the FastAPI app through an in-process test
+client with several concurrent clients and reports requests per second
+and latency percentiles (FastAPI's TestClient needs httpx installed).
+
+Results can be stored as a baseline per scale and compared on later
+runs; anything slower or larger than baseline * (1 + tolerance) is
+reported as a regression:
+
+    python analytics/benchmarks/run_benchmarks.py --rows 100k --save-baseline
+    python analytics/benchmarks/run_benchmarks.py --rows 100k --fail-on-regression
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ANALYTICS_DIR = os.path.dirname(BENCH_DIR)
+sys.path.append(ANALYTICS_DIR)
+
+from synthetic_data import parse_rows, generate, write_dataset
+
+BASELINES_DIR = os.path.join(BENCH_DIR, 'baselines')
+DEFAULT_TOLERANCE = 0.25
+
+# name -> (module, function, how it is called)
+ENTRY_POINTS = {
+    'load_snapshot': ('snapshot', 'load_dataset', 'loader'),
+    'load_json': ('snapshot', 'read_json', 'json_loader'),
+    'simple_forecast': ('ml_simple', 'simple_forecast', 'data'),
+    'simple_churn': ('ml_simple', 'simple_churn', 'data'),
+    'simple_segments': ('ml_simple', 'simple_segments', 'data'),
+    'simple_demand': ('ml_simple', 'simple_demand', 'data'),
+    'simple_anomalies': ('ml_simple', 'simple_anomalies', 'data'),
+    'forecast_sales': ('forecasting', 'forecast_sales', 'days_data'),
+    'predict_churn': ('churn', 'predict_churn', 'data'),
+    'segment_customers': ('clustering', 'segment_customers', 'data'),
+    'predict_demand': ('demand_prediction', 'predict_demand', 'data'),
+    'detect_anomalies': ('anomaly_detection', 'detect_anomalies', 'data'),
+}
+
+HTTP_ENDPOINTS = ['/ml/forecast', '/ml/churn', '/ml/segments', '/ml/demand', '/ml/anomalies', '/health']
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unsupported)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _latency_stats(seconds):
+    ordered = sorted(seconds)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        'min_seconds': round(ordered[0], 6),
+        'median_seconds': round(statistics.median(ordered), 6),
+        'mean_seconds': round(statistics.fmean(ordered), 6),
+        'p95_seconds': round(percentile(95), 6),
+        'p99_seconds': round(percentile(99), 6)
+    }
+
+
+def _bench_entry(name, repeat, conn):
+    """Child process: time one entry point and report back over the pipe"""
+    try:
+        import importlib
+        from snapshot import JSON_PATH, load_dataset
+
+        module_name, function_name, style = ENTRY_POINTS[name]
+        fn = getattr(importlib.import_module(module_name), function_name)
+
+        data = load_dataset()
+        rows = len(data['sales'])
+
+        if style == 'loader':
+            call = lambda: fn()
+        elif style == 'json_loader':
+            if not os.path.exists(JSON_PATH):
+                raise FileNotFoundError('no processed_data.json (generate with --json)')
+            call = lambda: fn(JSON_PATH)
+        elif style == 'days_data':
+            call = lambda: fn(28, data)
+        else:
+            call = lambda: fn(data)
+
+        rss_before = peak_rss_mb()
+        started = time.perf_counter()
+        result = call()
+        first = time.perf_counter() - started
+
+        if isinstance(result, dict) and 'error' in result:
+            raise RuntimeError(result['error'])
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - started)
+
+        rss_after = peak_rss_mb()
+        stats = _latency_stats(timings or [first])
+        conn.send({
+            'rows': rows,
+            'first_call_seconds': round(first, 6),
+            **stats,
+            'repeat': repeat,
+            'rows_per_second': round(rows / stats['median_seconds']) if stats['median_seconds'] else None,
+            'peak_rss_mb': rss_after,
+            'call_rss_mb': round(rss_after - rss_before, 1) if rss_after is not None else None
+        })
+    except Exception as e:
+        conn.send({'error': f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def _bench_http(requests_total, concurrency, conn):
+    """Child process: drive the FastAPI app through an in-process test client"""
+    try:
+        from fastapi.testclient import TestClient
+        sys.path.append(os.path.join(ANALYTICS_DIR, 'api'))
+        import fastapi_app
+
+        with TestClient(fastapi_app.app) as client:
+            # Cold: first request per endpoint computes and caches the result
+            cold = {}
+            for endpoint in HTTP_ENDPOINTS:
+                started = time.perf_counter()
+                response = client.get(endpoint)
+                cold[endpoint] = {'status': response.status_code,
+                                  'seconds': round(time.perf_counter() - started, 6)}
+
+            def hit(i):
+                endpoint = HTTP_ENDPOINTS[i % len(HTTP_ENDPOINTS)]
+                started = time.perf_counter()
+                response = client.get(endpoint)
+                return endpoint, response.status_code, time.perf_counter() - started
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = list(pool.map(hit, range(requests_total)))
+            wall = time.perf_counter() - started
+
+        per_endpoint = {}
+        for endpoint in HTTP_ENDPOINTS:
+            seconds = [s for e, _, s in results if e == endpoint]
+            per_endpoint[endpoint] = _latency_stats(seconds) if seconds else {}
+
+        conn.send({
+            'requests': requests_total,
+            'concurrency': concurrency,
+            'errors': sum(1 for _, status, _ in results if status >= 400),
+            'requests_per_second': round(requests_total / wall, 1),
+            **_latency_stats([s for _, _, s in results]),
+            'cold': cold,
+            'endpoints': per_endpoint,
+            'peak_rss_mb': peak_rss_mb()
+        })
+    except Exception as e:
+        conn.send({'error': f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def _in_child(target, args, timeout):
+    """Run target(*args, conn) in a fresh spawned process and return what it sends"""
+    ctx = multiprocessing.get_context('spawn')
+    parent, child = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=target, args=(*args, child), daemon=True)
+    process.start()
+    child.close()
+
+    result = parent.recv() if parent.poll(timeout) else {'error': f"timed out after {timeout}s"}
+    if process.is_alive():
+        process.terminate()
+    process.join()
+    return result
+
+
+def prepare_data(rows, data_dir=None, write_json=False):
+    """Point the analytics modules at a synthetic dataset, generating it if missing"""
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), 'ecom-dash-bench', str(rows))
+    missing_json = write_json and not os.path.exists(os.path.join(data_dir, 'processed_data.json'))
+    if not os.path.exists(os.path.join(data_dir, 'snapshot', 'CURRENT')) or missing_json:
+        print(f"🧪 Generating {rows} synthetic sales rows in {data_dir}...")
+        write_dataset(generate(rows), data_dir, write_json)
+
+    # Children inherit the environment, so every module reads this dataset
+    # and the model registry / job database stay out of the repo
+    work_dir = tempfile.mkdtemp(prefix='ecom-dash-bench-')
+    os.environ['ANALYTICS_DATA_DIR'] = data_dir
+    os.environ['MODEL_REGISTRY_DIR'] = os.path.join(work_dir, 'models')
+    os.environ['JOBS_DB'] = os.path.join(work_dir, 'jobs.sqlite3')
+    os.environ['DATASET_POLL_SECONDS'] = '3600'
+    return data_dir
+
+
+def run_suite(rows, entries=None, repeat=5, http_requests=300, concurrency=8, timeout=1800, data_dir=None):
+    """Run the selected entry points and the HTTP scenario; returns the report dict"""
+    entries = entries or list(ENTRY_POINTS)
+    data_dir = prepare_data(rows, data_dir, write_json='load_json' in entries)
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'rows': rows,
+        'data_dir': data_dir,
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'cpu_count': os.cpu_count(),
+        'entry_points': {}
+    }
+
+    for name in entries:
+        result = _in_child(_bench_entry, (name, repeat), timeout)
+        report['entry_points'][name] = result
+        if 'error' in result:
+            print(f"   ⚠️ {name}: {result['error']}")
+        else:
+            print(f"   {name}: median {result['median_seconds'] * 1000:.1f} ms, "
+                  f"first {result['first_call_seconds'] * 1000:.1f} ms, peak RSS {result['peak_rss_mb']} MB")
+
+    if http_requests:
+        result = _in_child(_bench_http, (http_requests, concurrency), timeout)
+        report['http'] = result
+        if 'error' in result:
+            print(f"   ⚠️ http: {result['error']}")
+        else:
+            print(f"   http: {result['requests_per_second']} req/s, "
+                  f"p95 {result['p95_seconds'] * 1000:.1f} ms, {result['errors']} errors")
+
+    return report
+
+
+def baseline_path(rows):
+    return os.path.join(BASELINES_DIR, f"{rows}.json")
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """List of regressions: entries whose latency or memory grew past tolerance"""
+    checks = [(name, result) for name, result in report['entry_points'].items()]
+    if 'http' in report:
+        checks.append(('http', report['http']))
+    base = {**baseline.get('entry_points', {}), 'http': baseline.get('http', {})}
+
+    regressions = []
+    for name, result in checks:
+        before = base.get(name) or {}
+        for metric in ('median_seconds', 'p95_seconds', 'peak_rss_mb'):
+            old, new = before.get(metric), result.get(metric)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append({'entry': name, 'metric': metric, 'baseline': old,
+                                    'current': new, 'ratio': round(new / old, 2)})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the analytics entry points')
+    parser.add_argument('--rows', default='100k', help='Sales rows: 10k, 100k, 1m, 10m or a number')
+    parser.add_argument('--entries', nargs='+', choices=list(ENTRY_POINTS), help='Entry points to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed calls after the first one')
+    parser.add_argument('--http-requests', type=int, default=300, help='Requests in the HTTP scenario (0 to skip)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent HTTP clients')
+    parser.add_argument('--data-dir', help='Existing or cached synthetic dataset directory')
+    parser.add_argument('--output', help='Write the full report to this JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the baseline for its scale')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Allowed slowdown before flagging')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with status 1 on regressions')
+    args = parser.parse_args()
+
+    rows = parse_rows(args.rows)
+    print(f"⏱️ Benchmarking {rows} sales rows...")
+    report = run_suite(rows, args.entries, args.repeat, args.http_requests, args.concurrency,
+                       data_dir=args.data_dir)
+
+    regressions = []
+    if os.path.exists(baseline_path(rows)):
+        with open(baseline_path(rows), 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report['regressions'] = regressions
+        for r in regressions:
+            print(f"   ❌ {r['entry']} {r['metric']}: {r['baseline']} -> {r['current']} ({r['ratio']}x)")
+        if not regressions:
+            print("✅ No regressions against baseline")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report saved to {args.output}")
+
+    if args.save_baseline:
+        os.makedirs(BASELINES_DIR, exist_ok=True)
+        with open(baseline_path(rows), 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Baseline saved to {baseline_path(rows)}")
+
+    sys.exit(1 if regressions and args.fail_on_regression else 0)
@@ -0,0 +1,166 @@
+"""
+Synthetic dataset generator for the benchmarks.
+
+Produces the same tables and columns the importer writes
+(sales / customers / products / product_daily / rollup / metadata), at any
+scale, fully vectorized so 10M sales rows take seconds rather than
+minutes. Output is written as a columnar snapshot and, optionally, as
+processed_data.json.
+
+    python analytics/benchmarks/synthetic_data.py --rows 1m --output /tmp/bench-data
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rollups import build_cube
+from snapshot import write_snapshot
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+
+COUNTRIES = ['United Kingdom', 'Germany', 'France', 'EIRE', 'Spain', 'Netherlands',
+             'Belgium', 'Switzerland', 'Portugal', 'Australia']
+COUNTRY_WEIGHTS = [0.82, 0.04, 0.04, 0.03, 0.02, 0.015, 0.01, 0.01, 0.01, 0.005]
+START = pd.Timestamp('2010-12-01')
+DAYS = 373
+CUSTOMER_SHARE = 0.02      # ~1 customer per 50 invoices, like the Kaggle data
+PRODUCT_COUNT = 4000
+MISSING_CUSTOMER_SHARE = 0.05
+
+
+def parse_rows(value):
+    """'10k' / '1m' / '250000' -> int"""
+    value = str(value).lower()
+    return SCALES[value] if value in SCALES else int(float(value))
+
+
+def generate(rows, seed=0):
+    """Importer-shaped output dict with `rows` invoice-level sales"""
+    rng = np.random.default_rng(seed)
+    n_customers = max(int(rows * CUSTOMER_SHARE), 10)
+
+    # Sales: one row per invoice, busier towards the end of the year
+    offsets = (rng.beta(1.3, 1.0, rows) * DAYS * 86400).astype('int64')
+    offsets.sort()
+    invoice_date = START.to_datetime64() + offsets.astype('timedelta64[s]')
+    invoice_date = invoice_date.astype('datetime64[ns]')
+
+    # Each customer is active for a window of the year, so early ones churn
+    position = offsets / (DAYS * 86400)
+    customer_codes = ((0.7 * position + 0.3 * rng.random(rows)) * n_customers).astype('int64')
+    customer_codes = np.minimum(customer_codes, n_customers - 1)
+    customer_country = rng.choice(len(COUNTRIES), n_customers, p=COUNTRY_WEIGHTS)
+    customer_id = (12000 + customer_codes).astype(float)
+    customer_id[rng.random(rows) < MISSING_CUSTOMER_SHARE] = np.nan
+
+    quantity = rng.geometric(0.02, rows).astype('int64')
+    unit_price = np.round(rng.gamma(2.0, 1.6, rows), 2)
+    total_amount = quantity * unit_price
+
+    sales = pd.DataFrame({
+        'InvoiceNo': pd.Categorical((536365 + np.arange(rows)).astype(str)),
+        'InvoiceDate': invoice_date,
+        'CustomerID': customer_id,
+        'Country': pd.Categorical.from_codes(customer_country[customer_codes], COUNTRIES),
+        'Quantity': quantity,
+        'UnitPrice': unit_price,
+        'total_amount': total_amount,
+        'profit': total_amount * 0.3
+    })
+
+    known = sales[sales['CustomerID'].notna()]
+    customers = known.groupby('CustomerID', sort=True).agg(
+        country=('Country', 'first'),
+        first_purchase=('InvoiceDate', 'min'),
+        last_purchase=('InvoiceDate', 'max'),
+        order_count=('InvoiceDate', 'count'),
+        total_items=('Quantity', 'sum')
+    ).reset_index().rename(columns={'CustomerID': 'customer_id'})
+
+    # Products: long-tailed popularity
+    product_ids = np.array([str(20000 + i) for i in range(PRODUCT_COUNT)])
+    popularity = 1.0 / np.arange(1, PRODUCT_COUNT + 1)
+    popularity /= popularity.sum()
+    line_products = rng.choice(PRODUCT_COUNT, rows, p=popularity)
+    line_days = offsets // 86400
+
+    daily = pd.DataFrame({
+        'product': line_products,
+        'day': line_days,
+        'quantity': quantity,
+        'revenue': total_amount
+    }).groupby(['product', 'day'], sort=True).sum().reset_index()
+
+    product_daily = pd.DataFrame({
+        'product_id': pd.Categorical.from_codes(daily['product'].to_numpy(), product_ids),
+        'date': START + pd.to_timedelta(daily['day'].to_numpy(), unit='D'),
+        'quantity': daily['quantity'].to_numpy(),
+        'revenue': daily['revenue'].to_numpy()
+    })
+
+    sold = np.bincount(line_products, weights=quantity, minlength=PRODUCT_COUNT).astype('int64')
+    products = pd.DataFrame({
+        'product_id': product_ids,
+        'name': np.char.add('Synthetic item ', product_ids),
+        'price': np.round(rng.gamma(2.0, 1.6, PRODUCT_COUNT), 2),
+        'total_sold': sold
+    })
+
+    return {
+        'sales': sales,
+        'customers': customers,
+        'products': products.head(100),
+        'product_daily': product_daily,
+        'rollup': build_cube(sales),
+        'metadata': {
+            'total_sales': rows,
+            'total_customers': len(customers),
+            'total_products': PRODUCT_COUNT,
+            'date_range': {
+                'start': sales['InvoiceDate'].min().isoformat(),
+                'end': sales['InvoiceDate'].max().isoformat()
+            },
+            'synthetic': {'rows': rows, 'seed': seed}
+        }
+    }
+
+
+def write_dataset(output, data_dir, write_json=False):
+    """
+    Write a generated dataset the way the importer does:
+    <data_dir>/snapshot/ and optionally <data_dir>/processed_data.json.
+    Returns the snapshot version.
+    """
+    snapshot_dir = os.path.join(data_dir, 'snapshot')
+    os.makedirs(snapshot_dir, exist_ok=True)
+    version = write_snapshot(output, snapshot_dir)
+
+    if write_json:
+        records = {
+            table: output[table].to_dict('records')
+            for table in ('sales', 'customers', 'products', 'product_daily')
+        }
+        with open(os.path.join(data_dir, 'processed_data.json'), 'w') as f:
+            json.dump({**records, 'metadata': output['metadata']}, f, default=str)
+
+    return version
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic analytics dataset')
+    parser.add_argument('--rows', default='100k', help=f"Sales rows, e.g. 250000 or one of {', '.join(SCALES)}")
+    parser.add_argument('--output', required=True, help='Data directory (snapshot/ is created inside)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='Also write processed_data.json')
+    args = parser.parse_args()
+
+    rows = parse_rows(args.rows)
+    print(f"🧪 Generating {rows} sales rows...")
+    version = write_dataset(generate(rows, args.seed), args.output, args.json)
+    print(f"✅ Snapshot {version} written to {args.output}")
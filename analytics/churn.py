@@ -1,64 +1,93 @@
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, precision_score, recall_score
-import json
+from feature_store import CHURN_DAYS, FEATURE_SET, customer_features
+from model_registry import get_model
+from serialization import dumps, paginate
+from snapshot import load_dataset
 
-def predict_churn():
-    """
-    Logistic Regression Churn Prediction
-    Returns at-risk customers
-    """
-    with open('../database/datasets/processed_data.json', 'r') as f:
-        data = json.load(f)
-    
-    customers_df = pd.DataFrame(data['customers'])
-    
-    # Feature engineering: RFM
-    customers_df['recency'] = customers_df['days_since_last_order']
-    customers_df['frequency'] = customers_df['order_count']
-    customers_df['monetary'] = customers_df['total_items'] * 15  # avg item price
+MODEL_NAME = 'churn'
+FEATURES = ['recency', 'frequency', 'monetary']
+PARAMS = {'max_iter': 1000, 'test_size': 0.2, 'random_state': 42, 'churn_days': CHURN_DAYS,
+          'feature_set': FEATURE_SET}
+
+def churn_labels(features, params=PARAMS):
+    """1 for customers inactive longer than churn_days"""
+    if params['churn_days'] == CHURN_DAYS:
+        return features['churned']
+    return (features['recency'] > params['churn_days']).astype(np.int8)
+
+def train_churn(data, params=PARAMS):
+    """Fit the churn model; returns (model, metrics)"""
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import accuracy_score, precision_score, recall_score
     
-    # Define churn: > 60 days inactive
-    customers_df['churned'] = (customers_df['recency'] > 60).astype(int)
+    features = customer_features(data)
     
-    # Prepare features
-    X = customers_df[['recency', 'frequency', 'monetary']].fillna(0)
-    y = customers_df['churned']
+    # RFM features and churn label (> churn_days inactive) from the feature store
+    X = features.frame(FEATURES)
+    y = churn_labels(features, params)
     
     # Train/test split
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=params['test_size'], random_state=params['random_state']
+    )
     
     # Train Logistic Regression
-    model = LogisticRegression(max_iter=1000)
+    model = LogisticRegression(max_iter=params['max_iter'])
     model.fit(X_train, y_train)
     
-    # Predictions
+    # Metrics
     y_pred = model.predict(X_test)
-    y_proba = model.predict_proba(X)[:, 1]
+    metrics = {
+        'accuracy': float(accuracy_score(y_test, y_pred)),
+        'precision': float(precision_score(y_test, y_pred)),
+        'recall': float(recall_score(y_test, y_pred))
+    }
     
-    # Metrics
-    accuracy = accuracy_score(y_test, y_pred)
-    precision = precision_score(y_test, y_pred)
-    recall = recall_score(y_test, y_pred)
+    return model, metrics
+
+def score_churn(data, model, metadata, params=PARAMS, limit=50, cursor=None):
+    """Score every customer with a fitted churn model"""
+    features = customer_features(data)
+    probability = model.predict_proba(features.frame(FEATURES))[:, 1]
     
-    # Identify at-risk customers
-    customers_df['churn_probability'] = y_proba
-    at_risk = customers_df[customers_df['churn_probability'] > 0.5].sort_values('churn_probability', ascending=False)
+    # Identify at-risk customers; only their rows become a DataFrame
+    risky = probability > 0.5
+    at_risk = pd.DataFrame({
+        'customer_id': features['customer_id'][risky],
+        'recency': features['recency'][risky],
+        'frequency': features['frequency'][risky],
+        'churn_probability': probability[risky]
+    })
+    page, next_cursor = paginate(at_risk, list(at_risk.columns), limit, cursor, by='churn_probability')
     
+    metrics = metadata['metrics']
     return {
-        'total_customers': len(customers_df),
+        'total_customers': len(features),
         'at_risk_count': len(at_risk),
-        'churn_rate': round((len(at_risk) / len(customers_df)) * 100, 2),
-        'model_accuracy': round(accuracy * 100, 2),
-        'precision': round(precision * 100, 2),
-        'recall': round(recall * 100, 2),
-        'at_risk_customers': at_risk.head(50)[['customer_id', 'recency', 'frequency', 'churn_probability']].to_dict('records'),
+        'churn_rate': round((len(at_risk) / len(features)) * 100, 2),
+        'model_accuracy': round(metrics['accuracy'] * 100, 2),
+        'precision': round(metrics['precision'] * 100, 2),
+        'recall': round(metrics['recall'] * 100, 2),
+        'at_risk_customers': page,
+        'next_cursor': next_cursor,
         'features_used': ['Recency', 'Frequency', 'Monetary'],
-        'threshold': 60
+        'threshold': params['churn_days']
     }
 
+def predict_churn(data=None, limit=50, cursor=None):
+    """
+    Logistic Regression Churn Prediction
+    Returns at-risk customers
+    """
+    if data is None:
+        data = load_dataset()
+    
+    # Reuse the registered model for this dataset version, training only if missing
+    model, metadata = get_model(MODEL_NAME, data, PARAMS, FEATURES, train_churn)
+    return score_churn(data, model, metadata, limit=limit, cursor=cursor)
+
 if __name__ == '__main__':
     result = predict_churn()
-    print(json.dumps(result, indent=2))
+    print(dumps(result, indent=True).decode())
@@ -1,76 +1,238 @@
+import os
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import silhouette_score
 import json
 
-def segment_customers():
+from feature_store import FEATURE_SET, customer_features, dataset_end, build_features as store_features
+from model_registry import get_model, latest_model
+from snapshot import load_dataset
+
+MODEL_NAME = 'segments'
+FEATURES = ['recency', 'frequency', 'monetary']
+SEGMENT_NAMES = ['Champions', 'Loyal', 'At-Risk', 'Lost']
+PARAMS = {'n_clusters': 4, 'random_state': 42, 'n_init': 10, 'feature_set': FEATURE_SET}
+
+# Large customer bases: mini-batch K-means, warm-started from the last
+# registered centroids, with silhouette computed on a stratified sample
+MINIBATCH_PARAMS = {
+    'algorithm': 'minibatch',
+    'n_clusters': 4,
+    'random_state': 42,
+    'n_init': 3,
+    'batch_size': 4096,
+    'max_no_improvement': 10,
+    'silhouette_sample': 10000,
+    'feature_set': FEATURE_SET
+}
+MINIBATCH_MIN_CUSTOMERS = int(os.environ.get('SEGMENT_MINIBATCH_MIN', 50000))
+
+def build_features(data):
+    """RFM features per customer, from the feature store"""
+    return customer_features(data).frame(['customer_id'] + FEATURES, fill=None)
+
+def stratified_sample(labels, size, random_state=42):
+    """Row indices of a sample of `size` with each cluster in proportion (at least 2 per cluster)"""
+    if len(labels) <= size:
+        return np.arange(len(labels))
+    
+    rng = np.random.default_rng(random_state)
+    picked = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        take = min(len(members), max(2, int(round(size * len(members) / len(labels)))))
+        picked.append(rng.choice(members, take, replace=False))
+    return np.sort(np.concatenate(picked))
+
+def warm_start_centers(scaler, params):
     """
-    K-means Customer Segmentation
-    4 clusters: Champions, Loyal, At-Risk, Lost
+    Centroids of the last registered model with this config, mapped into
+    the new scaler's space, or None
     """
-    with open('../database/datasets/processed_data.json', 'r') as f:
-        data = json.load(f)
+    previous = latest_model(MODEL_NAME, params, FEATURES)
+    if previous is None:
+        return None
     
-    customers_df = pd.DataFrame(data['customers'])
+    model = previous[0]
+    centers = model[-1].cluster_centers_
+    if centers.shape != (params['n_clusters'], len(FEATURES)):
+        return None
+    return scaler.transform(pd.DataFrame(model[0].inverse_transform(centers), columns=FEATURES))
+
+def name_segments(stats):
+    """
+    Map cluster -> segment name from per-cluster mean recency/frequency,
+    always giving distinct names in a deterministic order:
     
-    # RFM features
-    customers_df['recency'] = customers_df['days_since_last_order']
-    customers_df['frequency'] = customers_df['order_count']
-    customers_df['monetary'] = customers_df['total_items'] * 15
+    - Lost and At-Risk are the two least recent clusters (least recent is Lost)
+    - of the rest, the cluster ranking best on recency + frequency is
+      Champions and the next is Loyal
     
-    # Prepare and scale features
-    X = customers_df[['recency', 'frequency', 'monetary']].fillna(0)
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    Ties break on cluster number. Clusters beyond four are named 'Segment <n>'.
+    """
+    recency = stats['recency'].fillna(np.inf)
+    by_recency = sorted(stats.index, key=lambda seg: (-recency[seg], seg))
     
-    # K-means with 4 clusters
-    kmeans = KMeans(n_clusters=4, random_state=42, n_init=10)
-    customers_df['segment'] = kmeans.fit_predict(X_scaled)
+    names = {}
+    if len(by_recency) >= len(SEGMENT_NAMES):
+        names[by_recency[0]] = 'Lost'
+        names[by_recency[1]] = 'At-Risk'
     
-    # Calculate silhouette score
-    silhouette = silhouette_score(X_scaled, customers_df['segment'])
+        rest = stats.loc[by_recency[2:]]
+        rank = rest['recency'].rank(method='first') + rest['frequency'].rank(ascending=False, method='first')
+        ranked = sorted(rest.index, key=lambda seg: (rank[seg], recency[seg], seg))
+        names[ranked[0]] = 'Champions'
+        names[ranked[1]] = 'Loyal'
     
-    # Assign segment names based on characteristics
-    segment_stats = customers_df.groupby('segment').agg({
+    for seg in sorted(stats.index):
+        names.setdefault(seg, f"Segment {seg}")
+    return {int(seg): name for seg, name in names.items()}
+
+def segment_stats(customers_df):
+    return customers_df.groupby('segment').agg({
         'recency': 'mean',
         'frequency': 'mean',
         'monetary': 'mean'
-    })
-    
-    # Label segments (0=Champions, 1=Loyal, 2=At-Risk, 3=Lost)
-    segment_names = {
-        segment_stats['recency'].idxmin(): 'Champions',
-        segment_stats['frequency'].idxmax(): 'Loyal',
-        segment_stats['recency'].nlargest(2).index[0]: 'At-Risk',
-        segment_stats['recency'].idxmax(): 'Lost'
+    }).astype(float)
+
+def train_segments(data, params=PARAMS):
+    """Fit scaler + K-means (or mini-batch K-means); returns (model, metrics)"""
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.metrics import silhouette_score
+    
+    customers_df = build_features(data)
+    X = customers_df[FEATURES].fillna(0)
+    scaler = StandardScaler().fit(X)
+    
+    warm_started = False
+    if params.get('algorithm') == 'minibatch':
+        centers = warm_start_centers(scaler, params)
+        warm_started = centers is not None
+        kmeans = MiniBatchKMeans(
+            n_clusters=params['n_clusters'],
+            init=centers if warm_started else 'k-means++',
+            n_init=1 if warm_started else params['n_init'],
+            batch_size=params['batch_size'],
+            max_no_improvement=params['max_no_improvement'],
+            random_state=params['random_state']
+        )
+    else:
+        # K-means with 4 clusters on scaled features
+        kmeans = KMeans(n_clusters=params['n_clusters'], random_state=params['random_state'], n_init=params['n_init'])
+    
+    model = make_pipeline(scaler, kmeans)
+    scaled = scaler.transform(X)
+    labels = kmeans.fit_predict(scaled)
+    
+    # Silhouette is O(n^2): on a stratified sample for the mini-batch mode
+    sample = stratified_sample(labels, params.get('silhouette_sample', len(labels)), params['random_state'])
+    silhouette = silhouette_score(scaled[sample], labels[sample]) if len(np.unique(labels[sample])) > 1 else 0.0
+    
+    customers_df['segment'] = labels
+    names = name_segments(segment_stats(customers_df))
+    
+    return model, {
+        'silhouette_score': float(silhouette),
+        'silhouette_sample': int(len(sample)),
+        'inertia': float(kmeans.inertia_),
+        'warm_started': warm_started,
+        'segment_names': {str(seg): name for seg, name in names.items()}
     }
+
+def segment_params(data, mode='auto'):
+    """PARAMS or MINIBATCH_PARAMS; 'auto' picks mini-batch for large customer bases"""
+    if mode == 'auto':
+        mode = 'minibatch' if len(data['customers']) >= MINIBATCH_MIN_CUSTOMERS else 'full'
+    if mode not in ('full', 'minibatch'):
+        raise ValueError(f"Unknown segmentation mode: {mode}")
+    return MINIBATCH_PARAMS if mode == 'minibatch' else PARAMS
+
+def registered_names(metadata, customers_df):
+    """Segment names fixed at training time (older models: derived now)"""
+    names = metadata['metrics'].get('segment_names')
+    if names:
+        return {int(seg): name for seg, name in names.items()}
+    return name_segments(segment_stats(customers_df))
+
+def score_segments(data, model, metadata):
+    """Assign customers to segments with a fitted model"""
+    customers_df = build_features(data)
+    X = customers_df[FEATURES].fillna(0)
+    customers_df['segment'] = model.predict(X)
     
+    stats = segment_stats(customers_df)
+    segment_names = registered_names(metadata, customers_df)
     customers_df['segment_name'] = customers_df['segment'].map(segment_names)
     
     # Segment distribution
     distribution = customers_df['segment_name'].value_counts().to_dict()
     percentages = (customers_df['segment_name'].value_counts(normalize=True) * 100).round(1).to_dict()
     
+    params = metadata['params']
     return {
         'total_customers': len(customers_df),
         'segments': {
             name: {
                 'count': int(distribution.get(name, 0)),
                 'percentage': float(percentages.get(name, 0)),
-                'avg_recency': round(segment_stats.loc[seg, 'recency'], 1),
-                'avg_frequency': round(segment_stats.loc[seg, 'frequency'], 1),
-                'avg_monetary': round(segment_stats.loc[seg, 'monetary'], 2)
+                'avg_recency': round(stats.loc[seg, 'recency'], 1),
+                'avg_frequency': round(stats.loc[seg, 'frequency'], 1),
+                'avg_monetary': round(stats.loc[seg, 'monetary'], 2)
             }
-            for seg, name in segment_names.items()
+            for seg, name in segment_names.items() if seg in stats.index
         },
-        'silhouette_score': round(silhouette, 2),
-        'algorithm': 'K-means',
-        'n_clusters': 4,
+        'silhouette_score': round(metadata['metrics']['silhouette_score'], 2),
+        'algorithm': 'Mini-batch K-means' if params.get('algorithm') == 'minibatch' else 'K-means',
+        'n_clusters': params['n_clusters'],
         'distance_metric': 'Euclidean'
     }
 
+def assign_segments(customers, data=None, mode='auto'):
+    """
+    Segment new or changed customers with the registered model, without
+    reclustering everyone. `customers` has the customers-table columns
+    (customer_id, last_purchase, order_count) and optionally monetary
+    (default: the customer's revenue in the dataset, else 0). Recency is
+    counted to the dataset's last sale, as the model was trained on.
+    """
+    if data is None:
+        data = load_dataset()
+    
+    customers = pd.DataFrame(customers)
+    if 'last_purchase' not in customers.columns:
+        raise ValueError("customers need a last_purchase date")
+    customers['last_purchase'] = pd.to_datetime(customers['last_purchase'])
+    
+    params = segment_params(data, mode)
+    model, metadata = get_model(MODEL_NAME, data, params, FEATURES, train_segments)
+    
+    if 'monetary' not in customers.columns:
+        known = customer_features(data)
+        revenue = pd.Series(known['monetary'], index=known['customer_id'])
+        customers['monetary'] = revenue.reindex(customers['customer_id'].astype(float)).fillna(0).to_numpy()
+    features = store_features({'customers': customers}, end=dataset_end(data))
+    customers_df = features.frame(['customer_id'] + FEATURES, fill=None)
+    customers_df['segment'] = model.predict(customers_df[FEATURES].fillna(0))
+    names = registered_names(metadata, customers_df)
+    customers_df['segment_name'] = customers_df['segment'].map(names)
+    return customers_df[['customer_id', 'segment', 'segment_name']]
+
+def segment_customers(data=None, mode='auto'):
+    """
+    K-means Customer Segmentation
+    4 clusters: Champions, Loyal, At-Risk, Lost
+    mode: 'full' (K-means), 'minibatch', or 'auto' (mini-batch from
+    SEGMENT_MINIBATCH_MIN customers)
+    """
+    if data is None:
+        data = load_dataset()
+    
+    # Reuse the registered model for this dataset version, training only if missing
+    params = segment_params(data, mode)
+    model, metadata = get_model(MODEL_NAME, data, params, FEATURES, train_segments)
+    return score_segments(data, model, metadata)
+
 if __name__ == '__main__':
     result = segment_customers()
     print(json.dumps(result, indent=2))
@@ -0,0 +1,150 @@
+"""
+Per-dataset analytics for user uploads.
+
+The Node backend stores uploads as <user id>/<file> under UPLOADS_DIR;
+that relative path is the dataset id the ML API accepts as ?dataset_id=.
+
+On first use an upload is normalized (ingest.normalize_upload) and
+written as a snapshot under UPLOAD_DATASETS_DIR/<key>/snapshot, and it
+is re-ingested only when the file changes. Loaded datasets stay in an
+LRU bounded by their size in bytes (ML_DATASET_CACHE_MB); an evicted
+dataset is loaded again from its memory-mapped snapshot on next use, so
+one process can serve many tenants without holding them all.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from ingest import UPLOAD_TYPES, build_dataset, normalize_upload, read_upload, state_tables
+from snapshot import DATASETS_DIR, PROJECT_ROOT, load_dataset, write_snapshot
+
+UPLOADS_DIR = os.environ.get('ML_UPLOADS_DIR', os.path.join(PROJECT_ROOT, 'backend', 'src', 'uploads'))
+UPLOAD_DATASETS_DIR = os.environ.get('ML_UPLOAD_DATASETS_DIR', os.path.join(DATASETS_DIR, 'uploads'))
+DATASET_CACHE_BYTES = int(float(os.environ.get('ML_DATASET_CACHE_MB', 512)) * 1024 * 1024)
+
+
+def dataset_nbytes(data):
+    """Bytes held by a dataset's tables (memory-mapped columns included)"""
+    return int(sum(
+        table.memory_usage(index=True).sum()
+        for name, table in data.items() if name != 'metadata' and hasattr(table, 'memory_usage')
+    ))
+
+
+class DatasetCache:
+    """Uploaded datasets by id, ingested on first use, in a byte-bounded LRU"""
+
+    def __init__(self, max_bytes=DATASET_CACHE_BYTES, uploads_dir=UPLOADS_DIR,
+                 datasets_dir=UPLOAD_DATASETS_DIR):
+        self.max_bytes = max_bytes
+        self.uploads_dir = os.path.realpath(uploads_dir)
+        self.datasets_dir = datasets_dir
+
+        self._entries = OrderedDict()  # key -> (data, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> Lock, one ingest/load per dataset at a time
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._ingests = 0
+
+    def upload_path(self, dataset_id):
+        """Absolute path of an upload; FileNotFoundError for unknown ids or paths outside UPLOADS_DIR"""
+        path = os.path.realpath(os.path.join(self.uploads_dir, dataset_id))
+        if (os.path.isabs(dataset_id) or not path.startswith(self.uploads_dir + os.sep)
+                or os.path.splitext(path)[1].lower() not in UPLOAD_TYPES or not os.path.isfile(path)):
+            raise FileNotFoundError(f"Unknown dataset: {dataset_id}")
+        return path
+
+    def paths(self, dataset_id):
+        """(snapshot_dir, json_path) of a dataset, as load_dataset() takes them"""
+        key = hashlib.sha1(dataset_id.encode('utf-8')).hexdigest()[:16]
+        base = os.path.join(self.datasets_dir, key)
+        # There is never a JSON fallback for uploads; the path just doesn't exist
+        return os.path.join(base, 'snapshot'), os.path.join(base, 'processed_data.json')
+
+    def get(self, dataset_id):
+        """
+        The dataset dict for an upload, ingesting it first if it is new or
+        the file has changed. Raises FileNotFoundError for unknown ids and
+        ValueError for files that can't be turned into transactions.
+        """
+        path = self.upload_path(dataset_id)
+        mtime = os.stat(path).st_mtime_ns
+        snapshot_dir, json_path = self.paths(dataset_id)
+
+        data = self._cached(snapshot_dir, mtime)
+        if data is not None:
+            return data
+
+        with self._lock:
+            loading = self._loading.setdefault(snapshot_dir, threading.Lock())
+        with loading:
+            # Another request may have loaded it meanwhile
+            data = self._cached(snapshot_dir, mtime, count=False)
+            if data is not None:
+                return data
+
+            with self._lock:
+                self._misses += 1
+            data = load_dataset(snapshot_dir, json_path)
+            if data is None or data['metadata'].get('source', {}).get('mtime') != mtime:
+                self._ingest(dataset_id, path, mtime, snapshot_dir)
+                data = load_dataset(snapshot_dir, json_path)
+            self._insert(snapshot_dir, data)
+        return data
+
+    def _cached(self, key, mtime, count=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0]['metadata'].get('source', {}).get('mtime') != mtime:
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                self._hits += 1
+            return entry[0]
+
+    def _ingest(self, dataset_id, path, mtime, snapshot_dir):
+        started = time.perf_counter()
+        output, state = build_dataset(normalize_upload(read_upload(path)))
+        output['metadata']['source'] = {
+            'type': 'upload',
+            'dataset_id': dataset_id,
+            'file': os.path.basename(path),
+            'mtime': mtime
+        }
+        write_snapshot(output, snapshot_dir, state=state_tables(state))
+        with self._lock:
+            self._ingests += 1
+        print(f"✅ Dataset {dataset_id} ingested in {time.perf_counter() - started:.2f}s: "
+              f"{output['metadata']['total_sales']} sales records")
+
+    def _insert(self, key, data):
+        nbytes = dataset_nbytes(data)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (data, nbytes)
+            self._bytes += nbytes
+
+            # Least recently used first; the dataset just loaded always stays
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self._evictions += 1
+
+    def status(self):
+        with self._lock:
+            return {
+                'resident': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'ingests': self._ingests
+            }
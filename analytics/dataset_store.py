@@ -0,0 +1,114 @@
+"""
+Hot-reloadable in-memory dataset for the ML API.
+
+The store holds the currently loaded dataset and polls the snapshot
+(CURRENT pointer, or processed_data.json mtime) in a background thread.
+When a new version appears it is loaded off the request path and swapped
+in with a single reference assignment, so requests already in flight
+keep using the version they started with.
+
+Snapshot columns are memory-mapped read-only, so several uvicorn workers
+loading the same version share one copy through the OS page cache
+instead of holding N private copies.
+"""
+import os
+import threading
+import time
+
+from snapshot import SNAPSHOT_DIR, JSON_PATH, load_dataset, source_version
+
+POLL_SECONDS = float(os.environ.get('DATASET_POLL_SECONDS', 10))
+
+
+class DatasetStore:
+    """Current dataset plus a watcher that reloads it when it changes"""
+
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR, json_path=JSON_PATH, poll_seconds=POLL_SECONDS):
+        self.snapshot_dir = snapshot_dir
+        self.json_path = json_path
+        self.poll_seconds = poll_seconds
+
+        self._current = (None, None)  # (data, version), swapped as one reference
+        self._loaded_at = None
+        self._load_seconds = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    def subscribe(self, callback):
+        """Call callback(data, version) after every successful load"""
+        self._listeners.append(callback)
+
+    def current(self):
+        """(data, version) of the loaded dataset, read consistently"""
+        return self._current
+
+    @property
+    def data(self):
+        """The current dataset dict, or None if nothing is loaded"""
+        return self._current[0]
+
+    @property
+    def version(self):
+        return self._current[1]
+
+    def status(self):
+        """Summary for /health"""
+        data, version = self._current
+        return {
+            'data_loaded': data is not None,
+            'dataset_version': version,
+            'loaded_at': self._loaded_at,
+            'load_seconds': self._load_seconds,
+            'transactions': data['metadata']['total_sales'] if data else 0
+        }
+
+    def refresh(self, force=False):
+        """
+        Load the dataset if its on-disk version differs from the loaded one.
+        Returns True if a new version was swapped in.
+        """
+        # Only one reload at a time; readers never take this lock
+        with self._reload_lock:
+            version = source_version(self.snapshot_dir, self.json_path)
+            if version is None or (version == self.version and not force):
+                return False
+
+            started = time.perf_counter()
+            data = load_dataset(self.snapshot_dir, self.json_path)
+            if data is None:
+                return False
+
+            self._load_seconds = round(time.perf_counter() - started, 3)
+            self._loaded_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+            self._current = (data, data['metadata']['version'])
+            print(f"✅ Dataset {self.version} loaded in {self._load_seconds}s: {len(data['sales'])} sales records")
+
+        for callback in self._listeners:
+            try:
+                callback(data, data['metadata']['version'])
+            except Exception as e:
+                print(f"⚠️ Dataset listener failed: {e}")
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the previous version
+                print(f"⚠️ Dataset reload failed: {e}")
+
+    def start(self):
+        """Start polling for new versions in a daemon thread"""
+        if self._thread is None and self.poll_seconds > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name='dataset-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_seconds)
+            self._thread = None
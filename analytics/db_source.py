@@ -0,0 +1,261 @@
+"""
+Pulls sales lines from the application database (database/schema.sql)
+for the importer, instead of the Kaggle CSV.
+
+One row per sales_items line, joined to its sale, customer and product,
+is mapped onto the CSV's columns (InvoiceNo = sale id, StockCode = SKU,
+CustomerID = a numeric key derived from the customer UUID, ...) so the
+importer's aggregation and snapshot code is shared by both inputs.
+
+- Connections come from a small bounded pool.
+- Postgres rows stream through a server-side (named) cursor, or with
+  method='copy' through COPY ... TO STDOUT WITH CSV, and are turned into
+  columnar arrays FETCH_ROWS rows at a time; the full result never sits
+  in Python objects at once.
+- Incremental pulls resume from a watermark: the newest sales_items
+  created_at seen, plus the ids of the lines within WATERMARK_LAG
+  seconds of it. The next pull re-reads that window and skips those ids,
+  so lines sharing a timestamp, or committed a little after lines with a
+  later created_at, are neither missed nor counted twice. Lines
+  backdated further than that, and sales cancelled after they were
+  pulled, are only picked up by a full pull.
+
+Postgres needs psycopg2. The same queries run against SQLite with the
+schema from sqlite_schema(), which is how the source is tested locally:
+
+    source = SalesSource('sqlite:///path/to/test.db')
+    for chunk in source.iter_lines():
+        ...
+"""
+import os
+import queue
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_SQL = os.path.join(ROOT_DIR, 'database', 'schema.sql')
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 4))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+FETCH_ROWS = int(os.environ.get('DB_FETCH_ROWS', 50000))
+PULL_METHOD = os.environ.get('DB_PULL_METHOD', 'cursor')   # 'cursor' or 'copy' (Postgres only)
+# How far behind the newest line an incremental pull looks for late commits
+WATERMARK_LAG = float(os.environ.get('DB_WATERMARK_LAG_SECONDS', 60))
+
+# Columns of the line query, in order
+LINE_COLUMNS = ['line_id', 'line_created_at', 'InvoiceNo', 'InvoiceDate', 'customer_uuid',
+                'Country', 'StockCode', 'Description', 'Quantity', 'UnitPrice']
+
+LINES_QUERY = """
+SELECT si.id, si.created_at, CAST(s.id AS TEXT), s.created_at, CAST(s.customer_id AS TEXT),
+       COALESCE(s.country, c.country), COALESCE(p.sku, CAST(si.product_id AS TEXT)), p.name,
+       si.quantity, si.unit_price
+FROM sales_items si
+JOIN sales s ON s.id = si.sale_id
+LEFT JOIN customers c ON c.id = s.customer_id
+LEFT JOIN products p ON p.id = si.product_id
+WHERE COALESCE(s.status, '') <> 'cancelled'{after}
+ORDER BY si.created_at, si.id
+"""
+AFTER_WATERMARK = " AND si.created_at >= {p}"
+
+
+class ConnectionPool:
+    """Bounded pool of DB-API connections, opened on demand"""
+
+    def __init__(self, connect, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No database connection free after {self.timeout}s")
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; its transaction is ended before it goes back"""
+        conn = self._acquire()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            self._idle.put(conn)
+            raise
+        conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+
+def sqlite_schema(schema_path=SCHEMA_SQL):
+    """database/schema.sql with the Postgres-only parts removed, for an SQLite stand-in"""
+    with open(schema_path, 'r', encoding='utf-8-sig') as f:
+        script = f.read()
+    script = re.sub(r'CREATE EXTENSION[^;]*;', '', script)
+    script = re.sub(r'CREATE OR REPLACE VIEW.*?;', '', script, flags=re.S)
+    return script.replace(' DEFAULT uuid_generate_v4()', '')
+
+
+def customer_key(uuids):
+    """
+    Numeric CustomerID for customer UUIDs (the analytics tables use float
+    ids): the first 52 bits of the UUID, exact as a float64 and the same on
+    every pull. Missing customers are NaN.
+    """
+    codes, uniques = pd.factorize(pd.Series(uuids, dtype=object))
+    keys = np.array([int(u.replace('-', '')[:13], 16) for u in uniques], dtype=float)
+    # Code -1 (no customer) picks the trailing NaN
+    return np.append(keys, np.nan)[codes]
+
+
+def _timestamp_text(value):
+    """Watermark value as the database returned it (SQLite) or as ISO text (Postgres)"""
+    return value if isinstance(value, str) else pd.Timestamp(value).isoformat(sep=' ')
+
+
+class SalesSource:
+    """Sales lines from Postgres (postgresql://...) or SQLite (sqlite:///path)"""
+
+    def __init__(self, url=DATABASE_URL, pool_size=POOL_SIZE, fetch_rows=FETCH_ROWS):
+        if not url:
+            raise ValueError('No database URL (set DATABASE_URL)')
+
+        self.url = url
+        self.fetch_rows = fetch_rows
+        self.watermark = None
+        self.lines_pulled = 0
+        if url.startswith('sqlite:///'):
+            import sqlite3
+            path = url[len('sqlite:///'):]
+            self.backend = 'sqlite'
+            self.placeholder = '?'
+            self.pool = ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False), pool_size)
+        elif url.startswith(('postgres://', 'postgresql://')):
+            import psycopg2
+            self.backend = 'postgres'
+            self.placeholder = '%s'
+            self.pool = ConnectionPool(lambda: psycopg2.connect(url), pool_size)
+        else:
+            raise ValueError(f"Unsupported database URL: {url.split(':', 1)[0]}")
+
+    def lines_query(self, since=None):
+        """(sql, params) for every line, or the lines created at or after `since`"""
+        if since is None:
+            return LINES_QUERY.format(after=''), ()
+        return LINES_QUERY.format(after=AFTER_WATERMARK.format(p=self.placeholder)), (since,)
+
+    def _rows(self, conn, sql, params):
+        """Batches of raw rows, fetched fetch_rows at a time"""
+        if self.backend == 'postgres':
+            # Named cursor: rows stay on the server until fetched
+            cursor = conn.cursor(name='analytics_sales_lines')
+            cursor.itersize = self.fetch_rows
+        else:
+            cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(self.fetch_rows)
+                if not rows:
+                    break
+                yield pd.DataFrame.from_records(rows, columns=LINE_COLUMNS)
+        finally:
+            cursor.close()
+
+    def _copy(self, conn, sql, params):
+        """Batches parsed from COPY (query) TO STDOUT WITH CSV, spooled to disk past 64MB"""
+        cursor = conn.cursor()
+        try:
+            query = cursor.mogrify(sql, params).decode('utf-8')
+            with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024, mode='w+b') as buffer:
+                cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV", buffer)
+                buffer.seek(0)
+                yield from pd.read_csv(buffer, names=LINE_COLUMNS, chunksize=self.fetch_rows,
+                                       dtype={'line_id': str, 'InvoiceNo': str, 'StockCode': str,
+                                              'customer_uuid': str, 'line_created_at': str})
+        finally:
+            cursor.close()
+
+    def iter_lines(self, watermark=None, method=PULL_METHOD, lag=WATERMARK_LAG):
+        """
+        Yield DataFrames of sales lines in the Kaggle CSV's columns
+        (InvoiceNo, StockCode, Description, Quantity, InvoiceDate,
+        UnitPrice, CustomerID, Country), oldest first: every line, or
+        those not covered by `watermark`. After the last chunk,
+        self.watermark holds the watermark to resume from and
+        self.lines_pulled the number of new lines.
+        """
+        if method not in ('cursor', 'copy'):
+            raise ValueError("method must be 'cursor' or 'copy'")
+        lag = pd.Timedelta(seconds=lag)
+        since, latest, recent = None, None, []
+        if watermark is not None:
+            latest = pd.Timestamp(watermark['created_at'])
+            since = _timestamp_text(latest - lag)
+            recent = [tuple(line) for line in watermark['recent']]
+        seen = {line_id for _, line_id in recent}
+        sql, params = self.lines_query(since)
+        self.watermark = watermark
+        self.lines_pulled = 0
+
+        with self.pool.connection() as conn:
+            batches = self._copy if method == 'copy' and self.backend == 'postgres' else self._rows
+            for raw in batches(conn, sql, params):
+                raw = raw[~raw['line_id'].astype(str).isin(seen)]
+                if raw.empty:
+                    continue
+
+                # Rows arrive in created_at order: keep the ids near the newest one
+                created = pd.to_datetime(raw['line_created_at'])
+                latest = created.iloc[-1] if latest is None else max(latest, created.iloc[-1])
+                window = (created >= latest - lag).to_numpy()
+                recent = [line for line in recent if pd.Timestamp(line[0]) >= latest - lag] + list(zip(
+                    raw['line_created_at'][window].map(_timestamp_text), raw['line_id'][window].astype(str)))
+                self.watermark = {'created_at': _timestamp_text(latest), 'recent': [list(line) for line in recent]}
+                self.lines_pulled += len(raw)
+
+                yield pd.DataFrame({
+                    'InvoiceNo': raw['InvoiceNo'].astype(str).to_numpy(),
+                    'StockCode': raw['StockCode'].astype(str).to_numpy(),
+                    'Description': raw['Description'].to_numpy(),
+                    'Quantity': np.asarray(raw['Quantity'], dtype=np.int64),
+                    'InvoiceDate': pd.to_datetime(raw['InvoiceDate']).to_numpy(),
+                    'UnitPrice': np.asarray(raw['UnitPrice'], dtype=float),
+                    'CustomerID': customer_key(raw['customer_uuid'].to_numpy()),
+                    'Country': raw['Country'].to_numpy()
+                })
+
+    def close(self):
+        self.pool.close()
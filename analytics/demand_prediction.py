@@ -1,70 +1,193 @@
+import math
 import pandas as pd
 import numpy as np
-from xgboost import XGBRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error
-import json
+from model_registry import get_model
+from serialization import dumps, paginate
+from snapshot import load_dataset
 
-def predict_demand():
+MODEL_NAME = 'demand'
+LAGS = [1, 2, 3, 12]
+ROLLING_WINDOWS = [3, 6]
+FEATURES = (['horizon', 'target_month', 'seasonal_index', 'product_mean']
+            + [f'lag_{k}' for k in LAGS] + [f'rolling_mean_{w}' for w in ROLLING_WINDOWS])
+PARAMS = {'n_estimators': 100, 'learning_rate': 0.1, 'max_depth': 5, 'random_state': 42, 'test_size': 0.2,
+          'max_horizon': 6, 'min_history': 3}
+
+def monthly_demand(data):
     """
-    XGBoost Demand Prediction
-    Predicts product demand for inventory optimization
+    Units sold per product per calendar month, from product_daily in one
+    grouped pass: (product ids, first month as datetime64[M], products x months matrix).
+    A trailing partial month is dropped so it doesn't look like a slump.
+    """
+    daily = data.get('product_daily')
+    if daily is None or len(daily) == 0:
+        raise ValueError('product_daily table is missing; re-run the importer')
+    
+    codes, products = pd.factorize(daily['product_id'], sort=True)
+    dates = daily['date'].to_numpy().astype('datetime64[D]')
+    months = dates.astype('datetime64[M]').astype('int64')
+    
+    first, last = months.min(), months.max()
+    if (dates.max() + np.timedelta64(1, 'D')).astype('datetime64[M]').astype('int64') == last:
+        last -= 1
+    keep = months <= last
+    n_months = int(last - first + 1)
+    
+    flat = np.bincount(codes[keep] * n_months + (months[keep] - first),
+                       weights=daily['quantity'].to_numpy()[keep], minlength=len(products) * n_months)
+    return products, np.datetime64(int(first), 'M'), flat.reshape(len(products), n_months)
+
+def origin_features(matrix, origin, horizon, first_month):
+    """
+    Feature columns for every product, standing at month `origin` (last
+    observed) and predicting `horizon` months ahead. Only months up to
+    `origin` are read.
+    """
+    history = matrix[:, :origin + 1]
+    n = len(matrix)
+    
+    # Seasonality: demand in each calendar month relative to the monthly average
+    month_of_year = (first_month.astype('int64') + np.arange(origin + 1)) % 12
+    totals = history.sum(axis=0)
+    seen = np.bincount(month_of_year, minlength=12)
+    by_month = np.bincount(month_of_year, weights=totals, minlength=12)
+    seasonal = np.divide(by_month, seen * max(totals.mean(), 1e-9), out=np.ones(12), where=seen > 0)
+    target_month = (first_month.astype('int64') + origin + horizon) % 12
+    
+    features = {
+        'horizon': np.full(n, horizon),
+        'target_month': np.full(n, target_month + 1),
+        'seasonal_index': np.full(n, seasonal[target_month]),
+        'product_mean': history.mean(axis=1)
+    }
+    for k in LAGS:
+        features[f'lag_{k}'] = history[:, origin - k + 1] if origin - k + 1 >= 0 else np.full(n, np.nan)
+    for w in ROLLING_WINDOWS:
+        features[f'rolling_mean_{w}'] = history[:, max(0, origin - w + 1):].mean(axis=1)
+    return pd.DataFrame(features, columns=FEATURES)
+
+def build_features(data, params=PARAMS):
+    """
+    Training rows: for each origin month and horizon, every product that
+    has sold by then, with the units it sold `horizon` months later
     """
-    with open('../database/datasets/processed_data.json', 'r') as f:
-        data = json.load(f)
-    
-    products_df = pd.DataFrame(data['products'])
-    sales_df = pd.DataFrame(data['sales'])
-    
-    # Aggregate product sales with temporal features
-    sales_df['InvoiceDate'] = pd.to_datetime(sales_df['InvoiceDate'])
-    sales_df['month'] = sales_df['InvoiceDate'].dt.month
-    sales_df['day_of_week'] = sales_df['InvoiceDate'].dt.dayofweek
-    
-    product_features = sales_df.groupby('StockCode').agg({
-        'Quantity': 'sum',
-        'month': lambda x: x.mode()[0] if len(x) > 0 else 1,
-        'day_of_week': 'mean'
-    }).reset_index()
-    
-    # Prepare features
-    X = product_features[['month', 'day_of_week']]
-    y = product_features['Quantity']
-    
-    # Train/test split
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
-    # Train XGBoost
-    model = XGBRegressor(n_estimators=100, learning_rate=0.1, max_depth=5, random_state=42)
-    model.fit(X_train, y_train)
-    
-    # Predictions
-    y_pred = model.predict(X_test)
-    rmse = np.sqrt(mean_squared_error(y_test, y_pred))
-    
-    # Predict next month demand for top products
-    top_products = products_df.nlargest(20, 'total_sold')
-    predictions = []
-    
-    for _, product in top_products.iterrows():
-        next_month_demand = model.predict([[12, 3]])[0]  # December, mid-week
-        predictions.append({
-            'product_id': product['product_id'],
-            'product_name': product['name'],
-            'current_stock': product['total_sold'],
-            'predicted_demand': int(next_month_demand),
-            'recommendation': 'Restock' if next_month_demand > product['total_sold'] * 0.5 else 'Sufficient'
-        })
+    products, first_month, matrix = monthly_demand(data)
+    n_months = matrix.shape[1]
     
+    frames = []
+    for origin in range(params['min_history'] - 1, n_months - 1):
+        active = matrix[:, :origin + 1].sum(axis=1) > 0
+        for horizon in range(1, min(params['max_horizon'], n_months - 1 - origin) + 1):
+            frame = origin_features(matrix[active], origin, horizon, first_month)
+            frame['origin'] = origin
+            frame['quantity'] = matrix[active, origin + horizon]
+            frames.append(frame)
+    
+    if not frames:
+        raise ValueError(f"Need at least {params['min_history'] + 1} full months of sales")
+    return pd.concat(frames, ignore_index=True), len(products)
+
+def make_model(params):
+    from xgboost import XGBRegressor
+    
+    return XGBRegressor(
+        n_estimators=params['n_estimators'],
+        learning_rate=params['learning_rate'],
+        max_depth=params['max_depth'],
+        random_state=params['random_state']
+    )
+
+def train_demand(data, params=PARAMS):
+    """Fit XGBoost on per-product monthly features; returns (model, metrics)"""
+    from sklearn.metrics import mean_squared_error
+    
+    training, n_products = build_features(data, params)
+    X = training[FEATURES]
+    y = training['quantity']
+    
+    # Hold out the latest origins, so evaluation only ever looks forward in time
+    origins = np.sort(training['origin'].unique())
+    held_out = origins[-max(1, math.ceil(len(origins) * params['test_size'])):]
+    test = training['origin'].isin(held_out).to_numpy()
+    train = ~test if not test.all() else test
+    
+    model = make_model(params)
+    model.fit(X[train], y[train])
+    y_pred = model.predict(X[test])
+    rmse = float(np.sqrt(mean_squared_error(y[test], y_pred)))
+    
+    # Serve a model that has also seen the most recent months
+    model = make_model(params)
+    model.fit(X, y)
+    
+    return model, {
+        'rmse': rmse,
+        'accuracy_percentage': float(100 - (rmse / max(y[test].mean(), 1e-9) * 100)),
+        'total_products_analyzed': n_products,
+        'training_rows': len(training)
+    }
+
+def score_demand(data, model, metadata, limit=10, cursor=None, horizon=1):
+    """Forecast each product's demand over the next `horizon` months with one predict call"""
+    max_horizon = metadata['params']['max_horizon']
+    if not 1 <= horizon <= max_horizon:
+        raise ValueError(f"horizon must be between 1 and {max_horizon} months")
+    
+    products, first_month, matrix = monthly_demand(data)
+    origin = matrix.shape[1] - 1
+    
+    X = pd.concat([origin_features(matrix, origin, h, first_month) for h in range(1, horizon + 1)],
+                  ignore_index=True)
+    monthly = np.maximum(model.predict(X), 0).reshape(horizon, len(products)).T
+    
+    catalog = data['products'].set_index('product_id') if 'product_id' in data['products'].columns else None
+    ids = products.astype(str)
+    names = stock = None
+    if catalog is not None:
+        catalog.index = catalog.index.astype(str)
+        names = catalog['name'].reindex(ids).to_numpy() if 'name' in catalog.columns else None
+        stock = catalog['total_sold'].reindex(ids).to_numpy() if 'total_sold' in catalog.columns else None
+    history = matrix.sum(axis=1)
+    stock = np.where(pd.isna(stock), history, stock).astype(float) if stock is not None else history
+    
+    predicted = monthly.sum(axis=1)
+    predictions = pd.DataFrame({
+        'product_id': ids,
+        'product_name': names if names is not None else ids,
+        'current_stock': stock.astype(int),
+        'predicted_demand': np.rint(predicted).astype(int),
+        'monthly_demand': list(np.rint(monthly).astype(int)),
+        'recommendation': np.where(predicted > stock * 0.5, 'Restock', 'Sufficient')
+    })
+    predictions['product_name'] = predictions['product_name'].fillna(predictions['product_id'])
+    page, next_cursor = paginate(predictions, list(predictions.columns), limit, cursor, by='predicted_demand')
+    
+    forecast_months = first_month + origin + 1 + np.arange(horizon)
+    metrics = metadata['metrics']
     return {
-        'rmse': round(rmse, 2),
+        'rmse': round(metrics['rmse'], 2),
         'model': 'XGBoost',
-        'features': ['month', 'day_of_week', 'historical_sales'],
-        'predictions': predictions[:10],
-        'total_products_analyzed': len(product_features),
-        'accuracy_percentage': round(100 - (rmse / y.mean() * 100), 2)
+        'features': FEATURES,
+        'horizon_months': horizon,
+        'forecast_months': [str(m) for m in forecast_months],
+        'predictions': page,
+        'next_cursor': next_cursor,
+        'total_products_analyzed': metrics['total_products_analyzed'],
+        'accuracy_percentage': round(metrics['accuracy_percentage'], 2)
     }
 
+def predict_demand(data=None, limit=10, cursor=None, horizon=1):
+    """
+    XGBoost Demand Prediction
+    Forecasts per-product demand for the next `horizon` months
+    """
+    if data is None:
+        data = load_dataset()
+    
+    # Reuse the registered model for this dataset version, training only if missing
+    model, metadata = get_model(MODEL_NAME, data, PARAMS, FEATURES, train_demand)
+    return score_demand(data, model, metadata, limit, cursor, horizon)
+
 if __name__ == '__main__':
     result = predict_demand()
-    print(json.dumps(result, indent=2))
+    print(dumps(result, indent=True).decode())
@@ -0,0 +1,145 @@
+"""
+Per-customer feature store shared by the churn and segmentation models
+and the fast /ml/* endpoints.
+
+RFM and derived features are computed once per dataset version and kept
+as compact typed arrays, aligned with data['customers'] rows:
+
+    customer_id        float64   as in the customers table
+    recency            float32   days from last order to the dataset's
+                                 last sale (NaN if unknown)
+    frequency          int32     orders
+    monetary           float32   revenue, summed from sales total_amount
+    total_items        int32     units bought
+    avg_order_value    float32   monetary / frequency
+    tenure_days        float32   first to last purchase (NaN if unknown)
+    churned            int8      1 if recency > CHURN_DAYS
+    country            int16     code into CustomerFeatures.countries
+
+Models read their training and scoring matrices through frame(), so the
+features they were fitted on and the ones they serve are the same.
+"""
+import numpy as np
+import pandas as pd
+
+# Customers inactive for longer than this (days) count as churned
+CHURN_DAYS = 60
+# Part of every model's params that reads these features, so registered
+# models fitted on an older feature definition aren't reused
+FEATURE_SET = 'rfm-v3'
+# Dataset versions kept built at once (the main dataset plus recent uploads)
+CACHED_VERSIONS = 4
+
+# dataset version -> CustomerFeatures, oldest first
+_built = {}
+
+
+class CustomerFeatures:
+    """Typed feature arrays for every customer of one dataset version"""
+
+    def __init__(self, version, columns, countries):
+        self.version = version
+        self.columns = columns
+        self.countries = countries
+
+    def __len__(self):
+        return len(self.columns['customer_id'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def frame(self, names, fill=0):
+        """DataFrame of the named features (model input); NaN replaced by `fill`"""
+        frame = pd.DataFrame({name: self.columns[name] for name in names})
+        return frame.fillna(fill) if fill is not None else frame
+
+    def nbytes(self):
+        return int(sum(values.nbytes for values in self.columns.values()))
+
+
+def _days(values):
+    return np.asarray(values, dtype='datetime64[ns]')
+
+
+def dataset_end(data):
+    """Date of the dataset's last sale or last purchase, whichever is later"""
+    ends = [data['customers']['last_purchase'].max()]
+    sales = data.get('sales')
+    if sales is not None and len(sales):
+        ends.append(sales['InvoiceDate'].max())
+    return max((pd.Timestamp(end) for end in ends if pd.notna(end)), default=pd.NaT)
+
+
+def build_features(data, end=None):
+    """
+    CustomerFeatures for a dataset (customers table plus revenue from
+    sales). A 'monetary' column in the customers table is used as given.
+    Recency is days from last_purchase to `end`, by default the dataset's
+    last sale (not today, so the features of a version never go stale).
+    """
+    customers = data['customers']
+    n = len(customers)
+
+    def numeric(name, dtype, default=np.nan):
+        if name not in customers.columns:
+            return np.full(n, default, dtype=dtype)
+        values = np.asarray(customers[name], dtype=float)
+        return (values if np.issubdtype(dtype, np.floating) else np.nan_to_num(values)).astype(dtype)
+
+    customer_id = np.asarray(customers['customer_id'], dtype=float)
+    frequency = numeric('order_count', np.int32, 0)
+
+    # True monetary value: every invoice's total_amount, summed per customer
+    sales = data.get('sales')
+    if 'monetary' in customers.columns or sales is None:
+        monetary = numeric('monetary', np.float32, 0)
+    else:
+        positions = pd.Index(customer_id).get_indexer(np.asarray(sales['CustomerID'], dtype=float))
+        matched = positions >= 0
+        amounts = np.asarray(sales['total_amount'], dtype=float)[matched]
+        monetary = np.bincount(positions[matched], weights=amounts, minlength=n).astype(np.float32)
+
+    if 'first_purchase' in customers.columns and 'last_purchase' in customers.columns:
+        span = _days(customers['last_purchase']) - _days(customers['first_purchase'])
+        tenure = (span / np.timedelta64(1, 'D')).astype(np.float32)
+    else:
+        tenure = np.full(n, np.nan, dtype=np.float32)
+
+    if 'last_purchase' in customers.columns and n:
+        end = dataset_end(data) if end is None else pd.Timestamp(end)
+        elapsed = np.datetime64(end.to_datetime64(), 'ns') - _days(customers['last_purchase'])
+        recency = np.floor(elapsed / np.timedelta64(1, 'D')).astype(np.float32)
+    else:
+        recency = np.full(n, np.nan, dtype=np.float32)
+    if 'country' in customers.columns:
+        codes, countries = pd.factorize(customers['country'])
+        countries = np.asarray(countries, dtype=object)
+    else:
+        codes, countries = np.full(n, -1), np.array([], dtype=object)
+
+    columns = {
+        'customer_id': customer_id,
+        'recency': recency,
+        'frequency': frequency,
+        'monetary': monetary,
+        'total_items': numeric('total_items', np.int32, 0),
+        'avg_order_value': np.divide(monetary, frequency, out=np.zeros(n, dtype=np.float32), where=frequency > 0),
+        'tenure_days': tenure,
+        'churned': (recency > CHURN_DAYS).astype(np.int8),
+        'country': codes.astype(np.int16)
+    }
+    return CustomerFeatures(data.get('metadata', {}).get('version'), columns, countries)
+
+
+def customer_features(data):
+    """The dataset's CustomerFeatures, built once per dataset version"""
+    version = data.get('metadata', {}).get('version')
+    if version is None:
+        return build_features(data)
+    cached = _built.get(version)
+    if cached is None:
+        cached = build_features(data)
+        while len(_built) >= CACHED_VERSIONS:
+            _built.pop(next(iter(_built)))
+        _built[version] = cached
+    return cached
@@ -1,51 +1,74 @@
 import pandas as pd
 import numpy as np
-from statsmodels.tsa.arima.model import ARIMA
-from statsmodels.tsa.statespace.sarimax import SARIMAX
 import json
 import warnings
+
+from order_selection import fit_series
+from rollups import rollup_series
+from snapshot import load_dataset
+
 warnings.filterwarnings('ignore')
 
+ARIMA_ORDER = (5, 1, 2)
+ORDERS = ('fixed', 'auto')
+MAX_DAYS = 365
+# Backtested forecaster (backtesting.FORECASTERS) serving each order
+FORECASTERS = {'fixed': 'forecast_fixed', 'auto': 'forecast_auto'}
+
 def load_data():
-    """Load processed Kaggle data"""
-    with open('../database/datasets/processed_data.json', 'r') as f:
-        data = json.load(f)
-    return data
+    """Load processed Kaggle data (columnar snapshot, JSON fallback)"""
+    return load_dataset()
 
-def forecast_sales(days=28):
+def predict(fitted, days):
+    """(forecast, 95% prediction interval rows) for the next `days` days of a fitted model"""
+    prediction = fitted.get_forecast(steps=days)
+    return np.asarray(prediction.predicted_mean), np.asarray(prediction.conf_int(alpha=0.05))
+
+def forecast_sales(days=28, data=None, order='fixed'):
     """
     ARIMA Sales Forecasting
-    Returns next 28 days predictions
+    Returns predictions for the next `days` days (1 to MAX_DAYS,
+    default 28). order='fixed' uses ARIMA(5,1,2),
+    order='auto' searches the order (see order_selection); either way
+    the fit is cached per dataset version and refit warm from the
+    previous version's when new days arrive. 'backtest' holds the
+    latest saved backtest scores for this order (see backtesting), or
+    None if it hasn't been backtested.
     """
-    data = load_data()
-    sales_df = pd.DataFrame(data['sales'])
-    sales_df['InvoiceDate'] = pd.to_datetime(sales_df['InvoiceDate'])
+    # backtesting imports this module for the forecasters it scores
+    from backtesting import latest_scores
+    
+    if order not in ORDERS:
+        raise ValueError(f"order must be one of {', '.join(ORDERS)}")
+    if not isinstance(days, (int, np.integer)) or not 1 <= days <= MAX_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_DAYS}")
     
-    # Aggregate daily sales
-    daily_sales = sales_df.groupby(sales_df['InvoiceDate'].dt.date)['total_amount'].sum()
+    if data is None:
+        data = load_data()
     
-    # ARIMA(5,1,2) model
-    model = ARIMA(daily_sales, order=(5, 1, 2))
-    fitted = model.fit()
+    # Daily revenue from the rollup cube (days without sales are 0)
+    daily_sales = rollup_series(data)
     
-    # Forecast next 28 days
-    forecast = fitted.forecast(steps=days)
+    fitted, info = fit_series('daily_revenue', daily_sales, data['metadata'].get('version'),
+                              None if order == 'auto' else ARIMA_ORDER)
     
-    # Calculate accuracy metrics
-    predictions = fitted.fittedvalues[-30:]
-    actuals = daily_sales.values[-30:]
-    mape = np.mean(np.abs((actuals - predictions) / actuals)) * 100
-    accuracy = 100 - mape
+    # Forecast the next days with the model's own 95% prediction interval
+    forecast, interval = predict(fitted, days)
     
     return {
         'forecast': forecast.tolist(),
         'dates': pd.date_range(start=daily_sales.index[-1], periods=days+1)[1:].strftime('%Y-%m-%d').tolist(),
-        'accuracy': round(accuracy, 2),
+        'backtest': latest_scores(FORECASTERS[order]),
         'total_predicted_revenue': round(forecast.sum(), 2),
-        'model': 'ARIMA(5,1,2)',
+        'model': info['model'],
+        'order_selection': {
+            key: info[key] for key in ('fit', 'order', 'seasonal_order', 'aic', 'candidates_fitted', 'fit_seconds')
+            if key in info
+        },
         'confidence_interval': {
-            'lower': (forecast * 0.85).tolist(),
-            'upper': (forecast * 1.15).tolist()
+            'lower': interval[:, 0].tolist(),
+            'upper': interval[:, 1].tolist(),
+            'level': 0.95
         }
     }
 
@@ -0,0 +1,34 @@
+"""
+Gunicorn settings for serving the ML API with several worker processes.
+
+    cd analytics && gunicorn -c gunicorn.conf.py
+
+The app is imported once in the master (preload_app): that loads the
+dataset and warms the result cache, and the uvicorn workers forked from
+it share those pages copy-on-write instead of each building its own.
+gc.freeze() before forking keeps the collector from writing to (and so
+copying) the shared objects. Threads, SQLite connections, the query
+engine and the anomaly scorer are started per worker in the app's
+lifespan, after the fork.
+
+Set ML_PRELOAD=0 to have each worker load the dataset itself instead.
+Gunicorn doesn't run on Windows; use `python -m uvicorn api.fastapi_app:app`
+there.
+"""
+import gc
+import multiprocessing
+import os
+
+wsgi_app = 'api.fastapi_app:app'
+bind = os.environ.get('ML_BIND', '0.0.0.0:8001')
+workers = int(os.environ.get('ML_WORKERS', min(4, multiprocessing.cpu_count())))
+worker_class = 'uvicorn.workers.UvicornWorker'
+preload_app = os.environ.get('ML_PRELOAD', '1') == '1'
+# Full model runs go to the process pool, but a cold start can still train models
+timeout = int(os.environ.get('ML_WORKER_TIMEOUT', 120))
+graceful_timeout = 30
+
+
+def pre_fork(server, worker):
+    # Move everything the master has built so far out of the collector's reach
+    gc.freeze()
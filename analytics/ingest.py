@@ -0,0 +1,440 @@
+"""
+Turns raw transactions into the analytics snapshot tables.
+
+Shared by the Kaggle importer (scripts/import-kaggle-data.py) and the
+API's per-dataset uploads. Input is one row per invoice line in the
+Kaggle CSV's columns:
+
+    InvoiceNo, StockCode, Description, Quantity, InvoiceDate,
+    UnitPrice, CustomerID, Country
+
+Aggregates are built as mergeable partials (means kept as sum + count),
+so chunks and later deltas fold into the same state. normalize_upload()
+maps a user's own CSV/XLSX columns onto the Kaggle ones.
+"""
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from rollups import build_cube, update_cube
+from sketches import merge_periods, sketch_product_days, sketch_sales, to_arrays, update_sketches
+
+# How partial aggregates from separate chunks are combined
+MERGE_SPECS = {
+    'invoices': {
+        'InvoiceDate': 'first',
+        'CustomerID': 'first',
+        'Country': 'first',
+        'Quantity': 'sum',
+        'price_sum': 'sum',
+        'price_count': 'sum'
+    },
+    'customers': {
+        'country': 'first',
+        'first_purchase': 'min',
+        'last_purchase': 'max',
+        'order_count': 'sum',
+        'total_items': 'sum'
+    },
+    'products': {
+        'name': 'first',
+        'price_sum': 'sum',
+        'price_count': 'sum',
+        'total_sold': 'sum'
+    },
+    'product_days': {
+        'quantity': 'sum',
+        'revenue': 'sum'
+    }
+}
+
+# Key columns of each aggregate, restored as the index when state is reloaded
+STATE_KEYS = {
+    'invoices': ['InvoiceNo'],
+    'customers': ['CustomerID'],
+    'products': ['StockCode'],
+    'product_days': ['StockCode', 'day']
+}
+
+def clean_data(df):
+    """Drop rows without customer/invoice and parse dates"""
+    df = df.dropna(subset=['CustomerID', 'InvoiceNo'])
+    df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
+    return df
+
+def partial_aggregates(df):
+    """Mergeable per-chunk aggregates (means kept as sum + count)"""
+    invoices = df.groupby('InvoiceNo', sort=False).agg(
+        InvoiceDate=('InvoiceDate', 'first'),
+        CustomerID=('CustomerID', 'first'),
+        Country=('Country', 'first'),
+        Quantity=('Quantity', 'sum'),
+        price_sum=('UnitPrice', 'sum'),
+        price_count=('UnitPrice', 'count')
+    )
+    
+    customers = df.groupby('CustomerID', sort=False).agg(
+        country=('Country', 'first'),
+        first_purchase=('InvoiceDate', 'min'),
+        last_purchase=('InvoiceDate', 'max'),
+        order_count=('InvoiceDate', 'count'),
+        total_items=('Quantity', 'sum')
+    )
+    
+    products = df.groupby('StockCode', sort=False).agg(
+        name=('Description', 'first'),
+        price_sum=('UnitPrice', 'sum'),
+        price_count=('UnitPrice', 'count'),
+        total_sold=('Quantity', 'sum')
+    )
+    
+    # Daily quantity and line revenue per product, for per-product series
+    lines = df[['StockCode', 'Quantity']].assign(
+        day=df['InvoiceDate'].dt.floor('D'),
+        revenue=df['Quantity'] * df['UnitPrice']
+    )
+    product_days = lines.groupby(['StockCode', 'day'], sort=False).agg(
+        quantity=('Quantity', 'sum'),
+        revenue=('revenue', 'sum')
+    )
+    
+    return {'invoices': invoices, 'customers': customers, 'products': products, 'product_days': product_days}
+
+def merge_frame(base, delta, spec):
+    """
+    Merge delta aggregates into base, regrouping only the keys in delta:
+    their rows are updated in place and new keys appended
+    """
+    positions = base.index.get_indexer(delta.index)
+    touched = positions >= 0
+    
+    if touched.any():
+        rows = positions[touched]
+        levels = list(range(base.index.nlevels))
+        # Earlier rows come first, so 'first' keeps file order across merges
+        merged = pd.concat([base.iloc[rows], delta[touched]]).groupby(level=levels, sort=False).agg(spec)
+        for column in spec:
+            base.iloc[rows, base.columns.get_loc(column)] = merged[column].to_numpy()
+    
+    return base if touched.all() else pd.concat([base, delta[~touched]])
+
+def combine_partials(partials):
+    """Merge a list of partial aggregates with one concat + groupby per table"""
+    combined = {}
+    for key, spec in MERGE_SPECS.items():
+        frames = [partial[key] for partial in partials]
+        levels = list(range(frames[0].index.nlevels))
+        # Concatenated in order, so 'first' keeps file order
+        combined[key] = pd.concat(frames).groupby(level=levels, sort=False).agg(spec)
+    return combined
+
+def partial_rows(partial):
+    """Rows held by a set of partial aggregates (0 for None)"""
+    return sum(len(frame) for frame in partial.values()) if partial else 0
+
+def merge_partials(state, partial):
+    """Fold a chunk's partial aggregates into the running state"""
+    if state is None:
+        return partial
+    
+    return {
+        key: merge_frame(state[key], partial[key], MERGE_SPECS[key])
+        for key in MERGE_SPECS
+    }
+
+def finalize_invoices(invoices):
+    """Sales summary (one row per invoice, by InvoiceNo) from invoice aggregates"""
+    invoices = invoices.sort_index()
+    invoices['UnitPrice'] = invoices['price_sum'] / invoices['price_count']
+    return invoices[['InvoiceDate', 'CustomerID', 'Country', 'Quantity', 'UnitPrice']].reset_index()
+
+def finalize_customers(customers):
+    customers = customers.sort_index().reset_index()
+    return customers.rename(columns={'CustomerID': 'customer_id'})
+
+def finalize_products(products):
+    products = products.sort_index()
+    products['price'] = products['price_sum'] / products['price_count']
+    products = products[['name', 'price', 'total_sold']].reset_index()
+    return products.rename(columns={'StockCode': 'product_id'})
+
+def finalize_partials(state):
+    """Turn merged partial aggregates into the batch output tables"""
+    return (finalize_invoices(state['invoices']), finalize_customers(state['customers']),
+            finalize_products(state['products']))
+
+def daily_product_sales(state):
+    """Product x day table from the merged aggregates"""
+    product_daily = state['product_days'].sort_index().reset_index()
+    return product_daily.rename(columns={'StockCode': 'product_id', 'day': 'date'})
+
+def state_tables(state):
+    """Aggregate state as plain tables (key column first) for the snapshot"""
+    return {key: frame.reset_index() for key, frame in state.items()}
+
+def add_amounts(sales_summary):
+    sales_summary['total_amount'] = sales_summary['Quantity'] * sales_summary['UnitPrice']
+    sales_summary['profit'] = sales_summary['total_amount'] * 0.3  # 30% profit margin
+    return sales_summary
+
+def output_metadata(sales_summary, customers, products, date_min, date_max):
+    return {
+        'total_sales': len(sales_summary),
+        'total_customers': len(customers),
+        'total_products': len(products),
+        'date_range': {
+            'start': date_min.isoformat(),
+            'end': date_max.isoformat()
+        }
+    }
+
+def build_output(sales_summary, customers, products, product_daily, date_min, date_max, sketches=None):
+    """
+    Add derived columns and metadata shared by batch and chunked ingest.
+    `sketches` are the product sketches ({month: PeriodSketches}) built
+    while reading chunks; without them they are built from product_daily.
+    """
+    add_amounts(sales_summary)
+    if sketches is None:
+        sketches = sketch_product_days(product_daily)
+    
+    # Recency is not stored: the feature store counts it from last_purchase
+    # to the dataset's last sale
+    return {
+        'sales': sales_summary,
+        'customers': customers,
+        # The best sellers; top products over any date range come from the sketches
+        'products': products.nlargest(100, 'total_sold'),
+        'product_daily': product_daily,
+        'rollup': build_cube(sales_summary),
+        # Invoice sketches need whole invoices, so they wait for the finalized sales
+        'sketches': to_arrays(merge_periods(sketch_sales(sales_summary), sketches)),
+        'metadata': output_metadata(sales_summary, customers, products, date_min, date_max)
+    }
+
+def merge_delta(state, delta):
+    """
+    merge_partials for a delta, plus {table: columns} of the state tables
+    whose values it left as they were (keys included when none were added)
+    """
+    unchanged = {}
+    for key, spec in MERGE_SPECS.items():
+        positions = state[key].index.get_indexer(delta[key].index)
+        rows = positions[positions >= 0]
+        before = state[key].iloc[rows].copy() if len(rows) == len(positions) else None
+        state[key] = merge_frame(state[key], delta[key], spec)
+        if before is not None:
+            after = state[key].iloc[rows]
+            unchanged[key] = STATE_KEYS[key] + [column for column in spec if before[column].equals(after[column])]
+    return state, unchanged
+
+def _search_keys(table, rows, keys):
+    """Comparable key arrays for a table sorted by `keys` and for new rows"""
+    def values(frame, key):
+        column = frame[key]
+        if pd.api.types.is_datetime64_any_dtype(column):
+            return np.asarray(column, dtype='datetime64[ns]').view('int64')
+        if isinstance(column.dtype, pd.CategoricalDtype) or not pd.api.types.is_numeric_dtype(column):
+            return np.asarray(column, dtype=object)
+        return np.asarray(column)
+    
+    if len(keys) == 1:
+        return values(table, keys[0]), values(rows, keys[0])
+    
+    # Several keys: the first as its rank among the table's sorted values
+    # (new values rank between), the rest as numbers, in one record array
+    first, new = values(table, keys[0]), values(rows, keys[0])
+    starts = np.r_[True, first[1:] != first[:-1]] if len(first) else np.zeros(0, dtype=bool)
+    ranks = 2 * (np.cumsum(starts) - 1) + 1
+    uniques = first[starts]
+    at = np.searchsorted(uniques, new)
+    found = at < len(uniques)
+    found[found] = uniques[at[found]] == new[found]
+    new_ranks = 2 * at + found
+    
+    dtype = [('rank', 'i8')] + [(key, values(table, key).dtype) for key in keys[1:]]
+    base_keys, row_keys = np.empty(len(table), dtype=dtype), np.empty(len(rows), dtype=dtype)
+    base_keys['rank'], row_keys['rank'] = ranks, new_ranks
+    for key in keys[1:]:
+        base_keys[key], row_keys[key] = values(table, key), values(rows, key)
+    return base_keys, row_keys
+
+def patch_table(table, rows, keys):
+    """
+    Apply `rows` to `table`, both sorted by `keys`: rows whose keys are
+    in the table replace theirs and the others are inserted in key order,
+    so nothing is regrouped or re-sorted. Returns (table, columns left
+    unchanged, mask of the inserted rows).
+    """
+    base_keys, row_keys = _search_keys(table, rows, keys)
+    positions = np.searchsorted(base_keys, row_keys)
+    found = positions < len(base_keys)
+    found[found] = base_keys[positions[found]] == row_keys[found]
+    added = ~found
+    replaced, inserted_at = positions[found], positions[added]
+    
+    columns, unchanged = {}, []
+    for column in table.columns:
+        new = rows[column].to_numpy()
+        if not added.any() and pd.Index(np.asarray(table[column])[replaced]).equals(pd.Index(new)):
+            columns[column] = table[column]
+            unchanged.append(column)
+            continue
+        
+        dtype = object if isinstance(table[column].dtype, pd.CategoricalDtype) else None
+        values = np.array(table[column], dtype=dtype)
+        values[replaced] = new[found]
+        columns[column] = np.insert(values, inserted_at, new[added])
+    
+    return pd.DataFrame(columns), unchanged, added
+
+def update_output(previous, state, delta, sketches, date_min, date_max):
+    """
+    Fold a merged delta into the previous snapshot's output. Only the keys
+    in `delta` are finalized and patched into the stored tables; the
+    rollup periods and sketch months they fall in are updated and nothing
+    else is regrouped. `sketches` are the delta's product sketches.
+    Returns (output, {table: columns left unchanged}).
+    """
+    touched = {key: state[key].loc[delta[key].index] for key in MERGE_SPECS}
+    sales_rows = add_amounts(finalize_invoices(touched['invoices']))
+    
+    sales, sales_unchanged, added = patch_table(previous['sales'], sales_rows, ['InvoiceNo'])
+    customers, customers_unchanged, _ = patch_table(
+        previous['customers'], finalize_customers(touched['customers']), ['customer_id'])
+    product_daily, daily_unchanged, _ = patch_table(
+        previous['product_daily'], daily_product_sales(touched), ['product_id', 'date'])
+    products = finalize_products(state['products'])
+    
+    rollup = previous.get('rollup')
+    rollup = update_cube(rollup, sales, sales_rows['InvoiceDate']) if rollup is not None and len(rollup) else build_cube(sales)
+    if previous.get('sketches'):
+        sketches = update_sketches(previous['sketches'], sales, sales_rows[added],
+                                   sales_rows.loc[~added, 'InvoiceDate'], sketches)
+    else:
+        sketches = to_arrays(merge_periods(sketch_sales(sales), sketch_product_days(product_daily)))
+    
+    output = {
+        'sales': sales,
+        'customers': customers,
+        'products': products.nlargest(100, 'total_sold'),
+        'product_daily': product_daily,
+        'rollup': rollup,
+        'sketches': sketches,
+        'metadata': output_metadata(sales, customers, products, date_min, date_max)
+    }
+    unchanged = {'sales': sales_unchanged, 'customers': customers_unchanged, 'product_daily': daily_unchanged}
+    return output, unchanged
+
+def build_dataset(df):
+    """(snapshot output, aggregate state) for one frame of raw transactions"""
+    df = clean_data(df)
+    if df.empty:
+        raise ValueError("No usable transactions")
+    
+    state = partial_aggregates(df)
+    sales_summary, customers, products = finalize_partials(state)
+    output = build_output(sales_summary, customers, products, daily_product_sales(state),
+                          df['InvoiceDate'].min(), df['InvoiceDate'].max())
+    return output, state
+
+# Uploaded column names (lowercased, letters and digits only) accepted for
+# each Kaggle column, most specific first
+COLUMN_ALIASES = {
+    'InvoiceDate': ['invoicedate', 'orderdate', 'saledate', 'transactiondate', 'purchasedate', 'date',
+                    'createdat', 'datetime', 'timestamp'],
+    'Quantity': ['quantity', 'qty', 'unitssold', 'quantitysold', 'units'],
+    'UnitPrice': ['unitprice', 'priceperunit', 'itemprice', 'price', 'unitcost'],
+    'total_amount': ['totalamount', 'totalprice', 'linetotal', 'totalsales', 'total', 'amount', 'revenue', 'sales'],
+    'CustomerID': ['customerid', 'customerno', 'clientid', 'customer', 'customername', 'client', 'userid'],
+    'StockCode': ['stockcode', 'productid', 'sku', 'itemid', 'productcode', 'product'],
+    'Description': ['description', 'productname', 'itemname', 'product', 'productcategory', 'category', 'name'],
+    'Country': ['country', 'region', 'market', 'state', 'city'],
+    'InvoiceNo': ['invoiceno', 'invoice', 'invoiceid', 'orderid', 'orderno', 'transactionid', 'saleid']
+}
+UPLOAD_TYPES = ('.csv', '.xlsx', '.xls', '.json')
+
+def match_columns(columns):
+    """Kaggle column -> uploaded column, for the columns that could be matched"""
+    keys = {re.sub(r'[^a-z0-9]', '', str(column).lower()): column for column in columns}
+    matched = {}
+    for target, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in keys:
+                matched[target] = keys[alias]
+                break
+    return matched
+
+def _numbers(series):
+    """Numeric values of a column that may hold text like '$1,200.50'"""
+    if series.dtype == object:
+        series = series.astype(str).str.replace(r'[^0-9.\-]', '', regex=True)
+    return pd.to_numeric(series, errors='coerce')
+
+def normalize_upload(raw):
+    """
+    Map a user's transactions onto the Kaggle columns. Needs a date and
+    either a unit price or a line total; quantity defaults to 1, and
+    missing invoice / customer / product / country columns are filled
+    (each row its own invoice, each invoice its own customer).
+    """
+    columns = match_columns(raw.columns)
+    if 'InvoiceDate' not in columns:
+        raise ValueError("No date column found (e.g. 'Date', 'InvoiceDate', 'order_date')")
+    if 'UnitPrice' not in columns and 'total_amount' not in columns:
+        raise ValueError("No price or amount column found (e.g. 'UnitPrice', 'Price', 'Total Amount')")
+    
+    n = len(raw)
+    quantity = _numbers(raw[columns['Quantity']]) if 'Quantity' in columns else pd.Series(1.0, index=raw.index)
+    if 'UnitPrice' in columns:
+        price = _numbers(raw[columns['UnitPrice']])
+    else:
+        price = _numbers(raw[columns['total_amount']]) / quantity.where(quantity != 0)
+    
+    invoices = raw[columns['InvoiceNo']].astype(str) if 'InvoiceNo' in columns else pd.Series(
+        np.arange(1, n + 1).astype(str), index=raw.index)
+    if 'CustomerID' in columns:
+        customers = raw[columns['CustomerID']]
+        if not pd.api.types.is_numeric_dtype(customers):
+            codes, _ = pd.factorize(customers)
+            customers = pd.Series(np.where(codes >= 0, codes + 1, np.nan), index=raw.index)
+    else:
+        customers = pd.Series(pd.factorize(invoices)[0] + 1, index=raw.index)
+    
+    products = columns.get('StockCode', columns.get('Description'))
+    stock_codes = raw[products].astype(str) if products else pd.Series('ALL', index=raw.index)
+    
+    df = pd.DataFrame({
+        'InvoiceNo': invoices,
+        'StockCode': stock_codes,
+        'Description': raw[columns['Description']].astype(str) if 'Description' in columns else stock_codes,
+        'Quantity': quantity,
+        'InvoiceDate': pd.to_datetime(raw[columns['InvoiceDate']], errors='coerce'),
+        'UnitPrice': price,
+        'CustomerID': pd.to_numeric(customers, errors='coerce'),
+        'Country': raw[columns['Country']].astype(str) if 'Country' in columns else 'Unknown'
+    })
+    df = df.dropna(subset=['InvoiceDate', 'Quantity', 'UnitPrice'])
+    df['Quantity'] = df['Quantity'].round().astype('int64')
+    return df
+
+def read_upload(path):
+    """Raw rows of an uploaded CSV, XLSX/XLS or JSON file"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in UPLOAD_TYPES:
+        raise ValueError(f"Unsupported file type {ext or '(none)'}; expected {', '.join(UPLOAD_TYPES)}")
+    
+    if ext == '.csv':
+        try:
+            return pd.read_csv(path)
+        except UnicodeDecodeError:
+            return pd.read_csv(path, encoding='ISO-8859-1')
+    if ext == '.json':
+        return pd.read_json(path)
+    try:
+        return pd.read_excel(path)
+    except ImportError as e:
+        # openpyxl (xlsx) / xlrd (xls) are optional
+        raise ValueError(f"Can't read {ext} files on this server: {e}")
@@ -0,0 +1,337 @@
+"""
+Background job queue for long-running model runs.
+
+Jobs are stored in a local SQLite database, so status and results
+survive restarts and are visible to every uvicorn worker. Each API
+process runs `concurrency` dispatcher threads. A dispatcher claims the
+oldest queued job and runs it in its own spawned process, which lets
+cancellation terminate a fit that is already running.
+
+Job lifecycle: queued -> running -> succeeded | failed | cancelled.
+A running job that stops sending heartbeats (its API process died) is
+picked up again by the next dispatcher that looks for work. While it
+runs, `stage` names the step it is in (STAGES) and `progress` is the
+share of steps already done; a failed job keeps the stage it failed in.
+
+Parameters are checked against JOB_PARAMS when a job is submitted, so a
+bad value is refused up front (InvalidParams) rather than failing the
+job later.
+"""
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from model_runner import FULL_MODELS, run_full_model
+from serialization import MAX_PAGE_SIZE, dumps, page_bounds
+from snapshot import SNAPSHOT_DIR, JSON_PATH
+
+ANALYTICS_DIR = os.path.dirname(os.path.abspath(__file__))
+JOBS_DB = os.environ.get('JOBS_DB', os.path.join(ANALYTICS_DIR, 'jobs.sqlite3'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+HEARTBEAT_SECONDS = 5
+STALE_SECONDS = 60
+
+FINISHED = ('succeeded', 'failed', 'cancelled')
+# Steps of a run: load the dataset, run the model, store the result
+STAGES = ('loading', 'running', 'saving')
+
+# model -> {parameter: allowed values}; None is a page cursor.
+# Mirrors the model functions' arguments (MAX_DAYS in forecasting,
+# PARAMS['max_horizon'] in demand_prediction, modes in clustering)
+PAGE_LIMITS = range(1, MAX_PAGE_SIZE + 1)
+JOB_PARAMS = {
+    'forecast': {'days': range(1, 366), 'order': ('fixed', 'auto')},
+    'churn': {'limit': PAGE_LIMITS, 'cursor': None},
+    'segments': {'mode': ('auto', 'full', 'minibatch')},
+    'demand': {'limit': PAGE_LIMITS, 'cursor': None, 'horizon': range(1, 7)},
+    'anomalies': {'limit': PAGE_LIMITS, 'cursor': None}
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    stage TEXT,
+    result TEXT,
+    error TEXT,
+    dataset_version TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class InvalidParams(ValueError):
+    """Raised when a job's parameters aren't ones its model takes"""
+
+
+def check_params(model, params):
+    """Raise InvalidParams unless every parameter is one `model` takes, with an allowed value"""
+    allowed = JOB_PARAMS[model]
+    for name, value in params.items():
+        if name not in allowed:
+            raise InvalidParams(f"{model} takes no parameter {name!r} (expected {', '.join(allowed) or 'none'})")
+        values = allowed[name]
+        if values is None:
+            try:
+                page_bounds(1, value)
+            except ValueError as e:
+                raise InvalidParams(str(e))
+        elif isinstance(value, bool) or not isinstance(value, type(values[0])) or value not in values:
+            if isinstance(values, range):
+                raise InvalidParams(f"{name} must be an integer between {values.start} and {values[-1]}")
+            raise InvalidParams(f"{name} must be one of {', '.join(values)}")
+
+
+def _job_process(conn, name, params, snapshot_dir, json_path):
+    """Child process: run one model and report its stages and result over the pipe"""
+    try:
+        result = run_full_model(name, params, snapshot_dir, json_path,
+                                on_stage=lambda stage: conn.send(('stage', stage)))
+        conn.send(('result', result))
+    except Exception as e:
+        conn.send(('error', f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+class JobQueue:
+    """SQLite-backed queue of model runs with in-process dispatchers"""
+
+    def __init__(self, db_path=JOBS_DB, concurrency=JOB_WORKERS,
+                 snapshot_dir=SNAPSHOT_DIR, json_path=JSON_PATH):
+        self.db_path = db_path
+        self.concurrency = concurrency
+        self.snapshot_dir = snapshot_dir
+        self.json_path = json_path
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._ctx = multiprocessing.get_context('spawn')
+
+        self._db = None
+
+    # -- storage ---------------------------------------------------------
+
+    def _connection(self):
+        """
+        The database connection, opened on first use (call with _lock held).
+        Opening lazily keeps the connection out of a preloading parent, so
+        every forked worker gets its own.
+        """
+        if self._db is None:
+            db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+            # Databases created before jobs had stages
+            if 'stage' not in [row['name'] for row in db.execute('PRAGMA table_info(jobs)')]:
+                db.execute('ALTER TABLE jobs ADD COLUMN stage TEXT')
+            self._db = db
+        return self._db
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            self._connection().execute(sql, args)
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._connection().execute(sql, args).fetchall()
+
+    def _update(self, job_id, **fields):
+        columns = ', '.join(f"{key} = ?" for key in fields)
+        self._execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        del job['heartbeat_at']
+        return job
+
+    def submit(self, model, params=None, dataset_version=None):
+        """
+        Queue a model run and return the job record. Raises ValueError for
+        an unknown model and InvalidParams for parameters it doesn't take.
+        """
+        if model not in FULL_MODELS:
+            raise ValueError(f"Unknown model: {model}")
+        check_params(model, params or {})
+
+        job_id = uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO jobs (id, model, params, status, dataset_version, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, model, json.dumps(params or {}), dataset_version, time.time())
+        )
+        self._wakeup.set()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """Job record as a dict, or None"""
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._to_dict(rows[0]) if rows else None
+
+    def list(self, status=None, limit=50):
+        """Most recent jobs, optionally filtered by status"""
+        if status:
+            rows = self._query(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)
+            )
+        else:
+            rows = self._query("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [self._to_dict(row) for row in rows]
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. Queued jobs are cancelled immediately; running jobs
+        are flagged and their process is terminated by the dispatcher.
+        Returns the updated record, or None if the job doesn't exist.
+        """
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+            (now, job_id)
+        )
+        self._execute("UPDATE jobs SET status = 'cancelling' WHERE id = ? AND status = 'running'", (job_id,))
+        return self.get(job_id)
+
+    def _claim(self):
+        """Atomically take the oldest runnable job (also across processes)"""
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' "
+                    "OR (status IN ('running', 'cancelling') AND heartbeat_at < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now - STALE_SECONDS,)
+                ).fetchone()
+                if row is None:
+                    db.execute('COMMIT')
+                    return None
+
+                status = 'cancelled' if row['status'] == 'cancelling' else 'running'
+                db.execute(
+                    "UPDATE jobs SET status = ?, progress = 0, stage = NULL, started_at = ?, heartbeat_at = ?, "
+                    "finished_at = CASE WHEN ? = 'cancelled' THEN ? END WHERE id = ?",
+                    (status, now, now, status, now, row['id'])
+                )
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+
+        return dict(row) if status == 'running' else self._claim()
+
+    # -- dispatching -----------------------------------------------------
+
+    def _run(self, job):
+        """Run one claimed job in a child process until it finishes or is cancelled"""
+        job_id = job['id']
+        params = tuple(sorted(json.loads(job['params']).items()))
+
+        parent, child = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=_job_process,
+            args=(child, job['model'], params, self.snapshot_dir, self.json_path),
+            daemon=True
+        )
+        process.start()
+        child.close()
+
+        outcome = None
+        last_beat = time.time()
+        while outcome is None:
+            if parent.poll(0.5):
+                try:
+                    kind, payload = parent.recv()
+                except EOFError:
+                    break
+                if kind == 'stage':
+                    self._enter(job_id, payload)
+                else:
+                    outcome = (kind, payload)
+            elif not process.is_alive():
+                break
+
+            if time.time() - last_beat >= HEARTBEAT_SECONDS:
+                last_beat = time.time()
+                self._update(job_id, heartbeat_at=last_beat)
+
+            if self._stop.is_set() or self.get(job_id)['status'] == 'cancelling':
+                process.terminate()
+                process.join()
+                if not self._stop.is_set():
+                    self._update(job_id, status='cancelled', finished_at=time.time())
+                return
+
+        process.join()
+        now = time.time()
+        if outcome is None:
+            self._update(job_id, status='failed', finished_at=now,
+                         error=f"Worker exited with code {process.exitcode}")
+        elif outcome[0] == 'error':
+            self._update(job_id, status='failed', finished_at=now, error=outcome[1])
+        else:
+            result = outcome[1]
+            self._enter(job_id, 'saving')
+            self._update(job_id, status='succeeded', progress=1.0, finished_at=time.time(),
+                         result=dumps(result).decode('utf-8'), dataset_version=result.get('dataset_version'))
+
+    def _enter(self, job_id, stage):
+        self._update(job_id, stage=stage, progress=STAGES.index(stage) / len(STAGES))
+
+    def _dispatch(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"⚠️ Job queue error: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(timeout=HEARTBEAT_SECONDS)
+                self._wakeup.clear()
+                continue
+
+            try:
+                self._run(job)
+            except Exception as e:
+                self._update(job['id'], status='failed', finished_at=time.time(), error=str(e))
+
+    def start(self):
+        """Start the dispatcher threads"""
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._dispatch, name=f'job-dispatcher-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Stop dispatching; running jobs are left for the next start to pick up"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=HEARTBEAT_SECONDS)
+        self._threads = []
+
+    def status(self):
+        rows = self._query("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")
+        return {'workers': self.concurrency, **{row['status']: row['n'] for row in rows}}
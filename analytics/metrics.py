@@ -0,0 +1,208 @@
+"""
+Request metrics for the ML API in Prometheus text format.
+
+Kept dependency-free: a histogram is a list of bucket counts behind a
+lock, and everything that already has its own counters (result cache,
+dataset store, model pool, job queue) is read through collector
+callbacks only when /metrics is scraped. The per-request cost is one
+ASGI wrapper, two perf_counter() calls and one histogram update.
+
+Exposed series:
+
+    ml_http_request_duration_seconds{method,route,status}   histogram
+    ml_http_requests_in_flight                                gauge
+    ml_phase_duration_seconds{endpoint,phase}                 histogram (compute / serialize)
+    ml_dataset_load_duration_seconds                          histogram
+    ml_dataset_rows{table}, ml_dataset_bytes{table}           gauges
+    ml_cache_hits_total, ml_cache_misses_total, ml_cache_hit_ratio, ...
+"""
+import bisect
+import threading
+import time
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LOAD_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+
+        for labels, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                le = (('le', _number(bound)),)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def render_family(name, kind, documentation, samples):
+    """Text lines for one metric family from [(labels dict, value)]"""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        if value is None:
+            continue
+        lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+    return lines
+
+
+class Metrics:
+    """Histograms owned by the API plus collectors for everything else"""
+
+    def __init__(self):
+        self.request_duration = Histogram(
+            'ml_http_request_duration_seconds', 'HTTP request latency', ('method', 'route', 'status'))
+        self.phase_duration = Histogram(
+            'ml_phase_duration_seconds', 'Time spent computing and serializing ML results', ('endpoint', 'phase'))
+        self.dataset_load_duration = Histogram(
+            'ml_dataset_load_duration_seconds', 'Time to load a dataset version', buckets=LOAD_BUCKETS)
+
+        self.in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._dataset = {}
+        self._collectors = []
+
+    def add_collector(self, collector):
+        """collector() -> [(name, kind, help, [(labels, value)])], called on every scrape"""
+        self._collectors.append(collector)
+
+    def observe_phase(self, endpoint, phase, seconds):
+        self.phase_duration.observe(seconds, endpoint, phase)
+
+    def dataset_loaded(self, data, version, load_seconds):
+        """Record load time and per-table size of a newly loaded dataset"""
+        if load_seconds is not None:
+            self.dataset_load_duration.observe(load_seconds)
+
+        tables = {}
+        for table, frame in data.items():
+            if hasattr(frame, 'memory_usage'):
+                # deep=False: memory-mapped columns are not read just to be measured
+                tables[table] = (len(frame), int(frame.memory_usage(index=False, deep=False).sum()))
+        self._dataset = {'version': version, 'loaded_at': time.time(), 'tables': tables}
+
+    def _track(self, delta):
+        with self._in_flight_lock:
+            self.in_flight += delta
+
+    def render(self):
+        lines = []
+        lines += self.request_duration.render()
+        lines += render_family('ml_http_requests_in_flight', 'gauge',
+                               'Requests currently being handled', [({}, self.in_flight)])
+        lines += self.phase_duration.render()
+        lines += self.dataset_load_duration.render()
+
+        tables = self._dataset.get('tables', {})
+        lines += render_family('ml_dataset_rows', 'gauge', 'Rows per table in the loaded dataset',
+                               [({'table': t}, rows) for t, (rows, _) in sorted(tables.items())])
+        lines += render_family('ml_dataset_bytes', 'gauge', 'In-memory size per table of the loaded dataset',
+                               [({'table': t}, size) for t, (_, size) in sorted(tables.items())])
+        if self._dataset:
+            lines += render_family('ml_dataset_info', 'gauge', 'Loaded dataset version',
+                                   [({'version': self._dataset['version']}, 1)])
+            lines += render_family('ml_dataset_loaded_timestamp_seconds', 'gauge',
+                                   'When the current dataset was loaded', [({}, self._dataset['loaded_at'])])
+
+        for collector in self._collectors:
+            try:
+                for family in collector():
+                    lines += render_family(*family)
+            except Exception as e:
+                lines.append(f"# collector failed: {_escape(e)}")
+
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware timing every HTTP request, labelled by route
+    template (not raw path) so job ids don't explode the label set.
+    Optionally hands requests to a RequestProfiler.
+    """
+
+    def __init__(self, app, metrics, profiler=None):
+        self.app = app
+        self.metrics = metrics
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        capture = None
+        if self.profiler is not None and self.profiler.should_profile(scope):
+            capture = self.profiler.begin()
+
+        self.metrics._track(1)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            seconds = time.perf_counter() - started
+            self.metrics._track(-1)
+            route = _route_template(scope)
+            self.metrics.request_duration.observe(seconds, scope['method'], route, str(status[0]))
+            if capture is not None:
+                self.profiler.finish(capture, scope['method'], route, scope['path'], seconds)
+
+
+def _route_template(scope):
+    route = scope.get('route')
+    if route is not None:
+        return route.path
+
+    # Older FastAPI versions don't put the route in the scope
+    app = scope.get('app')
+    for candidate in getattr(getattr(app, 'router', None), 'routes', ()):
+        match, _ = candidate.matches(scope)
+        if match.name == 'FULL':
+            return getattr(candidate, 'path', 'unmatched')
+    return 'unmatched'
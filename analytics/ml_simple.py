@@ -1,54 +1,62 @@
-import json
 import numpy as np
-import os
+import pandas as pd
+
+from backtesting import latest_scores
+from feature_store import customer_features
+from rollups import rollup_series
+from serialization import paginate
+from snapshot import SNAPSHOT_DIR, JSON_PATH, load_dataset
+
+# Recency bucket edges (days) for Champions/Loyal, Loyal/At-Risk, At-Risk/Lost
+SEGMENT_EDGES = [30, 60, 90]
+SEGMENT_NAMES = ['Champions', 'Loyal', 'At-Risk', 'Lost']
 
 def load_data():
-    """Load processed Kaggle data"""
+    """Load processed Kaggle data (columnar snapshot, JSON fallback)"""
     try:
-        # Get the absolute path to data file
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(current_dir)
-        data_path = os.path.join(project_root, 'database', 'datasets', 'processed_data.json')
-        
-        print(f"Looking for data at: {data_path}")
+        print(f"Looking for data at: {SNAPSHOT_DIR}")
         
-        if not os.path.exists(data_path):
+        data = load_dataset()
+        if data is None:
             print("⚠️ Data file not found!")
-            print(f"Expected location: {data_path}")
+            print(f"Expected location: {SNAPSHOT_DIR} or {JSON_PATH}")
             print("Run: python scripts/import-kaggle-data.py")
             return None
         
-        with open(data_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            print(f"✅ Data loaded successfully: {len(data.get('sales', []))} sales records")
-            return data
+        print(f"✅ Data loaded successfully: {len(data['sales'])} sales records")
+        return data
             
     except Exception as e:
         print(f"Error loading data: {e}")
         return None
 
-def simple_forecast(data):
-    """ARIMA-style Sales Forecasting"""
+def column(table, name, default=0):
+    """A table column as a float array (zero-copy for numeric columns)"""
+    if name not in table.columns:
+        return np.full(len(table), default, dtype=float)
+    return np.asarray(table[name], dtype=float)
+
+def simple_forecast(data, days=28):
+    """ARIMA-style Sales Forecasting for the next `days` days"""
     if not data:
         return {'error': 'No data loaded', 'forecast': []}
     
     try:
-        sales = data['sales']
-        revenues = [s.get('total_amount', 0) for s in sales[-30:]]
+        # Last 30 days of revenue (not the last 30 invoices)
+        revenues = rollup_series(data).to_numpy()[-30:]
         
         avg = np.mean(revenues)
         trend = (revenues[-1] - revenues[0]) / len(revenues) if len(revenues) > 1 else 0
         
-        forecast = []
-        for day in range(28):
-            predicted = avg + (trend * day) + np.random.uniform(-avg*0.05, avg*0.05)
-            forecast.append(max(0, predicted))
+        noise = np.random.uniform(-avg*0.05, avg*0.05, size=days)
+        forecast = np.maximum(0, avg + trend * np.arange(days) + noise)
         
         return {
-            'forecast': [round(f, 2) for f in forecast],
-            'total_predicted_revenue': round(sum(forecast), 2),
-            'daily_average': round(avg, 2),
-            'accuracy': 87.0,
+            'forecast': np.round(forecast, 2).tolist(),
+            'total_predicted_revenue': round(float(forecast.sum()), 2),
+            'daily_average': round(float(avg), 2),
+            # Scored by backtesting as 'simple_trend' (the same model without the noise)
+            'backtest': latest_scores('simple_trend'),
             'model': 'ARIMA(5,1,2)'
         }
     except Exception as e:
@@ -60,13 +68,14 @@ def simple_churn(data):
         return {'error': 'No data loaded'}
     
     try:
-        customers = data['customers']
-        at_risk = [c for c in customers if c.get('days_since_last_order', 0) > 60]
+        # Same churn label (recency > CHURN_DAYS) the full model trains on
+        churned = customer_features(data)['churned']
+        at_risk = int(np.count_nonzero(churned))
         
         return {
-            'total_customers': len(customers),
-            'at_risk_count': len(at_risk),
-            'churn_rate': round((len(at_risk) / len(customers)) * 100, 2),
+            'total_customers': len(churned),
+            'at_risk_count': at_risk,
+            'churn_rate': round((at_risk / len(churned)) * 100, 2),
             'precision': 82.0,
             'model': 'Logistic Regression'
         }
@@ -79,22 +88,24 @@ def simple_segments(data):
         return {'error': 'No data loaded'}
     
     try:
-        customers = data['customers']
+        features = customer_features(data)
+        days = features['recency']
+        orders = features['frequency']
         
-        champions = [c for c in customers if c.get('days_since_last_order', 999) < 30 and c.get('order_count', 0) > 5]
-        loyal = [c for c in customers if 30 <= c.get('days_since_last_order', 999) < 60]
-        at_risk = [c for c in customers if 60 <= c.get('days_since_last_order', 999) < 90]
-        lost = [c for c in customers if c.get('days_since_last_order', 999) >= 90]
+        # One pass: bucket by recency, then drop recent customers with few
+        # orders (and unknown recency) into an extra bucket that isn't reported
+        buckets = np.digitize(days, SEGMENT_EDGES)
+        buckets[(buckets == 0) & ~(orders > 5)] = len(SEGMENT_NAMES)
+        buckets[np.isnan(days)] = len(SEGMENT_NAMES)
+        counts = np.bincount(buckets, minlength=len(SEGMENT_NAMES) + 1)
         
-        total = len(customers)
+        total = len(days)
         
         return {
             'total_customers': total,
             'segments': {
-                'Champions': {'count': len(champions), 'percentage': round((len(champions)/total)*100, 1)},
-                'Loyal': {'count': len(loyal), 'percentage': round((len(loyal)/total)*100, 1)},
-                'At-Risk': {'count': len(at_risk), 'percentage': round((len(at_risk)/total)*100, 1)},
-                'Lost': {'count': len(lost), 'percentage': round((len(lost)/total)*100, 1)}
+                name: {'count': int(counts[i]), 'percentage': round((int(counts[i])/total)*100, 1)}
+                for i, name in enumerate(SEGMENT_NAMES)
             },
             'silhouette_score': 0.68,
             'model': 'K-means'
@@ -102,28 +113,29 @@ def simple_segments(data):
     except Exception as e:
         return {'error': str(e)}
 
-def simple_demand(data):
+def simple_demand(data, limit=20, cursor=None):
     """XGBoost Demand Prediction"""
     if not data:
         return {'error': 'No data loaded'}
     
     try:
-        products = data['products'][:20]
+        products = data['products']
         
-        predictions = []
-        for p in products:
-            current = p.get('total_sold', 0)
-            predicted = int(current * 1.15)
-            
-            predictions.append({
-                'product_name': p.get('name', 'Unknown'),
-                'current_stock': current,
-                'predicted_demand': predicted,
-                'recommendation': 'Restock' if predicted > current * 0.5 else 'Sufficient'
-            })
+        current = column(products, 'total_sold').astype(int)
+        predicted = (current * 1.15).astype(int)
+        restock = predicted > current * 0.5
+        
+        predictions = pd.DataFrame({
+            'product_name': products['name'] if 'name' in products.columns else 'Unknown',
+            'current_stock': current,
+            'predicted_demand': predicted,
+            'recommendation': np.where(restock, 'Restock', 'Sufficient')
+        })
+        page, next_cursor = paginate(predictions, list(predictions.columns), limit, cursor)
         
         return {
-            'predictions': predictions,
+            'predictions': page,
+            'next_cursor': next_cursor,
             'rmse': 45.0,
             'model': 'XGBoost'
         }
@@ -136,19 +148,20 @@ def simple_anomalies(data):
         return {'error': 'No data loaded'}
     
     try:
-        sales = data['sales']
-        amounts = [s.get('total_amount', 0) for s in sales if s.get('total_amount', 0) > 0]
+        totals = column(data['sales'], 'total_amount')
+        positive = totals > 0
         
-        mean = np.mean(amounts)
-        std = np.std(amounts)
+        # Masked reductions instead of materializing the positive amounts
+        mean = np.mean(totals, where=positive)
+        std = np.std(totals, where=positive)
         threshold = mean + (3 * std)
         
-        anomalies = [s for s in sales if s.get('total_amount', 0) > threshold]
+        anomalies = int(np.count_nonzero(totals > threshold))
         
         return {
-            'total_transactions': len(sales),
-            'anomalies_detected': len(anomalies),
-            'percentage': round((len(anomalies) / len(sales)) * 100, 2),
+            'total_transactions': len(totals),
+            'anomalies_detected': anomalies,
+            'percentage': round((anomalies / len(totals)) * 100, 2),
             'model': 'Isolation Forest'
         }
     except Exception as e:
@@ -0,0 +1,132 @@
+"""
+Persisted model registry.
+
+Fitted models are stored with joblib next to a JSON metadata file:
+
+    trained_models/
+        churn/
+            <dataset_version>-<config_hash>.joblib
+            <dataset_version>-<config_hash>.json
+
+The metadata records the dataset version, feature list, hyperparameters
+and training metrics. A model is looked up by (name, dataset version,
+config), so serving only loads and predicts, and retraining happens only
+when the dataset version or the config changes.
+"""
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+
+import joblib
+
+ANALYTICS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.environ.get('MODEL_REGISTRY_DIR', os.path.join(ANALYTICS_DIR, 'trained_models'))
+KEEP_VERSIONS = 3
+
+
+def config_hash(params, features):
+    """Stable short hash of hyperparameters + feature list"""
+    payload = json.dumps({'params': params, 'features': features}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+
+def _paths(name, dataset_version, chash, models_dir):
+    base = os.path.join(models_dir, name, f"{dataset_version}-{chash}")
+    return base + '.joblib', base + '.json'
+
+
+def load_model(name, dataset_version, params, features, models_dir=MODELS_DIR):
+    """Return (model, metadata) for this dataset version and config, or None"""
+    model_path, meta_path = _paths(name, dataset_version, config_hash(params, features), models_dir)
+    if not (os.path.exists(model_path) and os.path.exists(meta_path)):
+        return None
+
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+    return joblib.load(model_path), metadata
+
+
+def save_model(name, model, metadata, models_dir=MODELS_DIR):
+    """Persist a fitted model and its metadata; returns the metadata"""
+    chash = config_hash(metadata['params'], metadata['features'])
+    model_path, meta_path = _paths(name, metadata['dataset_version'], chash, models_dir)
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+
+    metadata = {**metadata, 'name': name, 'config_hash': chash}
+
+    # Write to temp names first so a concurrent reader never sees half a model;
+    # per-process names, since several workers may train the same model
+    tmp = f".{os.getpid()}.tmp"
+    joblib.dump(model, model_path + tmp)
+    with open(meta_path + tmp, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2, default=str)
+    os.replace(model_path + tmp, model_path)
+    os.replace(meta_path + tmp, meta_path)
+
+    _prune(os.path.dirname(model_path))
+    return metadata
+
+
+def _prune(model_dir, keep=KEEP_VERSIONS):
+    """Keep the `keep` most recently trained models of one name"""
+    metas = sorted(
+        (os.path.join(model_dir, f) for f in os.listdir(model_dir) if f.endswith('.json')),
+        key=os.path.getmtime
+    )
+    for meta_path in metas[:-keep]:
+        for path in (meta_path, meta_path[:-len('.json')] + '.joblib'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def latest_model(name, params, features, models_dir=MODELS_DIR):
+    """
+    Most recently trained (model, metadata) with this config for any
+    dataset version, or None; used to warm-start a refit
+    """
+    model_dir = os.path.join(models_dir, name)
+    suffix = f"-{config_hash(params, features)}.json"
+    try:
+        metas = [os.path.join(model_dir, f) for f in os.listdir(model_dir) if f.endswith(suffix)]
+    except OSError:
+        return None
+
+    for meta_path in sorted(metas, key=os.path.getmtime, reverse=True):
+        model_path = meta_path[:-len('.json')] + '.joblib'
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            return joblib.load(model_path), metadata
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def train_model(name, data, params, features, train_fn, models_dir=MODELS_DIR):
+    """
+    Fit with train_fn(data, params) -> (model, metrics) and register it.
+    Returns (model, metadata).
+    """
+    started = time.perf_counter()
+    model, metrics = train_fn(data, params)
+    metadata = save_model(name, model, {
+        'dataset_version': data['metadata']['version'],
+        'features': features,
+        'params': params,
+        'metrics': metrics,
+        'trained_at': datetime.now().isoformat(),
+        'train_seconds': round(time.perf_counter() - started, 3)
+    }, models_dir)
+    return model, metadata
+
+
+def get_model(name, data, params, features, train_fn, models_dir=MODELS_DIR):
+    """Load the registered model for this dataset/config, training it if missing"""
+    found = load_model(name, data['metadata']['version'], params, features, models_dir)
+    if found is not None:
+        return found
+    return train_model(name, data, params, features, train_fn, models_dir)
@@ -0,0 +1,167 @@
+"""
+Runs the full (CPU-heavy) models in a bounded process pool.
+
+The ARIMA/XGBoost/K-means/Isolation Forest code takes seconds per call,
+so the API must not run it on the event loop. ModelRunner hands each run
+to a ProcessPoolExecutor and:
+
+- coalesces concurrent identical requests (same model, parameters and
+  dataset version) onto one computation,
+- refuses new work once `max_pending` distinct runs are queued or
+  running (ModelPoolSaturated), so callers can fall back or return 503,
+- stops waiting after `timeout` seconds (asyncio.TimeoutError) while the
+  run itself keeps going for anyone else waiting on it.
+
+Besides the full models the pool runs the batch forecast (POOL_MODELS),
+so /ml/forecast/batch shares the same bound instead of starting its own
+pool per request.
+
+Workers load the dataset themselves from the memory-mapped snapshot and
+keep it between runs, so nothing large is pickled across processes. A
+run can name another snapshot (an uploaded dataset, see dataset_cache);
+each worker keeps the last WORKER_DATASETS it used.
+Results come back as-is (NumPy values, serialization.Table pages) and
+are encoded to JSON once, by whoever consumes them.
+"""
+import asyncio
+import importlib
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from snapshot import SNAPSHOT_DIR, JSON_PATH, load_dataset, source_version
+
+ML_POOL_WORKERS = int(os.environ.get('ML_POOL_WORKERS', 2))
+ML_POOL_MAX_PENDING = int(os.environ.get('ML_POOL_MAX_PENDING', 8))
+ML_POOL_TIMEOUT = float(os.environ.get('ML_POOL_TIMEOUT', 30))
+# Datasets each worker keeps loaded between runs
+WORKER_DATASETS = int(os.environ.get('ML_POOL_WORKER_DATASETS', 4))
+
+# model name -> (module, function); functions take data= plus keyword params
+FULL_MODELS = {
+    'forecast': ('forecasting', 'forecast_sales'),
+    'churn': ('churn', 'predict_churn'),
+    'segments': ('clustering', 'segment_customers'),
+    'demand': ('demand_prediction', 'predict_demand'),
+    'anomalies': ('anomaly_detection', 'detect_anomalies')
+}
+
+# Everything the pool runs: the full models plus the batch forecast
+POOL_MODELS = {**FULL_MODELS, 'batch_forecast': ('batch_forecasting', 'batch_forecast')}
+
+
+class ModelPoolSaturated(Exception):
+    """Raised when the pool already has max_pending runs queued"""
+
+
+# Per-worker datasets by snapshot dir, each reused until its version changes
+_worker_data = OrderedDict()
+
+
+def _worker_dataset(snapshot_dir, json_path):
+    version = source_version(snapshot_dir, json_path)
+    cached = _worker_data.get(snapshot_dir)
+    if cached is None or cached[0] != version:
+        cached = (version, load_dataset(snapshot_dir, json_path))
+        _worker_data[snapshot_dir] = cached
+    _worker_data.move_to_end(snapshot_dir)
+    while len(_worker_data) > WORKER_DATASETS:
+        _worker_data.popitem(last=False)
+    return cached[1]
+
+
+def run_full_model(name, params, snapshot_dir=SNAPSHOT_DIR, json_path=JSON_PATH, on_stage=None):
+    """
+    Worker entry point: run one pool model on a snapshot's current dataset.
+    on_stage(stage) is called as the run enters 'loading' and 'running'.
+    """
+    on_stage = on_stage or (lambda stage: None)
+    module_name, function_name = POOL_MODELS[name]
+    model = getattr(importlib.import_module(module_name), function_name)
+
+    on_stage('loading')
+    data = _worker_dataset(snapshot_dir, json_path)
+    if data is None:
+        return {'error': 'No data loaded'}
+
+    on_stage('running')
+    result = model(data=data, **dict(params))
+    return {**result, 'dataset_version': data['metadata']['version']}
+
+
+class ModelRunner:
+    """Bounded, coalescing process pool for full model runs"""
+
+    def __init__(self, max_workers=ML_POOL_WORKERS, max_pending=ML_POOL_MAX_PENDING,
+                 timeout=ML_POOL_TIMEOUT, snapshot_dir=SNAPSHOT_DIR, json_path=JSON_PATH):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.snapshot_dir = snapshot_dir
+        self.json_path = json_path
+        self._executor = None
+        self._inflight = {}  # (name, params, version, source) -> asyncio.Future
+
+    def _pool(self):
+        if self._executor is None:
+            # spawn: the API process runs threads, which fork doesn't play well with
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    @property
+    def pending(self):
+        return len(self._inflight)
+
+    def submit(self, name, params, version, source=None):
+        """
+        Start (or join) a run and return its asyncio future. `source` is a
+        (snapshot_dir, json_path) pair to run on instead of the runner's own.
+        Must be called from the event loop thread.
+        """
+        source = source or (self.snapshot_dir, self.json_path)
+        key = (name, tuple(sorted(params)), version, source)
+        future = self._inflight.get(key)
+        if future is not None:
+            return future
+
+        if len(self._inflight) >= self.max_pending:
+            raise ModelPoolSaturated(f"{len(self._inflight)} model runs already pending")
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._pool(), run_full_model, name, key[1], *source
+        )
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return future
+
+    async def run(self, name, params, version, on_result=None, source=None):
+        """
+        Run a full model, waiting at most `timeout` seconds for it.
+        on_result(result) is also called when the run succeeds after the
+        caller has given up, so the work isn't wasted.
+        """
+        future = self.submit(name, params, version, source)
+        if on_result is not None:
+            future.add_done_callback(
+                lambda f: on_result(f.result()) if not f.cancelled() and f.exception() is None else None
+            )
+        # shield: a timed-out caller must not cancel the run for others
+        return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+
+    def status(self):
+        return {
+            'workers': self.max_workers,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'timeout_seconds': self.timeout
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
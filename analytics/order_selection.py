@@ -0,0 +1,270 @@
+"""
+Automatic ARIMA order selection, with fits cached per series and
+dataset version and warm-started refits when new days arrive.
+
+select_order() searches (p, d, q) x seasonal (P, D, Q, SEASON):
+
+- d comes from a KPSS test and D from the series' seasonal strength
+  (STL), so only the AR/MA orders are searched
+- candidates are fitted in waves, each wave spread across worker
+  processes: the start points first, then the neighbours (one AR/MA term
+  more or less) of the last wave's candidates whose AIC is within
+  PRUNE_AIC of the best so far. Everything else is pruned, and the search stops once a
+  wave doesn't improve on the best AIC or MAX_FITS fits have run.
+- search fits stop after SEARCH_MAXITER iterations; the winner is refit
+  to convergence from its search parameters
+
+fit_series() registers the chosen order and fitted model per series and
+dataset version (model registry, one directory per series). For a new
+dataset version it starts from the series' last registered fit when the
+old history is a prefix of the new one:
+
+- up to APPEND_DAYS days since the parameters were estimated: the new
+  days are appended to the state-space model, parameters unchanged
+- more: the parameters are re-estimated starting from the previous ones
+- RESELECT_DAYS days after the order was chosen, or when history
+  changed, the order is searched again
+"""
+import itertools
+import multiprocessing
+import os
+import re
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from model_registry import latest_model, load_model, save_model
+
+SEASON = 7
+MAX_P = 5
+MAX_Q = 5
+MAX_SEASONAL = 1     # largest seasonal P and Q
+MAX_D = 2
+SEASONAL_STRENGTH = 0.64   # seasonal differencing above this STL strength
+PRUNE_AIC = 2.0
+MAX_FITS = 40
+SEARCH_MAXITER = 20
+APPEND_DAYS = int(os.environ.get('ARIMA_APPEND_DAYS', 14))
+RESELECT_DAYS = int(os.environ.get('ARIMA_RESELECT_DAYS', 90))
+SELECTION_WORKERS = int(os.environ.get('ARIMA_SELECTION_WORKERS', min(4, os.cpu_count() or 1)))
+FEATURES = ['revenue']
+
+# (p, q, P, Q) start points of the search
+START_POINTS = [(0, 0, 0, 0), (1, 0, 0, 0), (0, 1, 0, 0), (2, 2, 0, 0), (1, 1, 1, 1)]
+
+
+def differencing(values, max_d=MAX_D):
+    """Non-seasonal differences needed for the KPSS test to accept stationarity (5%)"""
+    from statsmodels.tsa.stattools import kpss
+
+    for d in range(max_d + 1):
+        if len(values) < 10 or np.ptp(values) == 0:
+            return d
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            p_value = kpss(values, regression='c', nlags='auto')[1]
+        if p_value >= 0.05:
+            return d
+        values = np.diff(values)
+    return max_d
+
+
+def seasonal_differencing(values, season=SEASON):
+    """1 if the STL seasonal component is strong, else 0"""
+    from statsmodels.tsa.seasonal import STL
+
+    if len(values) < 3 * season or np.ptp(values) == 0:
+        return 0
+    parts = STL(values, period=season, robust=True).fit()
+    adjusted = np.var(parts.seasonal + parts.resid)
+    strength = max(0.0, 1 - np.var(parts.resid) / adjusted) if adjusted > 0 else 0.0
+    return int(strength > SEASONAL_STRENGTH)
+
+
+def model_name(order, seasonal_order):
+    name = f"ARIMA({order[0]},{order[1]},{order[2]})"
+    if seasonal_order and any(seasonal_order[:3]):
+        name = 'S' + name + f"({seasonal_order[0]},{seasonal_order[1]},{seasonal_order[2]},{seasonal_order[3]})"
+    return name
+
+
+def fit_candidate(values, order, seasonal_order, maxiter=SEARCH_MAXITER):
+    """Worker: (order, seasonal_order, aic, params) of one capped fit; aic is inf if it fails"""
+    from statsmodels.tsa.arima.model import ARIMA
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            fitted = ARIMA(values, order=order, seasonal_order=seasonal_order).fit(
+                method_kwargs={'maxiter': maxiter}
+            )
+        aic = float(fitted.aic)
+        return order, seasonal_order, aic if np.isfinite(aic) else np.inf, np.asarray(fitted.params)
+    except Exception:
+        return order, seasonal_order, np.inf, None
+
+
+def _neighbours(point, seasonal):
+    limits = (MAX_P, MAX_Q, MAX_SEASONAL if seasonal else 0, MAX_SEASONAL if seasonal else 0)
+    for i, step in itertools.product(range(4), (-1, 1)):
+        moved = list(point)
+        moved[i] += step
+        if 0 <= moved[i] <= limits[i]:
+            yield tuple(moved)
+
+
+def select_order(values, n_jobs=SELECTION_WORKERS, season=SEASON):
+    """
+    Search ARIMA orders for a series by AIC.
+    Returns (order, seasonal_order, start params, search info).
+    """
+    started = time.perf_counter()
+    values = np.asarray(values, dtype=float)
+    d = differencing(values)
+    D = seasonal_differencing(values, season)
+    seasonal = len(values) >= 3 * season
+
+    def spec(point):
+        p, q, P, Q = point
+        return (p, d, q), ((P, D, Q, season) if seasonal and (P or D or Q) else (0, 0, 0, 0))
+
+    tried = {}
+    wave = [point for point in START_POINTS if seasonal or point[2:] == (0, 0)]
+    pool = ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context('spawn')) if n_jobs > 1 else None
+    try:
+        best = np.inf
+        while wave and len(tried) < MAX_FITS:
+            wave = wave[:MAX_FITS - len(tried)]
+            specs = [spec(point) for point in wave]
+            if pool is not None:
+                results = list(pool.map(fit_candidate, itertools.repeat(values), *zip(*specs)))
+            else:
+                results = [fit_candidate(values, *s) for s in specs]
+            for point, result in zip(wave, results):
+                tried[point] = result
+
+            wave_best = min(result[2] for result in results)
+            improved = wave_best < best
+            best = min(best, wave_best)
+            if not improved:
+                break
+
+            # Expand only around this wave's candidates close to the best; prune the rest
+            frontier = [point for point, result in zip(wave, results) if result[2] <= best + PRUNE_AIC]
+            wave = sorted({n for point in frontier for n in _neighbours(point, seasonal)} - set(tried))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    point = min(tried, key=lambda point: (tried[point][2], sum(point)))
+    order, seasonal_order, aic, params = tried[point]
+    if not np.isfinite(aic):
+        raise ValueError("No ARIMA order could be fitted")
+    return order, seasonal_order, params, {
+        'candidates_fitted': len(tried),
+        'search_aic': round(aic, 2),
+        'search_seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def _registry_name(key):
+    return 'arima-' + re.sub(r'[^A-Za-z0-9_.-]+', '_', str(key))
+
+
+def _fit(series, order, seasonal_order, start_params=None):
+    from statsmodels.tsa.arima.model import ARIMA
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return ARIMA(series, order=order, seasonal_order=seasonal_order).fit(start_params=start_params)
+
+
+def _extends(previous, info, series):
+    """New days appended to the previous fit's history, or None if history changed"""
+    old = np.asarray(previous.model.endog, dtype=float).ravel()
+    if info.get('history_start') != str(series.index[0].date()) or len(series) < len(old):
+        return None
+    if not np.allclose(series.to_numpy(dtype=float)[:len(old)], old):
+        return None
+    return series.iloc[len(old):]
+
+
+def _refit(previous, info, series):
+    """(fitted, how) from the series' previous fit, or None when the order must be searched again"""
+    new_days = _extends(previous, info, series)
+    if new_days is None or len(series) - info['selected_days'] >= RESELECT_DAYS:
+        return None
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if len(new_days) == 0:
+            return previous, 'reused'
+        if len(series) - info['fitted_days'] <= APPEND_DAYS:
+            # State-space append: filter the new days with the fitted parameters
+            return previous.append(new_days), 'append'
+        # Re-estimate, starting from the previous parameters
+        return previous.apply(series, refit=True), 'warm_refit'
+
+
+def fit_order(series, order=None, n_jobs=SELECTION_WORKERS):
+    """
+    Fit a series from scratch, without the registry: order=None searches
+    the order, a (p, d, q) tuple fits that order. Returns (fitted, info).
+    """
+    if order is None:
+        chosen, seasonal_order, start_params, search = select_order(np.asarray(series, dtype=float), n_jobs)
+    else:
+        chosen, seasonal_order, start_params, search = tuple(order), (0, 0, 0, 0), None, {}
+    fitted = _fit(series, chosen, seasonal_order, start_params)
+    return fitted, {**search, 'order': list(chosen), 'seasonal_order': list(seasonal_order),
+                    'selected_days': len(series), 'fitted_days': len(series)}
+
+
+def fit_series(key, series, version, order=None, n_jobs=SELECTION_WORKERS):
+    """
+    Fitted ARIMA results for one daily series (pandas Series with a daily
+    index) and its info: order, AIC and how it was fitted ('cached',
+    'reused', 'append', 'warm_refit', 'search' or 'fit'). order=None
+    searches the order; a (p, d, q) tuple fits that order.
+    """
+    name = _registry_name(key)
+    params = {'series': str(key), 'order': 'auto' if order is None else list(order), 'season': SEASON}
+    found = load_model(name, version, params, FEATURES)
+    if found is not None:
+        return found[0], {**found[1]['metrics'], 'fit': 'cached'}
+
+    started = time.perf_counter()
+    fitted = None
+    info = {}
+    previous = latest_model(name, params, FEATURES)
+    if previous is not None:
+        info = previous[1]['metrics']
+        refit = _refit(previous[0], info, series)
+        if refit is not None:
+            fitted, how = refit
+            info = {**info, 'fitted_days': len(series) if how == 'warm_refit' else info['fitted_days']}
+
+    if fitted is None:
+        fitted, info = fit_order(series, order, n_jobs)
+        how = 'search' if order is None else 'fit'
+
+    info = {
+        **info,
+        'model': model_name(info['order'], info['seasonal_order']),
+        'aic': round(float(fitted.aic), 2),
+        'history_start': str(series.index[0].date()),
+        'history_days': len(series),
+        'fit': how,
+        'fit_seconds': round(time.perf_counter() - started, 3)
+    }
+    save_model(name, fitted, {
+        'dataset_version': version,
+        'features': FEATURES,
+        'params': params,
+        'metrics': info,
+        'trained_at': datetime.now().isoformat(),
+        'train_seconds': info['fit_seconds']
+    })
+    return fitted, info
@@ -0,0 +1,209 @@
+"""
+Opt-in per-request profiler for the ML API.
+
+Off by default. When enabled, a request is profiled if it carries the
+X-Profile: 1 header (ML_PROFILE_HEADER=1) or is picked by random
+sampling (ML_PROFILE_SAMPLE_RATE, e.g. 0.01). Only the slowest
+ML_PROFILE_KEEP profiles are kept; they are listed at /metrics/profiles
+and, with ML_PROFILE_DIR set, also written there as .prof files
+(cProfile, open with pstats or snakeviz) or .txt (pyinstrument).
+
+Sync endpoints run in a thread pool, so the profiler is started inside
+the endpoint call itself (ProfiledRoute) rather than in the middleware.
+When profiling is disabled the routes are not wrapped at all.
+"""
+import asyncio
+import contextvars
+import cProfile
+import functools
+import heapq
+import io
+import itertools
+import os
+import pstats
+import random
+import threading
+import time
+
+from fastapi.routing import APIRoute
+
+PROFILE_HEADER = os.environ.get('ML_PROFILE_HEADER', '0') == '1'
+PROFILE_SAMPLE_RATE = float(os.environ.get('ML_PROFILE_SAMPLE_RATE', 0))
+PROFILE_KEEP = int(os.environ.get('ML_PROFILE_KEEP', 20))
+PROFILE_DIR = os.environ.get('ML_PROFILE_DIR')
+PROFILER = os.environ.get('ML_PROFILER', 'cprofile')   # or 'pyinstrument'
+TOP_FUNCTIONS = 25
+
+_capture = contextvars.ContextVar('ml_profile_capture', default=None)
+
+
+class _Capture:
+    """Filled in by the profiled endpoint, read back by the middleware"""
+
+    __slots__ = ('text', 'raw', 'token')
+
+    def __init__(self):
+        self.text = None
+        self.raw = None
+        self.token = None
+
+
+class RequestProfiler:
+    """Decides which requests to profile and keeps the slowest profiles"""
+
+    def __init__(self, header=PROFILE_HEADER, sample_rate=PROFILE_SAMPLE_RATE,
+                 keep=PROFILE_KEEP, output_dir=PROFILE_DIR, profiler=PROFILER):
+        self.header = header
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.output_dir = output_dir
+        self.profiler = profiler
+        self._slowest = []               # min-heap of (seconds, seq, profile)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.header or self.sample_rate > 0
+
+    def should_profile(self, scope):
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return True
+        if self.header:
+            return (b'x-profile', b'1') in scope.get('headers', ())
+        return False
+
+    def begin(self):
+        capture = _Capture()
+        capture.token = _capture.set(capture)
+        return capture
+
+    # -- capturing -------------------------------------------------------
+
+    def _start(self):
+        if self.profiler == 'pyinstrument':
+            from pyinstrument import Profiler
+            profiler = Profiler(async_mode='disabled')
+            profiler.start()
+            return profiler
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _stop(self, profiler, capture):
+        if self.profiler == 'pyinstrument':
+            profiler.stop()
+            capture.text = profiler.output_text(unicode=False, color=False)
+            capture.raw = capture.text
+            return
+
+        profiler.disable()
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        capture.text = out.getvalue()
+        capture.raw = profiler
+
+    def wrap(self, endpoint):
+        """Profile `endpoint` when the current request was picked for profiling"""
+        if asyncio.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def profiled(*args, **kwargs):
+                capture = _capture.get()
+                if capture is None:
+                    return await endpoint(*args, **kwargs)
+                profiler = self._try_start()
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    if profiler is not None:
+                        self._stop(profiler, capture)
+            return profiled
+
+        @functools.wraps(endpoint)
+        def profiled(*args, **kwargs):
+            capture = _capture.get()
+            if capture is None:
+                return endpoint(*args, **kwargs)
+            profiler = self._try_start()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                if profiler is not None:
+                    self._stop(profiler, capture)
+        return profiled
+
+    def _try_start(self):
+        try:
+            return self._start()
+        except (ValueError, ImportError) as e:
+            # Another profiler is already active in this thread, or pyinstrument is missing
+            print(f"⚠️ Request profiling skipped: {e}")
+            return None
+
+    def route_class(self):
+        """APIRoute subclass whose endpoints go through wrap()"""
+        profiler = self
+
+        class ProfiledRoute(APIRoute):
+            def __init__(self, path, endpoint, **kwargs):
+                super().__init__(path, profiler.wrap(endpoint), **kwargs)
+
+        return ProfiledRoute
+
+    # -- results ---------------------------------------------------------
+
+    def finish(self, capture, method, route, path, seconds):
+        """Keep the profile if it is among the slowest seen so far"""
+        _capture.reset(capture.token)
+        if capture.text is None:
+            return
+
+        profile = {
+            'method': method,
+            'route': route,
+            'path': path,
+            'seconds': round(seconds, 6),
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'profiler': self.profiler,
+            'stats': capture.text
+        }
+        with self._lock:
+            entry = (seconds, next(self._seq), profile)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, entry)
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+            else:
+                return
+
+        if self.output_dir:
+            self._dump(profile, capture.raw)
+
+    def _dump(self, profile, raw):
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = f"{profile['at'].replace(':', '')}-{profile['route'].strip('/').replace('/', '_') or 'root'}-{int(profile['seconds'] * 1000)}ms"
+        try:
+            if isinstance(raw, cProfile.Profile):
+                raw.dump_stats(os.path.join(self.output_dir, name + '.prof'))
+            else:
+                with open(os.path.join(self.output_dir, name + '.txt'), 'w', encoding='utf-8') as f:
+                    f.write(raw)
+        except OSError as e:
+            print(f"⚠️ Could not write profile: {e}")
+
+    def profiles(self):
+        """Kept profiles, slowest first"""
+        with self._lock:
+            return [profile for _, _, profile in sorted(self._slowest, reverse=True)]
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'header': self.header,
+            'sample_rate': self.sample_rate,
+            'profiler': self.profiler,
+            'kept': len(self._slowest),
+            'keep': self.keep
+        }
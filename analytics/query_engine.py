@@ -0,0 +1,252 @@
+"""
+Embedded SQL engine for ad-hoc dashboard aggregations.
+
+The loaded dataset is registered in an in-process analytical database
+(DuckDB when installed, otherwise in-memory SQLite) together with
+rollup tables computed once per dataset version:
+
+    daily_country     day x country:  revenue, quantity, invoices (from the rollup cube)
+    monthly_product   month x product: revenue, quantity
+    product_daily     day x product:   revenue, quantity
+    sales             one row per invoice (only for distinct customers
+                      or per-customer slices; SQLite loads it on first use)
+
+Every table carries day / week / month as ISO strings ('2011-03-07',
+week = its Monday, '2011-03'), so both backends share one dialect.
+
+Queries are not free-form SQL. A request names metrics, dimensions and
+filters, and run() picks the smallest table that can answer it and
+builds the statement from whitelisted identifiers with bound parameters:
+
+    engine.run(metrics=['revenue'], group_by=['country', 'month'],
+               filters={'country': ['France'], 'start': '2011-01-01'})
+"""
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from rollups import ALL, cube
+
+QUERY_BACKEND = os.environ.get('QUERY_ENGINE', 'auto')   # 'auto', 'duckdb' or 'sqlite'
+MAX_ROWS = 10000
+
+DIMENSIONS = {'country', 'product', 'customer', 'day', 'week', 'month'}
+TIME_DIMENSIONS = ('day', 'week', 'month')
+METRICS = {'revenue', 'quantity', 'invoices', 'customers'}
+
+# Tables in order of preference: (name, dimensions, {metric: expression}, date grain)
+SOURCES = [
+    ('monthly_product', {'product', 'month'},
+     {'revenue': 'SUM(revenue)', 'quantity': 'SUM(quantity)'}, 'month'),
+    ('product_daily', {'product', 'day', 'week', 'month'},
+     {'revenue': 'SUM(revenue)', 'quantity': 'SUM(quantity)'}, 'day'),
+    ('daily_country', {'country', 'day', 'week', 'month'},
+     {'revenue': 'SUM(revenue)', 'quantity': 'SUM(quantity)', 'invoices': 'SUM(invoices)'}, 'day'),
+    ('sales', {'country', 'customer', 'day', 'week', 'month'},
+     {'revenue': 'SUM(revenue)', 'quantity': 'SUM(quantity)', 'invoices': 'COUNT(*)',
+      'customers': 'COUNT(DISTINCT customer)'}, 'day'),
+]
+
+
+def _time_columns(dates):
+    """day / week (Monday) / month as ISO strings, formatted once per distinct day"""
+    codes, days = pd.factorize(np.asarray(dates, dtype='datetime64[D]'))
+    days = pd.DatetimeIndex(days)
+    weeks = days - pd.to_timedelta(days.dayofweek, unit='D')
+    return {
+        'day': days.strftime('%Y-%m-%d').to_numpy()[codes],
+        'week': weeks.strftime('%Y-%m-%d').to_numpy()[codes],
+        'month': days.strftime('%Y-%m').to_numpy()[codes]
+    }
+
+
+def build_rollups(data):
+    """Rollup tables for one dataset, each a DataFrame"""
+    table = cube(data)
+    daily = table[np.asarray((table['grain'] == 'day') & (table['country'] != ALL))]
+    daily_country = pd.DataFrame({
+        **_time_columns(daily['period']),
+        'country': daily['country'].astype(str).to_numpy(),
+        'revenue': daily['revenue'].to_numpy(),
+        'quantity': daily['quantity'].to_numpy(),
+        'invoices': daily['invoices'].to_numpy()
+    })
+
+    product_daily = data['product_daily']
+    by_product = pd.DataFrame({
+        **_time_columns(product_daily['date']),
+        'product': product_daily['product_id'].astype(str).to_numpy(),
+        'revenue': product_daily['revenue'].to_numpy(),
+        'quantity': product_daily['quantity'].to_numpy()
+    })
+    monthly_product = by_product.groupby(['month', 'product'], sort=True).agg(
+        revenue=('revenue', 'sum'),
+        quantity=('quantity', 'sum')
+    ).reset_index()
+
+    return {'daily_country': daily_country, 'monthly_product': monthly_product, 'product_daily': by_product}
+
+
+def sales_table(data):
+    """Invoice-level table with the engine's column names"""
+    sales = data['sales']
+    return pd.DataFrame({
+        **_time_columns(sales['InvoiceDate']),
+        'country': sales['Country'].astype(str).to_numpy(),
+        'customer': sales['CustomerID'].to_numpy(),
+        'revenue': sales['total_amount'].to_numpy(),
+        'quantity': sales['Quantity'].to_numpy()
+    })
+
+
+def _duckdb():
+    """The duckdb module, imported on first use, or None if it isn't installed"""
+    try:
+        import duckdb
+    except ImportError:
+        return None
+    return duckdb
+
+
+class QueryError(ValueError):
+    """Invalid query request"""
+
+
+class QueryEngine:
+    """One dataset version registered in DuckDB or in-memory SQLite"""
+
+    def __init__(self, data, backend=QUERY_BACKEND):
+        duckdb = _duckdb() if backend in ('auto', 'duckdb') else None
+        if backend == 'auto':
+            backend = 'duckdb' if duckdb is not None else 'sqlite'
+        if backend == 'duckdb' and duckdb is None:
+            raise ImportError('duckdb is not installed')
+
+        self.backend = backend
+        self.version = data['metadata'].get('version')
+        self._data = data
+        self._lock = threading.Lock()
+        self._loaded = set()
+
+        started = time.perf_counter()
+        self.tables = build_rollups(data)
+        if backend == 'duckdb':
+            self._db = duckdb.connect(':memory:')
+        else:
+            import sqlite3
+            self._db = sqlite3.connect(':memory:', check_same_thread=False)
+        for name, frame in self.tables.items():
+            self._register(name, frame)
+        self.build_seconds = round(time.perf_counter() - started, 3)
+
+    def _register(self, name, frame):
+        if self.backend == 'duckdb':
+            # Registered frames are scanned in place, not copied
+            self._db.register(name, frame)
+        else:
+            frame.to_sql(name, self._db, index=False)
+            for column in ('day', 'month'):
+                if column in frame.columns:
+                    self._db.execute(f'CREATE INDEX {name}_{column} ON {name} ({column})')
+        self._loaded.add(name)
+
+    def _ensure(self, name):
+        if name not in self._loaded:
+            self.tables[name] = sales_table(self._data)
+            self._register(name, self.tables[name])
+
+    # -- query building --------------------------------------------------
+
+    @staticmethod
+    def choose_source(metrics, dimensions, filters):
+        """First source with every metric, dimension and filter; month-grain only for month filters"""
+        needed = set(dimensions) | {f for f in ('country', 'product', 'customer') if filters.get(f)}
+        day_filter = any(len(str(filters.get(f) or '')) > 7 for f in ('start', 'end'))
+
+        for name, dims, expressions, grain in SOURCES:
+            if not needed <= dims or not set(metrics) <= set(expressions):
+                continue
+            if grain == 'month' and day_filter:
+                continue
+            return name, expressions, grain
+        raise QueryError(f"No table has {', '.join(sorted(needed)) or 'no dimensions'} "
+                         f"with {', '.join(metrics)}")
+
+    def build(self, metrics, group_by=(), filters=None, order_by=None, descending=True, limit=100):
+        """(sql, params, source) for a validated request"""
+        filters = filters or {}
+        metrics = list(metrics) or ['revenue']
+        group_by = list(group_by)
+
+        unknown = (set(metrics) - METRICS) | (set(group_by) - DIMENSIONS)
+        if unknown:
+            raise QueryError(f"Unknown metric or dimension: {', '.join(sorted(unknown))}")
+        if len(set(group_by) & set(TIME_DIMENSIONS)) > 1:
+            raise QueryError('Group by at most one of day, week, month')
+
+        source, expressions, grain = self.choose_source(metrics, group_by, filters)
+
+        where, params = [], []
+        for dimension in ('country', 'product', 'customer'):
+            values = filters.get(dimension)
+            if values:
+                values = values if isinstance(values, (list, tuple)) else [values]
+                where.append(f"{dimension} IN ({', '.join('?' * len(values))})")
+                params += [float(v) if dimension == 'customer' else str(v) for v in values]
+
+        column = 'month' if grain == 'month' else 'day'
+        for name, op in (('start', '>='), ('end', '<=')):
+            value = filters.get(name)
+            if value:
+                where.append(f"{column} {op} ?")
+                value = str(value)
+                if column == 'month':
+                    value = value[:7]
+                elif name == 'end' and len(value) == 7:
+                    value += '-31'   # a whole month, compared as a string
+                params.append(value)
+
+        select = group_by + [f"{expressions[m]} AS {m}" for m in metrics]
+        sql = f"SELECT {', '.join(select)} FROM {source}"
+        if where:
+            sql += f" WHERE {' AND '.join(where)}"
+        if group_by:
+            sql += f" GROUP BY {', '.join(group_by)}"
+
+        order_by = order_by or (group_by[0] if group_by and group_by[0] in TIME_DIMENSIONS else metrics[0])
+        if order_by not in metrics and order_by not in group_by:
+            raise QueryError('order_by must be one of the metrics or group_by columns')
+        sql += f" ORDER BY {order_by} {'DESC' if descending else 'ASC'}"
+        sql += f" LIMIT {max(1, min(int(limit), MAX_ROWS))}"
+        return sql, params, source
+
+    def run(self, metrics, group_by=(), filters=None, order_by=None, descending=True, limit=100):
+        """Run an aggregation; returns {'columns', 'rows', 'source', 'elapsed_ms', ...}"""
+        sql, params, source = self.build(metrics, group_by, filters, order_by, descending, limit)
+
+        started = time.perf_counter()
+        with self._lock:
+            self._ensure(source)
+            cursor = self._db.execute(sql, params)
+            columns = [d[0] for d in cursor.description]
+            rows = cursor.fetchall()
+
+        return {
+            'columns': columns,
+            'rows': [[v.item() if isinstance(v, np.generic) else v for v in row] for row in rows],
+            'source': source,
+            'engine': self.backend,
+            'dataset_version': self.version,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)
+        }
+
+    def status(self):
+        return {
+            'engine': self.backend,
+            'dataset_version': self.version,
+            'build_seconds': self.build_seconds,
+            'tables': {name: len(frame) for name, frame in self.tables.items()}
+        }
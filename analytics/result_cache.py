@@ -0,0 +1,107 @@
+"""
+Versioned result cache for the ML API.
+
+Results are keyed by (endpoint, query parameters, dataset version), so a
+new dataset version makes old entries unreachable without any explicit
+invalidation. Entries hold the already-encoded JSON body plus an ETag
+derived from the key, which lets clients revalidate with If-None-Match
+and get a 304 without the endpoint recomputing anything.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 256))
+
+
+class CacheEntry:
+    """Encoded response body and its ETag, plus compressed variants"""
+
+    __slots__ = ('body', 'etag', 'variants')
+
+    def __init__(self, body, etag):
+        self.body = body
+        self.etag = etag
+        self.variants = {}
+
+    def variant(self, encoding, encode):
+        """(body, etag) in a content encoding, encoding it on first use"""
+        if encoding is None:
+            return self.body, self.etag
+
+        body = self.variants.get(encoding)
+        if body is None:
+            body = self.variants[encoding] = encode(self.body, encoding)
+        # Each representation needs its own strong ETag
+        return body, f'{self.etag[:-1]}-{encoding}"'
+
+
+def make_etag(endpoint, params, version):
+    digest = hashlib.sha1(f"{endpoint}|{params}|{version}".encode('utf-8')).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+class ResultCache:
+    """Thread-safe LRU of CacheEntry objects bounded by entry count"""
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(endpoint, params, version):
+        return (endpoint, tuple(sorted(params)), version)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, endpoint, params, version, compute):
+        """
+        Return the cached entry for this key, or call compute() -> (body,
+        cacheable) and store the result if it is cacheable.
+        """
+        key = self.key(endpoint, params, version)
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+
+        body, cacheable = compute()
+        entry = CacheEntry(body, make_etag(*key))
+        if cacheable and version is not None:
+            self.put(key, entry)
+        return entry
+
+    def evict(self, version):
+        """Drop entries computed for one dataset version"""
+        with self._lock:
+            for key in [k for k in self._entries if k[2] == version]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0
+            }
@@ -0,0 +1,163 @@
+"""
+Fast JSON encoding for ML results.
+
+Results are encoded with orjson, which writes NumPy arrays and scalars
+and datetimes natively, instead of walking them with jsonable_encoder.
+(The stdlib json module is used if orjson isn't installed.)
+
+List-shaped results (at-risk customers, top anomalies, demand
+predictions) are built as a Table: the selected column arrays of a
+DataFrame page. No per-row dicts are built until encoding, and the
+client can pick one of two shapes:
+
+    records  [{"customer_id": 1, "recency": 3}, ...]        (default)
+    columns  {"columns": ["customer_id", "recency"], "rows": [[1, 3], ...]}
+
+Top-k lists are paginated with limit / cursor instead of a fixed
+head(n). Encoded bodies can be compressed with gzip, or brotli when
+the Brotli package is installed.
+"""
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    # orjson is in requirements.txt; stay importable without it
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SHAPES = ('records', 'columns')
+MAX_PAGE_SIZE = 1000
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _column_list(values):
+    """One column as a list of JSON-ready Python values"""
+    if isinstance(values, pd.Categorical) or isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        values = np.asarray(values, dtype=object)
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return np.datetime_as_string(values, unit='s').tolist()
+    return values.tolist()
+
+
+class Table:
+    """A page of column arrays, encoded as records or {columns, rows}"""
+
+    __slots__ = ('columns', 'arrays')
+
+    def __init__(self, columns, arrays):
+        self.columns = list(columns)
+        self.arrays = list(arrays)
+
+    @classmethod
+    def from_frame(cls, frame, columns=None):
+        columns = list(columns or frame.columns)
+        return cls(columns, [frame[c].array for c in columns])
+
+    def __len__(self):
+        return len(self.arrays[0]) if self.arrays else 0
+
+    def rows(self):
+        return list(zip(*(_column_list(a) for a in self.arrays)))
+
+    def records(self):
+        return [dict(zip(self.columns, row)) for row in self.rows()]
+
+    def to_json(self, shape='records'):
+        if shape == 'columns':
+            return {'columns': self.columns, 'rows': self.rows()}
+        return self.records()
+
+
+def page_bounds(limit, cursor):
+    """(offset, limit) from request values; the cursor is the next offset"""
+    try:
+        offset = int(cursor) if cursor not in (None, '') else 0
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if offset < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return offset, max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def paginate(frame, columns, limit, cursor=None, by=None, ascending=False):
+    """
+    One page of `frame` as a Table plus the cursor of the next page (or
+    None). With `by`, rows are ranked by that column and only the first
+    offset + limit are selected (nlargest / nsmallest), not a full sort.
+    """
+    offset, limit = page_bounds(limit, cursor)
+    end = offset + limit
+
+    if by is not None:
+        top = frame.nsmallest(end, by) if ascending else frame.nlargest(end, by)
+        page = top.iloc[offset:end]
+    else:
+        page = frame.iloc[offset:end]
+
+    next_cursor = str(end) if len(frame) > end else None
+    return Table.from_frame(page, columns), next_cursor
+
+
+def _default(shape):
+    def default(value):
+        if isinstance(value, Table):
+            return value.to_json(shape)
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, np.ndarray):
+            return _column_list(value)
+        if isinstance(value, (pd.Series, pd.Index, pd.Categorical)):
+            return _column_list(value)
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+    return default
+
+
+def dumps(obj, shape='records', indent=False):
+    """Encode a result to JSON bytes; Tables are written in `shape`"""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default(shape), option=option)
+    return json.dumps(obj, default=_default(shape), indent=2 if indent else None).encode('utf-8')
+
+
+def loads(body):
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+def accepted_encoding(accept_encoding):
+    """Best compression the client accepts: 'br', 'gzip' or None"""
+    accepted = set()
+    for part in (accept_encoding or '').lower().split(','):
+        name, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(name.strip())
+
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
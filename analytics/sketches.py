@@ -0,0 +1,482 @@
+"""
+Mergeable sketches over sales: distinct counts, heavy hitters and
+amount quantiles in constant memory.
+
+- HyperLogLog: distinct customers and invoices (2**14 one-byte
+  registers, ~0.8% relative error)
+- Count-Min + top-k: heavy-hitter products by units sold and countries
+  by revenue (returns and refunds are not counted)
+- t-digest: quantiles of invoice total_amount, most accurate in the tails
+
+The importer builds one set per calendar month ('sketches' in the
+snapshot, next to the rollup cube). Every sketch merges with another of
+its kind, so a date range is answered by merging its months, and sales
+are sketched a block of rows at a time, merging as they go. Product
+sketches are built per batch of chunks as the importer reads them, and
+a delta's sketches are merged into the stored months
+(update_sketches). Queries only ever touch the sketches, never the
+sales.
+
+Ranges are whole months: start and end select the months they fall in.
+Datasets written before sketches existed get them built from sales on
+first use, once per dataset version.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from rollups import period_starts
+
+HLL_PRECISION = 14
+CMS_WIDTH = 2048
+CMS_DEPTH = 4
+# Heavy-hitter candidates kept per sketch; top-n queries return at most this many
+TOP_K = 100
+TDIGEST_COMPRESSION = 200
+# Sales rows sketched at a time
+BLOCK_ROWS = 100_000
+DIMENSIONS = {'products': 'quantity', 'countries': 'revenue'}
+# Dataset versions whose sketches are kept built at once
+CACHED_VERSIONS = 4
+
+# dataset version -> sketch arrays built from sales, for datasets without them, oldest first
+_built = {}
+
+
+def hash64(values):
+    """64-bit hashes of keys, the same in every process and run"""
+    return pd.util.hash_array(np.asarray(values))
+
+
+def _keys(values):
+    return np.asarray(values).astype(str).astype(object)
+
+
+class HyperLogLog:
+    """Distinct count estimate from 2**precision registers"""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def add(self, values):
+        hashes = hash64(values)
+        if not len(hashes):
+            return
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype(np.intp)
+        rest = hashes & np.uint64((1 << (64 - p)) - 1)
+        # Rank = leading zeros of the remaining 64 - p bits, plus one. They fit
+        # a float exactly, so frexp's exponent is their bit length.
+        _, bits = np.frexp(rest.astype(float))
+        rank = (64 - p + 1 - bits).astype(np.uint8)
+
+        registers = np.array(self.registers)
+        np.maximum.at(registers, index, rank)
+        self.registers = registers
+
+    def merge(self, other):
+        return HyperLogLog(self.precision, np.maximum(self.registers, other.registers))
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(int)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small sets
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class CountMinSketch:
+    """Per-key weight totals, overestimated by at most ~e/width of the total weight"""
+
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH, table=None):
+        self.table = np.zeros((depth, width)) if table is None else table
+
+    def _cells(self, keys):
+        hashes = hash64(keys)
+        depth, width = self.table.shape
+        # Double hashing: row i uses h1 + i * h2
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(depth, dtype=np.uint64)[:, None]
+        return ((h1[None, :] + rows * h2[None, :]) % np.uint64(width)).astype(np.intp)
+
+    def add(self, keys, weights):
+        cells = self._cells(keys)
+        depth, width = self.table.shape
+        self.table = self.table + np.stack([
+            np.bincount(cells[row], weights=weights, minlength=width) for row in range(depth)
+        ])
+
+    def estimate(self, keys):
+        cells = self._cells(keys)
+        return self.table[np.arange(self.table.shape[0])[:, None], cells].min(axis=0)
+
+    def merge(self, other):
+        return CountMinSketch(table=self.table + other.table)
+
+
+def _ranked(keys, estimates):
+    """Order of keys by estimate, largest first; ties by key, so merge order doesn't matter"""
+    return np.lexsort((_keys(keys), -np.asarray(estimates)))
+
+
+class HeavyHitters:
+    """Count-Min sketch plus the `capacity` keys with the largest estimates"""
+
+    def __init__(self, capacity=TOP_K, sketch=None, keys=()):
+        self.capacity = capacity
+        self.sketch = sketch if sketch is not None else CountMinSketch()
+        self.keys = np.asarray(keys, dtype=object)
+
+    def add(self, keys, weights):
+        weights = np.asarray(weights, dtype=float)
+        counted = weights > 0
+        totals = pd.Series(weights[counted]).groupby(_keys(keys)[counted], sort=False).sum()
+        if totals.empty:
+            return
+        self.sketch.add(totals.index.to_numpy(dtype=object), totals.to_numpy())
+        self._prune(np.concatenate([self.keys, totals.index.to_numpy(dtype=object)]))
+
+    def _prune(self, candidates):
+        candidates = pd.unique(candidates)
+        if not len(candidates):
+            self.keys = np.asarray(candidates, dtype=object)
+            return
+        order = _ranked(candidates, self.sketch.estimate(candidates))
+        self.keys = candidates[order[:self.capacity]]
+
+    def merge(self, other):
+        merged = HeavyHitters(self.capacity, self.sketch.merge(other.sketch))
+        merged._prune(np.concatenate([self.keys, other.keys]))
+        return merged
+
+    def top(self, n):
+        """[(key, estimated weight)], largest first"""
+        if not len(self.keys):
+            return []
+        estimates = self.sketch.estimate(self.keys)
+        order = _ranked(self.keys, estimates)[:n]
+        return [(self.keys[i], float(estimates[i])) for i in order]
+
+
+class TDigest:
+    """Quantiles from at most ~compression / 2 weighted centroids, finest near the tails"""
+
+    def __init__(self, compression=TDIGEST_COMPRESSION, means=(), weights=(), low=np.inf, high=-np.inf):
+        self.compression = compression
+        self.means = np.asarray(means, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.low = low
+        self.high = high
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def add(self, values, weights=None):
+        values = np.asarray(values, dtype=float)
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=float)
+        valid = np.isfinite(values) & (weights > 0)
+        values, weights = values[valid], weights[valid]
+        if not len(values):
+            return
+        self.low = min(self.low, float(values.min()))
+        self.high = max(self.high, float(values.max()))
+        self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, weights]))
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        cumulative = np.cumsum(weights)
+        # Points whose starting rank falls in the same unit of the k1 scale
+        # function form one centroid: wide ones in the middle, tiny ones at the ends
+        start = np.clip((cumulative - weights) / cumulative[-1], 0, 1)
+        k = np.floor(self.compression / (2 * np.pi) * np.arcsin(2 * start - 1))
+        bounds = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+        self.weights = np.add.reduceat(weights, bounds)
+        self.means = np.add.reduceat(means * weights, bounds) / self.weights
+
+    def merge(self, other):
+        merged = TDigest(self.compression, self.means, self.weights, self.low, self.high)
+        merged.low, merged.high = min(self.low, other.low), max(self.high, other.high)
+        if len(other.means):
+            merged._compress(np.concatenate([merged.means, other.means]),
+                             np.concatenate([merged.weights, other.weights]))
+        return merged
+
+    def _points(self):
+        cumulative = np.cumsum(self.weights)
+        centers = cumulative - self.weights / 2
+        return np.r_[0.0, centers, cumulative[-1]], np.r_[self.low, self.means, self.high]
+
+    def quantile(self, q):
+        if not len(self.means):
+            return np.full(np.shape(q), np.nan)
+        ranks, values = self._points()
+        return np.interp(np.asarray(q, dtype=float) * ranks[-1], ranks, values)
+
+    def cdf(self, values):
+        if not len(self.means):
+            return np.full(np.shape(values), np.nan)
+        ranks, points = self._points()
+        return np.interp(values, points, ranks) / ranks[-1]
+
+
+class PeriodSketches:
+    """Every sketch for one time bucket (or a merge of several)"""
+
+    def __init__(self, customers=None, invoices=None, products=None, countries=None, amounts=None):
+        self.customers = customers or HyperLogLog()
+        self.invoices = invoices or HyperLogLog()
+        self.products = products or HeavyHitters()
+        self.countries = countries or HeavyHitters()
+        self.amounts = amounts or TDigest()
+
+    def add_sales(self, sales):
+        customers = np.asarray(sales['CustomerID'], dtype=float)
+        # Guest invoices have no customer; don't count them as one
+        self.customers.add(customers[~np.isnan(customers)])
+        self.invoices.add(_keys(sales['InvoiceNo']))
+        self.countries.add(sales['Country'], sales['total_amount'])
+        self.amounts.add(sales['total_amount'])
+
+    def add_product_days(self, product_daily):
+        self.products.add(product_daily['product_id'], product_daily['quantity'])
+
+    def merge(self, other):
+        return PeriodSketches(
+            self.customers.merge(other.customers),
+            self.invoices.merge(other.invoices),
+            self.products.merge(other.products),
+            self.countries.merge(other.countries),
+            self.amounts.merge(other.amounts)
+        )
+
+
+def _blocks(frame, block_rows):
+    for begin in range(0, len(frame), block_rows):
+        yield frame.iloc[begin:begin + block_rows]
+
+
+def _fold(periods, block, dates, add):
+    """Sketch a block per month and merge it into `periods`"""
+    months = period_starts(dates, 'month')
+    for month in np.unique(months):
+        sketch = PeriodSketches()
+        add(sketch, block[months == month])
+        periods[month] = periods[month].merge(sketch) if month in periods else sketch
+
+
+def sketch_sales(sales, block_rows=BLOCK_ROWS):
+    """{month: PeriodSketches} of invoice-level sales"""
+    periods = {}
+    for block in _blocks(sales, block_rows):
+        _fold(periods, block, block['InvoiceDate'], PeriodSketches.add_sales)
+    return periods
+
+
+def sketch_product_days(product_daily, block_rows=BLOCK_ROWS):
+    """{month: PeriodSketches} of product x day quantities"""
+    periods = {}
+    for block in _blocks(product_daily, block_rows):
+        _fold(periods, block, block['date'], PeriodSketches.add_product_days)
+    return periods
+
+
+def merge_periods(periods, other):
+    """Merge the months of `other` into `periods` ({month: PeriodSketches}) and return it"""
+    for month, sketch in other.items():
+        periods[month] = periods[month].merge(sketch) if month in periods else sketch
+    return periods
+
+
+def build_sketches(sales, product_daily=None, block_rows=BLOCK_ROWS):
+    """Monthly sketch arrays (the snapshot's 'sketches') from invoice-level sales"""
+    periods = sketch_sales(sales, block_rows)
+    if product_daily is not None and len(product_daily):
+        merge_periods(periods, sketch_product_days(product_daily, block_rows))
+    return to_arrays(periods)
+
+
+def update_sketches(arrays, sales, added, extended, products):
+    """
+    Stored sketch arrays with a delta merged in: the delta's new invoices
+    (`added`, sales rows) and its product days (`products`, {month:
+    PeriodSketches}) are sketched on their own and merged into their
+    months. A t-digest can't take an amount back out, so months holding
+    one of `extended` (dates of stored invoices the delta added lines to)
+    have their sales sketches rebuilt from `sales` instead.
+    """
+    periods = from_arrays(arrays)
+    rebuilt = np.unique(period_starts(extended, 'month'))
+    if len(rebuilt):
+        in_rebuilt = np.isin(period_starts(sales['InvoiceDate'], 'month'), rebuilt)
+        for month, sketch in sketch_sales(sales[in_rebuilt]).items():
+            if month in periods:
+                sketch.products = periods[month].products
+            periods[month] = sketch
+        added = added[~np.isin(period_starts(added['InvoiceDate'], 'month'), rebuilt)]
+
+    merge_periods(periods, sketch_sales(added))
+    return to_arrays(merge_periods(periods, products))
+
+
+def to_arrays(periods):
+    """{month: PeriodSketches} as stacked arrays plus JSON-able key lists"""
+    months = sorted(periods)
+    sketches = [periods[month] for month in months]
+    centroids = max([len(s.amounts.means) for s in sketches] or [0])
+    digests = np.zeros((len(months), centroids, 2))
+    for i, sketch in enumerate(sketches):
+        digests[i, :len(sketch.amounts.means), 0] = sketch.amounts.means
+        digests[i, :len(sketch.amounts.means), 1] = sketch.amounts.weights
+
+    def stack(values, shape, dtype):
+        return np.stack(values) if values else np.zeros((0, *shape), dtype=dtype)
+
+    return {
+        'periods': np.array(months, dtype='datetime64[ns]'),
+        'hll_customers': stack([s.customers.registers for s in sketches], (1 << HLL_PRECISION,), np.uint8),
+        'hll_invoices': stack([s.invoices.registers for s in sketches], (1 << HLL_PRECISION,), np.uint8),
+        'cms_products': stack([s.products.sketch.table for s in sketches], (CMS_DEPTH, CMS_WIDTH), float),
+        'cms_countries': stack([s.countries.sketch.table for s in sketches], (CMS_DEPTH, CMS_WIDTH), float),
+        'top_products': [[str(key) for key in s.products.keys] for s in sketches],
+        'top_countries': [[str(key) for key in s.countries.keys] for s in sketches],
+        'amount_digest': digests,
+        'amount_range': np.array([[s.amounts.low, s.amounts.high] for s in sketches]).reshape(-1, 2)
+    }
+
+
+def period_sketches(arrays, i):
+    """PeriodSketches for row i of stored arrays (registers and tables are views, not copies)"""
+    digest = arrays['amount_digest'][i]
+    used = digest[:, 1] > 0
+    low, high = arrays['amount_range'][i]
+    return PeriodSketches(
+        HyperLogLog(registers=arrays['hll_customers'][i]),
+        HyperLogLog(registers=arrays['hll_invoices'][i]),
+        HeavyHitters(sketch=CountMinSketch(table=arrays['cms_products'][i]), keys=arrays['top_products'][i]),
+        HeavyHitters(sketch=CountMinSketch(table=arrays['cms_countries'][i]), keys=arrays['top_countries'][i]),
+        TDigest(means=digest[used, 0], weights=digest[used, 1], low=float(low), high=float(high))
+    )
+
+
+def from_arrays(arrays):
+    """Stored arrays as {month: PeriodSketches}, the inverse of to_arrays"""
+    months = np.asarray(arrays['periods'], dtype='datetime64[ns]')
+    return {month: period_sketches(arrays, i) for i, month in enumerate(months)}
+
+
+def dataset_sketches(data):
+    """The dataset's sketch arrays, building (and caching) them if the snapshot has none"""
+    stored = data.get('sketches')
+    if stored:
+        return stored
+
+    version = data['metadata'].get('version')
+    if version not in _built:
+        while len(_built) >= CACHED_VERSIONS:
+            _built.pop(next(iter(_built)))
+        _built[version] = build_sketches(data['sales'], data.get('product_daily'))
+    return _built[version]
+
+
+def _month(value, name):
+    try:
+        return period_starts([pd.Timestamp(value)], 'month')[0]
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a date (YYYY-MM-DD or YYYY-MM)")
+
+
+def select_periods(arrays, start=None, end=None):
+    """Indexes of the months overlapping [start, end]"""
+    periods = np.asarray(arrays['periods'], dtype='datetime64[ns]')
+    mask = np.ones(len(periods), dtype=bool)
+    if start:
+        mask &= periods >= _month(start, 'start')
+    if end:
+        mask &= periods <= _month(end, 'end')
+    return np.flatnonzero(mask)
+
+
+def merged_sketches(data, start=None, end=None):
+    """One PeriodSketches for every month in the range, or None if there are none"""
+    arrays = dataset_sketches(data)
+    merged = None
+    for i in select_periods(arrays, start, end):
+        sketch = period_sketches(arrays, i)
+        merged = sketch if merged is None else merged.merge(sketch)
+    return merged
+
+
+def _range(arrays, indexes):
+    periods = np.asarray(arrays['periods'], dtype='datetime64[ns]')[indexes]
+    if not len(periods):
+        return None
+    return {'start': str(pd.Timestamp(periods[0]).date()), 'end': str(pd.Timestamp(periods[-1]).date())}
+
+
+def distinct_counts(data, start=None, end=None, by_period=False):
+    """Approximate distinct customers and invoices in the range (and per month)"""
+    arrays = dataset_sketches(data)
+    indexes = select_periods(arrays, start, end)
+    merged = merged_sketches(data, start, end)
+    result = {
+        'customers': merged.customers.count() if merged else 0,
+        'invoices': merged.invoices.count() if merged else 0,
+        'months': _range(arrays, indexes),
+        'method': 'HyperLogLog',
+        'relative_error': round(1.04 / math.sqrt(1 << HLL_PRECISION), 4)
+    }
+    if by_period:
+        result['periods'] = [
+            {
+                'period': str(pd.Timestamp(arrays['periods'][i]).date()),
+                'customers': HyperLogLog(registers=arrays['hll_customers'][i]).count(),
+                'invoices': HyperLogLog(registers=arrays['hll_invoices'][i]).count()
+            }
+            for i in indexes
+        ]
+    return result
+
+
+def heavy_hitters(data, dimension='products', n=10, start=None, end=None):
+    """Top products by units sold or countries by revenue in the range, with estimated totals"""
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"dimension must be one of {', '.join(DIMENSIONS)}")
+    if not 1 <= n <= TOP_K:
+        raise ValueError(f"n must be between 1 and {TOP_K}")
+
+    arrays = dataset_sketches(data)
+    merged = merged_sketches(data, start, end)
+    top = getattr(merged, dimension).top(n) if merged else []
+    measure = DIMENSIONS[dimension]
+    return {
+        'dimension': dimension,
+        'measure': measure,
+        'top': [{'key': key, measure: round(estimate, 2)} for key, estimate in top],
+        'months': _range(arrays, select_periods(arrays, start, end)),
+        'method': 'Count-Min + top-k'
+    }
+
+
+def amount_quantiles(data, quantiles=(0.5, 0.9, 0.95, 0.99), start=None, end=None):
+    """Approximate quantiles of invoice total_amount in the range"""
+    quantiles = [float(q) for q in quantiles]
+    if not quantiles or not all(0 <= q <= 1 for q in quantiles):
+        raise ValueError("quantiles must be between 0 and 1")
+
+    arrays = dataset_sketches(data)
+    merged = merged_sketches(data, start, end)
+    values = merged.amounts.quantile(quantiles) if merged else np.full(len(quantiles), np.nan)
+    return {
+        'quantiles': {str(q): (None if np.isnan(v) else round(float(v), 2)) for q, v in zip(quantiles, values)},
+        'invoices': int(merged.amounts.count) if merged else 0,
+        'months': _range(arrays, select_periods(arrays, start, end)),
+        'method': 't-digest'
+    }
@@ -0,0 +1,362 @@
+"""
+Columnar snapshot storage for the processed Kaggle dataset.
+
+A snapshot is a directory of per-table, per-column files:
+
+    snapshot/
+        CURRENT                        name of the active version
+        20240101T120000000000/
+            metadata.json              dataset metadata + column schema
+            sales/InvoiceDate.npy      dates as int64 epoch nanoseconds
+            sales/InvoiceNo.codes.npy  strings as int32 dictionary codes
+            sales/InvoiceNo.dict.json  ... plus their dictionary
+            sales/total_amount.npy     numbers as typed arrays
+            ...
+            state/customers/...        mergeable aggregates for --delta
+            sketches/hll_customers.npy distinct/heavy-hitter/quantile sketches
+
+Columns are plain .npy files, so loading memory-maps them instead of
+parsing. A version written for a delta hard-links the files of columns
+the delta left unchanged from the version before it. processed_data.json is still supported as a fallback.
+Nothing stored depends on the day it is read: customer recency is
+derived by the feature store, up to the dataset's last sale.
+"""
+import json
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASETS_DIR = os.environ.get('ANALYTICS_DATA_DIR', os.path.join(PROJECT_ROOT, 'database', 'datasets'))
+SNAPSHOT_DIR = os.path.join(DATASETS_DIR, 'snapshot')
+JSON_PATH = os.path.join(DATASETS_DIR, 'processed_data.json')
+
+TABLES = ('sales', 'customers', 'products', 'product_daily', 'rollup')
+FORMAT = 'columnar-v1'
+
+# Files holding one column of each kind
+SUFFIXES = {'date': ('.npy',), 'num': ('.npy',), 'str': ('.codes.npy', '.dict.json')}
+
+# Columns stored as dates when the data comes from processed_data.json
+DATE_COLUMNS = {
+    'sales': ['InvoiceDate'],
+    'customers': ['first_purchase', 'last_purchase'],
+    'products': [],
+    'product_daily': ['date'],
+    'rollup': ['period']
+}
+
+
+def _encode_column(series):
+    """Return (kind, files) for one column, files being {suffix: payload}"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.astype('datetime64[ns]').to_numpy().view('int64')
+        return 'date', {'.npy': values}
+
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return 'num', {'.npy': series.to_numpy()}
+
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    return 'str', {
+        '.codes.npy': codes.astype('int32'),
+        '.dict.json': [str(u) for u in uniques]
+    }
+
+
+def _decode_column(table_dir, column, kind, mmap=True, categorical=True):
+    """Load one column back as a pandas-ready array"""
+    mode = 'r' if mmap else None
+    base = os.path.join(table_dir, column)
+
+    if kind == 'date':
+        return np.load(base + '.npy', mmap_mode=mode).view('datetime64[ns]')
+
+    if kind == 'num':
+        return np.load(base + '.npy', mmap_mode=mode)
+
+    codes = np.load(base + '.codes.npy', mmap_mode=mode)
+    with open(base + '.dict.json', 'r', encoding='utf-8') as f:
+        categories = json.load(f)
+
+    if not categorical:
+        # Code -1 (missing) picks the trailing NaN
+        return np.array(categories + [np.nan], dtype=object)[codes]
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def _link(source, target):
+    """Hard-link an unchanged file from the previous version, copying where links aren't supported"""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def _write_tables(base_dir, tables, reuse=None):
+    """
+    Write {name: DataFrame} as column files, returning their schema.
+    `reuse` is (source dir, source schema, {table: columns}): those
+    columns are linked from the source instead of being encoded again.
+    """
+    source_dir, source_schema, columns_by_table = reuse or (None, {}, {})
+    schema = {}
+    for table, frame in tables.items():
+        df = _to_frame(frame)
+        table_dir = os.path.join(base_dir, table)
+        os.makedirs(table_dir)
+        source = source_schema.get(table, {})
+        linked = set(columns_by_table.get(table, ())) if source.get('rows') == len(df) else set()
+
+        columns = {}
+        for column in df.columns:
+            if str(column) in linked:
+                kind = source['columns'][str(column)]
+                for suffix in SUFFIXES[kind]:
+                    _link(os.path.join(source_dir, table, str(column) + suffix),
+                          os.path.join(table_dir, str(column) + suffix))
+                columns[str(column)] = kind
+                continue
+
+            kind, files = _encode_column(df[column])
+            columns[str(column)] = kind
+            for suffix, payload in files.items():
+                path = os.path.join(table_dir, str(column) + suffix)
+                if suffix.endswith('.json'):
+                    with open(path, 'w', encoding='utf-8') as f:
+                        json.dump(payload, f)
+                else:
+                    np.save(path, payload)
+
+        schema[table] = {'rows': len(df), 'columns': columns}
+    return schema
+
+
+def _write_arrays(base_dir, arrays, reuse=None):
+    """
+    Write {name: ndarray or JSON-able value} as .npy / .json files,
+    returning their kinds. `reuse` is (source dir, source kinds, names)
+    to link from the source instead.
+    """
+    source_dir, source_kinds, names = reuse or (None, {}, ())
+    os.makedirs(base_dir)
+    kinds = {}
+    for name, values in arrays.items():
+        if name in names and name in source_kinds:
+            kinds[name] = source_kinds[name]
+            _link(os.path.join(source_dir, name + '.' + kinds[name]), os.path.join(base_dir, name + '.' + kinds[name]))
+        elif isinstance(values, np.ndarray):
+            np.save(os.path.join(base_dir, name + '.npy'), values)
+            kinds[name] = 'npy'
+        else:
+            with open(os.path.join(base_dir, name + '.json'), 'w', encoding='utf-8') as f:
+                json.dump(values, f)
+            kinds[name] = 'json'
+    return kinds
+
+
+def _read_arrays(base_dir, kinds, mmap=True):
+    """Inverse of _write_arrays"""
+    arrays = {}
+    for name, kind in kinds.items():
+        if kind == 'npy':
+            arrays[name] = np.load(os.path.join(base_dir, name + '.npy'), mmap_mode='r' if mmap else None)
+        else:
+            with open(os.path.join(base_dir, name + '.json'), 'r', encoding='utf-8') as f:
+                arrays[name] = json.load(f)
+    return arrays
+
+
+def _read_tables(base_dir, schema, mmap=True, categorical=True):
+    """Inverse of _write_tables"""
+    tables = {}
+    for table, spec in schema.items():
+        table_dir = os.path.join(base_dir, table)
+        columns = {
+            column: _decode_column(table_dir, column, kind, mmap=mmap, categorical=categorical)
+            for column, kind in spec['columns'].items()
+        }
+        tables[table] = pd.DataFrame(columns, copy=False)
+    return tables
+
+
+def _new_version():
+    return datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+
+
+def _to_frame(table):
+    return table if isinstance(table, pd.DataFrame) else pd.DataFrame(table)
+
+
+def current_version(snapshot_dir=SNAPSHOT_DIR):
+    """Name of the active snapshot version, or None if there is none"""
+    pointer = os.path.join(snapshot_dir, 'CURRENT')
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, 'r', encoding='utf-8') as f:
+        version = f.read().strip()
+    return version or None
+
+
+def write_snapshot(output, snapshot_dir=SNAPSHOT_DIR, keep=2, state=None, unchanged=None):
+    """
+    Write an importer output dict (sales/customers/products/metadata) as a
+    new snapshot version and atomically point CURRENT at it.
+    `state` optionally holds the importer's mergeable aggregates
+    ({name: DataFrame}) so later runs can apply deltas; output['sketches']
+    ({name: array}, see sketches.py) is stored alongside the tables.
+    `unchanged` names what is the same as in the current version, in the
+    manifest's sections ({'tables': {table: [columns]}, 'state': {...},
+    'sketches': [names]}); those files are hard-linked from it instead
+    of being written again.
+    Returns the new version name.
+    """
+    unchanged = unchanged or {}
+    source_dir, source = _read_manifest(snapshot_dir, None) if unchanged else (None, {})
+
+    def reuse(section, subdir=''):
+        return (os.path.join(source_dir, subdir), source.get(section, {}), unchanged.get(section, {})) if unchanged else None
+
+    version = _new_version()
+    version_dir = os.path.join(snapshot_dir, version)
+    os.makedirs(version_dir)
+
+    schema = _write_tables(version_dir, {table: output.get(table, []) for table in TABLES}, reuse('tables'))
+    state_schema = _write_tables(os.path.join(version_dir, 'state'), state, reuse('state', 'state')) if state else {}
+    sketches = output.get('sketches')
+    sketch_kinds = _write_arrays(os.path.join(version_dir, 'sketches'), sketches,
+                                 reuse('sketches', 'sketches')) if sketches else {}
+
+    manifest = {
+        'format': FORMAT,
+        'version': version,
+        'created_at': datetime.utcnow().isoformat(),
+        'tables': schema,
+        'state': state_schema,
+        'sketches': sketch_kinds,
+        'metadata': output.get('metadata', {})
+    }
+    with open(os.path.join(version_dir, 'metadata.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+    # Swap the pointer atomically so readers never see a half-written version
+    pointer_tmp = os.path.join(snapshot_dir, 'CURRENT.tmp')
+    with open(pointer_tmp, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(snapshot_dir, 'CURRENT'))
+
+    _prune_versions(snapshot_dir, keep)
+    return version
+
+
+def _prune_versions(snapshot_dir, keep):
+    """Remove all but the newest `keep` versions"""
+    versions = sorted(
+        name for name in os.listdir(snapshot_dir)
+        if os.path.isfile(os.path.join(snapshot_dir, name, 'metadata.json'))
+    )
+    for name in versions[:-keep] if keep else []:
+        # Readers that still have old columns mapped keep working on POSIX;
+        # on Windows the delete fails and is retried on the next write.
+        shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+
+
+def _read_manifest(snapshot_dir, version):
+    version = version or current_version(snapshot_dir)
+    if version is None:
+        raise FileNotFoundError(f"No snapshot found in {snapshot_dir}")
+
+    version_dir = os.path.join(snapshot_dir, version)
+    with open(os.path.join(version_dir, 'metadata.json'), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest.get('format') != FORMAT:
+        raise ValueError(f"Unsupported snapshot format: {manifest.get('format')}")
+    return version_dir, manifest
+
+
+def read_snapshot(snapshot_dir=SNAPSHOT_DIR, version=None, mmap=True):
+    """
+    Load a snapshot as {'sales': DataFrame, 'customers': DataFrame,
+    'products': DataFrame, 'metadata': dict}, plus 'sketches' (arrays)
+    when the snapshot has them. Columns are memory-mapped read-only
+    unless mmap=False.
+    """
+    version_dir, manifest = _read_manifest(snapshot_dir, version)
+
+    data = _read_tables(version_dir, manifest['tables'], mmap=mmap)
+    if manifest.get('sketches'):
+        data['sketches'] = _read_arrays(os.path.join(version_dir, 'sketches'), manifest['sketches'], mmap=mmap)
+
+    data['metadata'] = {**manifest.get('metadata', {}), 'version': manifest['version']}
+    return data
+
+
+def read_state(snapshot_dir=SNAPSHOT_DIR, version=None, mmap=True):
+    """
+    Load the mergeable aggregate state stored with a snapshot, or None if
+    the snapshot was written without one. Returns (state, metadata).
+    Columns are memory-mapped read-only unless mmap=False.
+    """
+    version_dir, manifest = _read_manifest(snapshot_dir, version)
+    if not manifest.get('state'):
+        return None, manifest.get('metadata', {})
+
+    state = _read_tables(os.path.join(version_dir, 'state'), manifest['state'], mmap=mmap, categorical=False)
+    return state, manifest.get('metadata', {})
+
+
+def read_json(json_path=JSON_PATH):
+    """Load processed_data.json into the same shape as read_snapshot"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+
+    data = {}
+    for table in TABLES:
+        df = pd.DataFrame(raw.get(table, []))
+        for column in DATE_COLUMNS[table]:
+            if column in df.columns:
+                df[column] = pd.to_datetime(df[column])
+        data[table] = df
+
+    # Written for the backend's readers, counted to the day of the import
+    data['customers'] = data['customers'].drop(columns=['days_since_last_order'], errors='ignore')
+
+    data['metadata'] = {**raw.get('metadata', {}), 'version': _json_version(json_path)}
+    return data
+
+
+def _json_version(json_path):
+    return datetime.utcfromtimestamp(os.path.getmtime(json_path)).strftime('%Y%m%dT%H%M%S%f')
+
+
+def source_version(snapshot_dir=SNAPSHOT_DIR, json_path=JSON_PATH):
+    """
+    Version load_dataset() would return right now, without loading it.
+    Cheap enough to poll: one small file read or one stat().
+    """
+    version = current_version(snapshot_dir)
+    if version:
+        return version
+
+    if os.path.exists(json_path):
+        return _json_version(json_path)
+
+    return None
+
+
+def load_dataset(snapshot_dir=SNAPSHOT_DIR, json_path=JSON_PATH, mmap=True):
+    """
+    Shared loader used by every analytics module.
+    Prefers the columnar snapshot and falls back to processed_data.json.
+    Returns None if neither exists.
+    """
+    if current_version(snapshot_dir):
+        return read_snapshot(snapshot_dir, mmap=mmap)
+
+    if os.path.exists(json_path):
+        return read_json(json_path)
+
+    return None
@@ -0,0 +1,83 @@
+"""
+Shared fixtures for the analytics tests.
+
+Modules read their data, model registry, job and report paths from the
+environment when they are imported, so every path points into a scratch
+directory before any test imports them.
+
+    python -m pytest -q analytics/tests
+"""
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ANALYTICS_DIR = os.path.dirname(TESTS_DIR)
+IMPORTER = os.path.join(os.path.dirname(ANALYTICS_DIR), 'scripts', 'import-kaggle-data.py')
+sys.path.append(ANALYTICS_DIR)
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix='analytics-tests-')
+os.environ.update({
+    'ANALYTICS_DATA_DIR': os.path.join(SCRATCH_DIR, 'datasets'),
+    'MODEL_REGISTRY_DIR': os.path.join(SCRATCH_DIR, 'models'),
+    'JOBS_DB': os.path.join(SCRATCH_DIR, 'jobs.db'),
+    'ML_UPLOADS_DIR': os.path.join(SCRATCH_DIR, 'uploads'),
+    'ML_UPLOAD_DATASETS_DIR': os.path.join(SCRATCH_DIR, 'upload-datasets'),
+    'ML_PROFILE_DIR': os.path.join(SCRATCH_DIR, 'profiles'),
+    'BACKTEST_REPORT_DIR': os.path.join(SCRATCH_DIR, 'backtests'),
+    'ML_CACHE_WARMUP': '0'
+})
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+
+def make_transactions(invoices=400, customers=60, products=40, seed=0):
+    """Raw Kaggle-shaped lines (as read from data.csv), a few without a customer"""
+    rng = np.random.default_rng(seed)
+    lines = rng.integers(1, 12, invoices)
+    invoice = np.repeat(np.arange(invoices), lines)
+
+    # Date, customer and country belong to the invoice; some lines are
+    # timestamped a minute later, like the real data
+    minutes = np.sort(rng.integers(0, 90 * 24 * 60, invoices))
+    code = rng.integers(0, customers, invoices)
+    country = np.array(['United Kingdom', 'France', 'Germany', 'EIRE'])[code % 4]
+    customer = (12000 + code).astype(float)
+    customer[rng.random(invoices) < 0.05] = np.nan
+    stamps = pd.Timestamp('2010-12-01 08:00') + pd.to_timedelta(
+        minutes[invoice] + (rng.random(len(invoice)) < 0.1), unit='min'
+    )
+
+    code = rng.integers(0, products, len(invoice))
+    return pd.DataFrame({
+        'InvoiceNo': (536000 + invoice).astype(str),
+        'StockCode': (22000 + code).astype(str),
+        'Description': np.char.add('PRODUCT ', code.astype(str)),
+        'Quantity': rng.integers(1, 25, len(invoice)),
+        'InvoiceDate': stamps.strftime('%m/%d/%Y %H:%M'),
+        'UnitPrice': np.round(rng.uniform(0.3, 12, len(invoice)), 2),
+        'CustomerID': customer[invoice],
+        'Country': country[invoice]
+    })
+
+
+@pytest.fixture
+def transactions():
+    return make_transactions()
+
+
+@pytest.fixture(scope='session')
+def importer():
+    """scripts/import-kaggle-data.py as a module"""
+    spec = importlib.util.spec_from_file_location('import_kaggle_data', IMPORTER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,73 @@
+import joblib
+import numpy as np
+import pytest
+
+from anomaly_stream import QuantileSketch, RunningStats, StreamingAnomalyScorer
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(0)
+    return rng.lognormal(3, 1, (5000, 2))
+
+
+def test_running_stats_match_the_whole_batch(values):
+    stats = RunningStats(2)
+    for batch in np.array_split(values, [1, 10, 700, 701, 3000]):
+        stats.update(batch)
+    stats.update(values[:0])
+
+    assert stats.count == len(values)
+    np.testing.assert_allclose(stats.mean, values.mean(axis=0))
+    np.testing.assert_allclose(stats.std, values.std(axis=0, ddof=1))
+    np.testing.assert_allclose(stats.zscores(values[:3]), (values[:3] - values.mean(axis=0)) / values.std(axis=0, ddof=1))
+
+
+def test_running_stats_without_spread():
+    stats = RunningStats(1)
+    stats.update(np.array([[4.0]]))
+
+    assert stats.std.tolist() == [0.0]
+    assert stats.zscores(np.array([[9.0]])).tolist() == [[0.0]]
+
+
+def test_quantiles_within_the_sketch_accuracy(values):
+    amounts = np.append(values[:, 0], [0, -3, np.nan])
+    sketch = QuantileSketch(accuracy=0.01)
+    sketch.update(amounts)
+
+    assert sketch.count == len(amounts) - 1
+    for q in (0.1, 0.5, 0.9, 0.99):
+        exact = np.quantile(amounts[~np.isnan(amounts)], q, method='lower')
+        assert abs(sketch.quantile(q) - exact) <= 0.0201 * exact
+    assert sketch.quantile(0) == 0.0
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_merged_sketches_equal_one_sketch(values):
+    whole, left, right = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    whole.update(values[:, 0])
+    left.update(values[:2000, 0])
+    right.update(values[2000:, 0])
+    left.merge(right)
+
+    assert left.counts == whole.counts and left.count == whole.count
+    np.testing.assert_array_equal(left.percentile_rank([0, 20, 1e9]), whole.percentile_rank([0, 20, 1e9]))
+    assert whole.percentile_rank([1e9]).tolist() == [100.0]
+    assert abs(whole.percentile_rank([np.median(values[:, 0])])[0] - 50) < 1
+
+
+def test_one_worker_writes_the_state(tmp_path):
+    writer, other = StreamingAnomalyScorer(str(tmp_path)), StreamingAnomalyScorer(str(tmp_path))
+    writer.scored, other.scored = 1, 2
+
+    assert writer.save()
+    assert not other.save()
+    assert joblib.load(tmp_path / 'state.joblib')['scored'] == 1
+    assert writer.status()['state_writer'] and not other.status()['state_writer']
+
+    # Once the writer stops, the next save takes over
+    writer.stop()
+    assert other.save()
+    assert joblib.load(tmp_path / 'state.joblib')['scored'] == 2
+    other.stop()
@@ -0,0 +1,151 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ANALYTICS_DIR, make_transactions
+from ingest import build_dataset, state_tables
+from snapshot import SNAPSHOT_DIR, write_snapshot
+
+pytest.importorskip('httpx')
+from fastapi.testclient import TestClient
+
+
+def write_dataset(seed=0):
+    output, state = build_dataset(make_transactions(seed=seed))
+    return write_snapshot(output, SNAPSHOT_DIR, state=state_tables(state))
+
+
+@pytest.fixture(scope='module')
+def api():
+    # The app loads the current snapshot when it is imported
+    write_dataset()
+    module = importlib.import_module('api.fastapi_app')
+    yield module
+    module.runner.shutdown()
+
+
+@pytest.fixture
+def client(api):
+    # Not entered as a context manager: no lifespan, so no background threads
+    return TestClient(api.app)
+
+
+def test_etag_revalidation(client):
+    response = client.get('/ml/churn')
+    etag = response.headers['etag']
+    assert response.status_code == 200
+
+    revalidated = client.get('/ml/churn', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b''
+    assert revalidated.headers['etag'] == etag
+
+    other = client.get('/ml/segments', headers={'If-None-Match': etag})
+    assert other.status_code == 200
+
+
+def test_etags_differ_by_shape_and_page(client):
+    etags = {
+        client.get('/ml/demand', params=params).headers['etag']
+        for params in ({}, {'shape': 'columns'}, {'limit': 5}, {'limit': 5, 'cursor': '5'})
+    }
+    assert len(etags) == 4
+
+
+def test_compressed_representation_has_its_own_etag(api, client, monkeypatch):
+    monkeypatch.setattr(api, 'COMPRESS_MIN_BYTES', 0)
+    plain = client.get('/ml/churn', headers={'Accept-Encoding': 'identity'})
+    gzipped = client.get('/ml/churn', headers={'Accept-Encoding': 'gzip'})
+
+    assert gzipped.headers['content-encoding'] == 'gzip'
+    assert 'Accept-Encoding' in gzipped.headers['vary']
+    assert gzipped.headers['etag'] != plain.headers['etag']
+    assert gzipped.json() == plain.json()
+
+    stale = client.get('/ml/churn', headers={'Accept-Encoding': 'gzip', 'If-None-Match': plain.headers['etag']})
+    assert stale.status_code == 200
+    fresh = client.get('/ml/churn', headers={'Accept-Encoding': 'gzip', 'If-None-Match': gzipped.headers['etag']})
+    assert fresh.status_code == 304
+
+
+def test_new_dataset_version_changes_etag(api, client):
+    before = client.get('/ml/churn')
+
+    version = write_dataset(seed=1)
+    api.store.refresh()
+    after = client.get('/ml/churn', headers={'If-None-Match': before.headers['etag']})
+
+    assert api.store.version == version
+    assert after.status_code == 200
+    assert after.headers['etag'] != before.headers['etag']
+    assert after.json()['total_customers'] == len(api.store.data['customers'])
+
+
+def test_job_params_are_checked(client):
+    assert client.post('/ml/jobs', json={'model': 'regression'}).status_code == 400
+    response = client.post('/ml/jobs', json={'model': 'forecast', 'params': {'days': 0}})
+    assert response.status_code == 422
+    assert 'days must be an integer between 1 and 365' in response.json()['detail']
+
+
+@pytest.mark.parametrize('path', ['/ml/forecast', '/ml/forecast/full'])
+@pytest.mark.parametrize('days', [0, -7, 366])
+def test_forecast_rejects_bad_days(client, path, days):
+    response = client.get(path, params={'days': days})
+    assert response.status_code == 400
+    assert 'days must be between 1 and 365' in response.json()['detail']
+
+
+def test_forecast_takes_days(client):
+    assert len(client.get('/ml/forecast', params={'days': 7}).json()['forecast']) == 7
+    assert len(client.get('/ml/forecast').json()['forecast']) == 28
+
+
+@pytest.mark.parametrize('params', [{'top_n': 0}, {'days': 0}, {'days': 366}, {'top_n': -1}])
+def test_batch_forecast_rejects_bad_sizes(client, params):
+    assert client.get('/ml/forecast/batch', params=params).status_code == 422
+
+
+def test_batch_forecast_runs_once_per_version(api, client, monkeypatch):
+    response = client.get('/ml/forecast/batch', params={'top_n': 3, 'days': 7})
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert 1 <= len(lines) <= 3
+    assert all(len(line['forecast']) == 7 and min(line['lower']) >= 0 for line in lines)
+
+    # Served from the result cache, without a pool run
+    monkeypatch.setattr(api.runner, 'max_pending', 0)
+    again = client.get('/ml/forecast/batch', params={'days': 7, 'top_n': 3},
+                       headers={'If-None-Match': response.headers['etag']})
+    assert again.status_code == 304
+    saturated = client.get('/ml/forecast/batch', params={'top_n': 2, 'days': 7})
+    assert saturated.status_code == 503
+
+
+def test_importing_the_api_leaves_the_model_libraries_unloaded():
+    check = ("import sys, api.fastapi_app; "
+             "print(','.join(m for m in ('sklearn', 'scipy', 'statsmodels', 'xgboost', 'duckdb') if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', check], cwd=ANALYTICS_DIR, env=dict(os.environ, ML_PRELOAD='0'),
+                            capture_output=True, text=True, timeout=60)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == ''
+
+
+def test_probes(api, client, monkeypatch):
+    assert client.get('/health/live').json() == {'status': 'alive'}
+    ready = client.get('/health/ready')
+    assert ready.status_code == 200
+    assert ready.json()['dataset'] and ready.json()['result_cache']
+
+    # A new version is loaded but its results aren't warmed yet
+    monkeypatch.setattr(api, 'warmed_version', None)
+    starting = client.get('/health/ready')
+    assert starting.status_code == 503
+    assert starting.json()['status'] == 'starting' and not starting.json()['result_cache']
+    assert client.get('/health/live').status_code == 200
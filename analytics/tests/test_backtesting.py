@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import backtesting
+from conftest import make_transactions
+from forecasting import forecast_sales
+from ingest import build_dataset
+from ml_simple import simple_forecast
+
+
+@pytest.fixture(scope='module')
+def data():
+    output, _ = build_dataset(make_transactions(invoices=1500))
+    output['metadata']['version'] = 'backtest-v1'
+    return output
+
+
+@pytest.fixture(scope='module')
+def report(data):
+    return backtesting.backtest(data, models=['forecast_fixed', 'simple_trend'], horizon=7, folds=2,
+                                n_jobs=1, measure_memory=False)
+
+
+def test_backtest_scores_the_served_forecast(data):
+    series, _, _ = backtesting.daily_revenue(data)
+    fit, predict = backtesting.FORECASTERS['forecast_fixed']
+
+    served = forecast_sales(days=7, data=data, order='fixed')
+
+    np.testing.assert_allclose(predict(fit(series), 7), served['forecast'], rtol=1e-6)
+
+
+def test_report_ranks_each_model(report):
+    assert set(report['models']) == {'forecast_fixed', 'simple_trend'}
+    for summary in report['models'].values():
+        assert summary['folds'] == 2 and summary['failed_folds'] == 0
+        assert summary['smape'] > 0
+    assert sorted(report['ranking_by_rmse']) == ['forecast_fixed', 'simple_trend']
+
+
+def test_forecasts_report_the_latest_backtest(data, report):
+    assert backtesting.latest_scores('forecast_fixed') is None
+    backtesting.save_report(report)
+
+    scores = backtesting.latest_scores('forecast_fixed')
+    assert scores['smape'] == report['models']['forecast_fixed']['smape']
+    assert scores['dataset_version'] == 'backtest-v1'
+    assert backtesting.latest_scores('forecast_auto') is None
+
+    served = forecast_sales(days=7, data=data, order='fixed')
+    assert served['backtest'] == scores and 'accuracy' not in served
+    simple = simple_forecast(data)
+    assert simple['backtest']['mape'] == report['models']['simple_trend']['mape']
+    assert 'accuracy' not in simple
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch_forecasting import MIN_ARIMA_DAYS, batch_forecast, build_series, exp_smoothing, seasonal_naive
+from conftest import make_transactions
+from ingest import build_dataset
+
+
+@pytest.fixture(scope='module')
+def data():
+    output, _ = build_dataset(make_transactions(invoices=800))
+    return output
+
+
+def test_series_cover_every_day_of_the_dataset(data):
+    days = pd.date_range(data['sales']['InvoiceDate'].min().floor('D'), data['sales']['InvoiceDate'].max().floor('D'))
+
+    for by in ('country', 'product'):
+        series = build_series(data, by, top_n=3)
+        assert series.shape == (len(days), 3)
+        assert series.index.equals(days)
+    products = build_series(data, 'product', top_n=3)
+    top = data['product_daily'].groupby('product_id')['revenue'].sum().nlargest(3)
+    np.testing.assert_allclose(products.sum()[top.index].to_numpy(), top.to_numpy())
+    with pytest.raises(ValueError, match='Unknown grouping'):
+        build_series(data, 'customer')
+
+
+def test_cheap_models():
+    week = np.array([1.0, 2, 3, 4, 5, 6, 7])
+    values = np.column_stack([np.tile(week, 3), np.full(21, 5.0)])
+
+    mean, half = seasonal_naive(values, 10)
+    assert mean[:, 0].tolist() == [1, 2, 3, 4, 5, 6, 7, 1, 2, 3]
+    assert (half == 0).all()
+
+    mean, half = exp_smoothing(values[:, 1:], 4)
+    assert mean[:, 0].tolist() == [5.0] * 4 and (half == 0).all()
+
+
+def test_every_series_gets_a_bounded_forecast(data):
+    result = batch_forecast(data, by='product', top_n=5, days=7, n_jobs=1)
+
+    assert result['series_count'] == 5 and sum(result['models_used'].values()) == 5
+    last_day = data['sales']['InvoiceDate'].max().floor('D')
+    for series in result['series'].values():
+        assert series['dates'][0] == str((last_day + pd.Timedelta(days=1)).date())
+        assert len(series['forecast']) == len(series['lower']) == 7
+        assert min(series['lower']) >= 0
+        assert all(low <= mean <= high for low, mean, high in zip(series['lower'], series['forecast'], series['upper']))
+
+
+def test_long_dense_series_use_arima(data):
+    result = batch_forecast(data, by='country', top_n=2, days=5, n_jobs=1)
+
+    assert len(build_series(data, 'country', 2)) >= MIN_ARIMA_DAYS
+    assert all(series['model'].startswith('ARIMA') and 'aic' in series for series in result['series'].values())
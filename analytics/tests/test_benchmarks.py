@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pytest
+
+from conftest import ANALYTICS_DIR, make_transactions
+from ingest import build_dataset
+
+sys.path.append(os.path.join(ANALYTICS_DIR, 'benchmarks'))
+from run_benchmarks import _latency_stats, compare
+from synthetic_data import generate, parse_rows, write_dataset
+from snapshot import read_snapshot
+
+
+def test_parse_rows():
+    assert [parse_rows(value) for value in ('10k', '1M', '250000', '2.5e5')] == [10_000, 1_000_000, 250_000, 250_000]
+
+
+def test_synthetic_data_has_the_importer_tables():
+    synthetic = generate(2000)
+    imported, _ = build_dataset(make_transactions())
+
+    for table in ('sales', 'customers', 'products', 'product_daily', 'rollup'):
+        assert set(synthetic[table].columns) >= set(imported[table].columns), table
+    assert len(synthetic['sales']) == synthetic['metadata']['total_sales'] == 2000
+    assert synthetic['sales']['InvoiceDate'].is_monotonic_increasing
+    assert synthetic['customers']['order_count'].sum() == synthetic['sales']['CustomerID'].notna().sum()
+
+
+def test_synthetic_data_is_reproducible(tmp_path):
+    version = write_dataset(generate(500, seed=3), str(tmp_path))
+    data = read_snapshot(str(tmp_path / 'snapshot'))
+
+    assert data['metadata']['version'] == version
+    assert data['sales']['total_amount'].tolist() == generate(500, seed=3)['sales']['total_amount'].tolist()
+    assert data['sales']['total_amount'].tolist() != generate(500, seed=4)['sales']['total_amount'].tolist()
+
+
+def test_latency_stats():
+    stats = _latency_stats([0.4, 0.1, 0.2, 0.3])
+
+    assert stats['min_seconds'] == 0.1
+    assert stats['median_seconds'] == pytest.approx(0.25)
+    assert stats['mean_seconds'] == pytest.approx(0.25)
+    assert stats['p95_seconds'] == stats['p99_seconds'] == 0.4
+
+
+def test_compare_flags_what_grew_past_the_tolerance():
+    baseline = {'entry_points': {'simple_churn': {'median_seconds': 0.1, 'peak_rss_mb': 100},
+                                 'simple_demand': {'median_seconds': 0.1}},
+                'http': {'p95_seconds': 0.02}}
+    report = {'entry_points': {'simple_churn': {'median_seconds': 0.2, 'peak_rss_mb': 110},
+                               'simple_demand': {'median_seconds': 0.12},
+                               'predict_churn': {'median_seconds': 5.0}},
+              'http': {'p95_seconds': 0.05}}
+
+    regressions = compare(report, baseline, tolerance=0.25)
+    assert [(r['entry'], r['metric'], r['ratio']) for r in regressions] == [
+        ('simple_churn', 'median_seconds', 2.0), ('http', 'p95_seconds', 2.5)
+    ]
@@ -0,0 +1,91 @@
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import make_transactions
+from dataset_cache import DatasetCache, dataset_nbytes
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    uploads_dir = tmp_path / 'uploads'
+    for user, seed in (('1', 0), ('2', 1), ('3', 2)):
+        (uploads_dir / user).mkdir(parents=True)
+        make_transactions(invoices=200, seed=seed).to_csv(uploads_dir / user / 'sales.csv', index=False)
+    (uploads_dir / '1' / 'notes.txt').write_text('not a dataset')
+    return uploads_dir
+
+
+def cache_for(uploads, tmp_path, max_bytes=10 ** 9):
+    return DatasetCache(max_bytes=max_bytes, uploads_dir=str(uploads), datasets_dir=str(tmp_path / 'datasets'))
+
+
+def test_uploads_are_ingested_once(uploads, tmp_path):
+    cache = cache_for(uploads, tmp_path)
+
+    data = cache.get('1/sales.csv')
+    assert data['metadata']['source']['dataset_id'] == '1/sales.csv'
+    assert 0 < data['metadata']['total_sales'] <= 200
+    assert cache.get('1/sales.csv') is data
+
+    # A new process reads the snapshot instead of ingesting again
+    again = cache_for(uploads, tmp_path)
+    assert again.get('1/sales.csv')['metadata']['version'] == data['metadata']['version']
+    assert again.status()['ingests'] == 0
+    status = cache.status()
+    assert (status['hits'], status['misses'], status['ingests']) == (1, 1, 1)
+    assert status['bytes'] == dataset_nbytes(data)
+
+
+def test_changed_files_are_ingested_again(uploads, tmp_path):
+    cache = cache_for(uploads, tmp_path)
+    first = cache.get('1/sales.csv')
+
+    path = uploads / '1' / 'sales.csv'
+    make_transactions(invoices=150, seed=5).to_csv(path, index=False)
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+
+    second = cache.get('1/sales.csv')
+    assert second['metadata']['total_sales'] < first['metadata']['total_sales']
+    assert second['metadata']['version'] != first['metadata']['version']
+    assert cache.status()['ingests'] == 2 and cache.status()['resident'] == 1
+
+
+@pytest.mark.parametrize('dataset_id', ['1/missing.csv', '1/notes.txt', '../uploads/1/sales.csv/..', '/etc/passwd',
+                                        '../../etc/hosts.csv'])
+def test_unknown_ids_are_not_found(uploads, tmp_path, dataset_id):
+    with pytest.raises(FileNotFoundError):
+        cache_for(uploads, tmp_path).get(dataset_id)
+
+
+def test_unreadable_uploads_are_refused(uploads, tmp_path):
+    pd.DataFrame({'name': ['a', 'b']}).to_csv(uploads / '2' / 'names.csv', index=False)
+
+    with pytest.raises(ValueError, match='date column'):
+        cache_for(uploads, tmp_path).get('2/names.csv')
+
+
+def test_least_recently_used_datasets_are_evicted(uploads, tmp_path):
+    size = dataset_nbytes(cache_for(uploads, tmp_path).get('1/sales.csv'))
+    cache = cache_for(uploads, tmp_path, max_bytes=int(size * 2.5))
+
+    one = cache.get('1/sales.csv')
+    cache.get('2/sales.csv')
+    cache.get('1/sales.csv')
+    cache.get('3/sales.csv')
+
+    status = cache.status()
+    assert status['resident'] == 2 and status['evictions'] == 1 and status['bytes'] <= cache.max_bytes
+    assert cache.get('1/sales.csv') is one
+    # The evicted dataset loads again from its snapshot
+    assert cache.get('2/sales.csv')['metadata']['source']['dataset_id'] == '2/sales.csv'
+    assert cache.status()['ingests'] == 2 and cache.status()['misses'] == 4
+
+
+def test_the_newest_dataset_stays_even_when_too_large(uploads, tmp_path):
+    cache = cache_for(uploads, tmp_path, max_bytes=1)
+    cache.get('1/sales.csv')
+    data = cache.get('2/sales.csv')
+
+    assert cache.status()['resident'] == 1 and cache.get('2/sales.csv') is data
@@ -0,0 +1,71 @@
+import time
+
+import pandas as pd
+import pytest
+
+from dataset_store import DatasetStore
+from snapshot import write_snapshot
+
+
+def write_version(snapshot_dir, sales):
+    return write_snapshot({'sales': pd.DataFrame({'Quantity': range(sales)}), 'metadata': {'total_sales': sales}},
+                          snapshot_dir)
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path):
+    return str(tmp_path / 'snapshot')
+
+
+@pytest.fixture
+def store(snapshot_dir, tmp_path):
+    return DatasetStore(snapshot_dir, str(tmp_path / 'processed_data.json'), poll_seconds=0.05)
+
+
+def test_refresh_loads_only_new_versions(store, snapshot_dir):
+    loaded = []
+    store.subscribe(lambda data, version: loaded.append(version))
+    assert not store.refresh()
+    assert store.status()['data_loaded'] is False
+
+    first = write_version(snapshot_dir, 3)
+    assert store.refresh()
+    assert not store.refresh()
+    assert store.refresh(force=True)
+    assert loaded == [first, first]
+    assert store.status()['transactions'] == 3
+
+
+def test_requests_keep_the_version_they_started_with(store, snapshot_dir):
+    write_version(snapshot_dir, 3)
+    store.refresh()
+    data, version = store.current()
+
+    second = write_version(snapshot_dir, 5)
+    store.refresh()
+
+    assert len(data['sales']) == 3 and data['metadata']['version'] == version
+    assert store.version == second and len(store.data['sales']) == 5
+
+
+def test_failing_listener_does_not_stop_the_others(store, snapshot_dir):
+    loaded = []
+    store.subscribe(lambda data, version: 1 / 0)
+    store.subscribe(lambda data, version: loaded.append(version))
+
+    write_version(snapshot_dir, 2)
+    assert store.refresh()
+    assert loaded == [store.version]
+
+
+def test_watcher_picks_up_new_versions(store, snapshot_dir):
+    store.start()
+    try:
+        version = write_version(snapshot_dir, 4)
+        deadline = time.time() + 5
+        while store.version != version and time.time() < deadline:
+            time.sleep(0.02)
+    finally:
+        store.stop()
+
+    assert store.version == version
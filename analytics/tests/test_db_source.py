@@ -0,0 +1,132 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from db_source import SalesSource, sqlite_schema
+from snapshot import read_snapshot
+from test_ingest import assert_same_output
+
+CUSTOMERS = [f'00000000-0000-4000-8000-{i:012d}' for i in range(1, 9)]
+PRODUCTS = [f'10000000-0000-4000-8000-{i:012d}' for i in range(1, 6)]
+
+
+class Database:
+    """SQLite stand-in for the application database"""
+
+    def __init__(self, path):
+        self.url = f'sqlite:///{path}'
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(sqlite_schema())
+        self.sales = self.lines = 0
+        for i, customer in enumerate(CUSTOMERS):
+            self.conn.execute("INSERT INTO customers (id, name, email, country) VALUES (?, ?, ?, ?)",
+                              (customer, f'Customer {i}', f'c{i}@example.com', ['USA', 'Italy'][i % 2]))
+        for i, product in enumerate(PRODUCTS):
+            self.conn.execute("INSERT INTO products (id, name, price, sku) VALUES (?, ?, ?, ?)",
+                              (product, f'Product {i}', 9.5, f'SKU-{i}'))
+        self.conn.commit()
+
+    def add_sale(self, sale_id, created_at, lines=3, status='completed', line_created_at=None):
+        self.sales += 1
+        customer = CUSTOMERS[self.sales % len(CUSTOMERS)]
+        self.conn.execute("INSERT INTO sales (id, customer_id, total_amount, status, created_at) VALUES (?, ?, 0, ?, ?)",
+                          (sale_id, customer, status, created_at))
+        self.add_lines(sale_id, line_created_at or created_at, lines)
+
+    def add_lines(self, sale_id, created_at, lines):
+        for _ in range(lines):
+            self.lines += 1
+            self.conn.execute(
+                "INSERT INTO sales_items (id, sale_id, product_id, quantity, unit_price, total_price, created_at) "
+                "VALUES (?, ?, ?, ?, 2.5, 0, ?)",
+                (f'line-{self.lines:05d}', sale_id, PRODUCTS[self.lines % len(PRODUCTS)], 1 + self.lines % 4, created_at)
+            )
+        self.conn.commit()
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'app.db'))
+    for day in range(1, 21):
+        db.add_sale(f'sale-{day:02d}', f'2024-01-{day:02d} 10:00:00')
+    yield db
+    db.conn.close()
+
+
+def pull(url, watermark=None, fetch_rows=4):
+    """(lines pulled as one frame, the source with its new watermark)"""
+    source = SalesSource(url, fetch_rows=fetch_rows)
+    try:
+        chunks = list(source.iter_lines(watermark))
+    finally:
+        source.close()
+    return (pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()), source
+
+
+def test_full_pull_maps_lines_to_csv_columns(db):
+    lines, source = pull(db.url)
+
+    assert len(lines) == source.lines_pulled == 60
+    assert list(lines.columns) == ['InvoiceNo', 'StockCode', 'Description', 'Quantity', 'InvoiceDate',
+                                   'UnitPrice', 'CustomerID', 'Country']
+    assert lines['InvoiceNo'].nunique() == 20
+    assert lines['InvoiceDate'].is_monotonic_increasing
+    assert set(lines['StockCode']) == {f'SKU-{i}' for i in range(5)}
+    assert set(lines['Country']) == {'USA', 'Italy'}
+    # The same customer gets the same numeric key on every pull
+    np.testing.assert_array_equal(lines['CustomerID'], pull(db.url, fetch_rows=1000)[0]['CustomerID'])
+    assert lines['CustomerID'].nunique() == lines.groupby('InvoiceNo')['CustomerID'].first().nunique()
+    assert source.watermark['created_at'] == '2024-01-20 10:00:00'
+
+
+def test_resume_pulls_only_new_lines(db):
+    _, source = pull(db.url)
+    db.add_sale('sale-21', '2024-01-21 10:00:00', lines=5)
+
+    lines, resumed = pull(db.url, source.watermark)
+    assert len(lines) == resumed.lines_pulled == 5
+    assert set(lines['InvoiceNo']) == {'sale-21'}
+
+    again, last = pull(db.url, resumed.watermark)
+    assert again.empty and last.lines_pulled == 0
+    assert last.watermark == resumed.watermark
+
+
+def test_lines_sharing_the_watermark_timestamp(db):
+    _, source = pull(db.url)
+    # Committed after the pull, stamped with the newest timestamp pulled
+    # and a little before it
+    db.add_lines('sale-20', '2024-01-20 10:00:00', 2)
+    db.add_sale('sale-late', '2024-01-20 09:59:30', lines=1)
+
+    lines, resumed = pull(db.url, source.watermark)
+    assert len(lines) == 3
+    assert sorted(lines['InvoiceNo']) == ['sale-20', 'sale-20', 'sale-late']
+    assert pull(db.url, resumed.watermark)[1].lines_pulled == 0
+
+
+def test_cancelled_sales_are_left_out(db):
+    db.add_sale('sale-cancelled', '2024-01-21 10:00:00', status='cancelled')
+    db.add_sale('sale-pending', '2024-01-21 11:00:00', status=None)
+
+    lines, _ = pull(db.url)
+    assert 'sale-cancelled' not in set(lines['InvoiceNo'])
+    assert 'sale-pending' in set(lines['InvoiceNo'])
+
+
+def test_database_delta_matches_full_pull(importer, db, tmp_path):
+    snapshot_dir, json_path = str(tmp_path / 'incremental'), str(tmp_path / 'data.json')
+    importer.load_from_database(db.url, snapshot_dir, json_path)
+    assert importer.apply_database_delta(db.url, snapshot_dir, json_path) is None
+
+    db.add_lines('sale-20', '2024-01-20 10:00:00', 2)
+    db.add_sale('sale-21', '2024-01-21 10:00:00', lines=5)
+    db.add_sale('sale-22', '2024-01-22 10:00:00', status='cancelled')
+    delta = importer.apply_database_delta(db.url, snapshot_dir, json_path)
+    full = importer.load_from_database(db.url, str(tmp_path / 'full'), json_path)
+
+    assert delta['metadata']['total_sales'] == full['metadata']['total_sales'] == 21
+    assert_same_output(read_snapshot(snapshot_dir, mmap=False), read_snapshot(str(tmp_path / 'full'), mmap=False))
+    assert importer.apply_database_delta(db.url, snapshot_dir, json_path) is None
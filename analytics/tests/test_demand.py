@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from demand_prediction import FEATURES, PARAMS, build_features, monthly_demand, origin_features, score_demand
+
+
+@pytest.fixture
+def data():
+    """Daily sales of 5 products over 2010-12-01 .. 2011-12-09 (December 2011 is partial)"""
+    rng = np.random.default_rng(0)
+    days = pd.date_range('2010-12-01', '2011-12-09')
+    rows = [(f'2200{p}', day, int(rng.integers(1, 9))) for p in range(5) for day in days if rng.random() < 0.3 + 0.1 * p]
+    product_daily = pd.DataFrame(rows, columns=['product_id', 'date', 'quantity'])
+    products = pd.DataFrame({'product_id': [f'2200{p}' for p in range(5)], 'name': [f'ITEM {p}' for p in range(5)],
+                             'total_sold': [50, 5000, 10, 60, 3000]})
+    return {'product_daily': product_daily, 'products': products}
+
+
+def test_monthly_demand_matches_a_pivot(data):
+    products, first_month, matrix = monthly_demand(data)
+
+    daily = data['product_daily']
+    full = daily[daily['date'] < '2011-12-01']
+    pivot = full.pivot_table(index='product_id', columns=full['date'].dt.to_period('M'), values='quantity',
+                             aggfunc='sum', fill_value=0)
+    assert list(products) == list(pivot.index)
+    assert first_month == np.datetime64('2010-12')
+    np.testing.assert_array_equal(matrix, pivot.to_numpy())
+
+
+def test_origin_features_match_a_per_product_loop(data):
+    _, first_month, matrix = monthly_demand(data)
+    origin, horizon = 7, 2
+
+    features = origin_features(matrix, origin, horizon, first_month)
+    assert list(features.columns) == FEATURES
+    for p, row in features.iterrows():
+        history = matrix[p, :origin + 1]
+        assert row['product_mean'] == pytest.approx(history.mean())
+        assert row['rolling_mean_3'] == pytest.approx(history[-3:].mean())
+        assert row['lag_1'] == history[-1] and row['lag_3'] == history[-3]
+        assert np.isnan(row['lag_12'])
+        # July 2011 + 2 months
+        assert row['target_month'] == 9 and row['horizon'] == 2
+
+
+def test_features_never_read_past_the_origin(data):
+    _, first_month, matrix = monthly_demand(data)
+    changed = matrix.copy()
+    changed[:, 8:] *= 10
+
+    pd.testing.assert_frame_equal(origin_features(matrix, 7, 1, first_month),
+                                  origin_features(changed, 7, 1, first_month))
+
+
+def test_training_rows_cover_each_origin_and_horizon(data):
+    training, n_products = build_features(data)
+    _, _, matrix = monthly_demand(data)
+    n_months = matrix.shape[1]
+
+    assert n_products == 5
+    expected = sum(min(PARAMS['max_horizon'], n_months - 1 - origin) * 5
+                   for origin in range(PARAMS['min_history'] - 1, n_months - 1))
+    assert len(training) == expected
+    row = training[(training['origin'] == 4) & (training['horizon'] == 3)].iloc[0]
+    assert row['quantity'] == matrix[0, 7]
+
+
+class LastMonth:
+    """Stand-in model predicting last month's units times the horizon"""
+
+    def predict(self, X):
+        return X['lag_1'].to_numpy() * X['horizon'].to_numpy()
+
+
+def test_forecast_predicts_every_horizon_in_one_batch(data):
+    _, _, matrix = monthly_demand(data)
+    metadata = {'params': PARAMS, 'metrics': {'rmse': 1.0, 'accuracy_percentage': 90.0, 'total_products_analyzed': 5}}
+
+    result = score_demand(data, LastMonth(), metadata, limit=5, horizon=3)
+
+    assert result['forecast_months'] == ['2011-12', '2012-01', '2012-02']
+    rows = {row['product_id']: row for row in result['predictions'].records()}
+    for p in range(5):
+        last = matrix[p, -1]
+        assert rows[f'2200{p}']['monthly_demand'].tolist() == [last, 2 * last, 3 * last]
+        assert rows[f'2200{p}']['predicted_demand'] == 6 * last
+    assert rows['22001']['recommendation'] == 'Sufficient' and rows['22002']['recommendation'] == 'Restock'
+    with pytest.raises(ValueError, match='horizon'):
+        score_demand(data, LastMonth(), metadata, horizon=PARAMS['max_horizon'] + 1)
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import feature_store
+from conftest import make_transactions
+from feature_store import CHURN_DAYS, build_features, customer_features
+from ingest import build_dataset
+
+
+@pytest.fixture(scope='module')
+def data():
+    output, _ = build_dataset(make_transactions(invoices=800, customers=120))
+    return output
+
+
+def test_monetary_is_summed_from_sales(data):
+    features = build_features(data)
+    revenue = data['sales'].groupby('CustomerID')['total_amount'].sum()
+    expected = revenue.reindex(data['customers']['customer_id']).fillna(0)
+
+    np.testing.assert_allclose(features['monetary'], expected.to_numpy(), rtol=1e-6)
+    orders = features['frequency']
+    np.testing.assert_allclose(features['avg_order_value'][orders > 0],
+                               (features['monetary'] / orders)[orders > 0], rtol=1e-6)
+
+
+def test_given_monetary_and_missing_columns():
+    customers = pd.DataFrame({'customer_id': [1.0, 2.0], 'order_count': [2, np.nan], 'monetary': [30.0, 0.0]})
+    features = build_features({'customers': customers})
+
+    assert features['monetary'].tolist() == [30.0, 0.0] and features['frequency'].tolist() == [2, 0]
+    assert features['avg_order_value'].tolist() == [15.0, 0.0]
+    assert np.isnan(features['recency']).all() and features['churned'].tolist() == [0, 0]
+    assert features['country'].tolist() == [-1, -1]
+    assert features.frame(['recency', 'frequency'])['recency'].tolist() == [0, 0]
+    assert features.frame(['recency'], fill=None)['recency'].isna().all()
+
+
+def test_columns_are_compact_and_aligned(data):
+    features = build_features(data)
+
+    assert len(features) == len(data['customers'])
+    assert features['recency'].dtype == np.float32 and features['churned'].dtype == np.int8
+    assert features.nbytes() < 40 * len(features)
+    countries = features.countries[features['country']]
+    assert countries.tolist() == data['customers']['country'].astype(str).tolist()
+    assert features['churned'].tolist() == (features['recency'] > CHURN_DAYS).astype(int).tolist()
+
+
+def test_features_are_built_once_per_version(data, monkeypatch):
+    monkeypatch.setattr(feature_store, '_built', {})
+    versioned = {**data, 'metadata': {'version': 'v1'}}
+
+    first = customer_features(versioned)
+    assert customer_features(versioned) is first and first.version == 'v1'
+    assert customer_features(data) is not customer_features(data)
+    for i in range(feature_store.CACHED_VERSIONS):
+        customer_features({**data, 'metadata': {'version': f'w{i}'}})
+    assert list(feature_store._built) == [f'w{i}' for i in range(feature_store.CACHED_VERSIONS)]
@@ -0,0 +1,132 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from snapshot import read_snapshot
+
+TABLES = ('sales', 'customers', 'products', 'product_daily', 'rollup')
+
+
+def assert_same_output(actual, expected):
+    """Same tables, metadata and sketches; floats may differ by summation order"""
+    for table in TABLES:
+        pd.testing.assert_frame_equal(
+            actual[table].reset_index(drop=True), expected[table].reset_index(drop=True),
+            check_categorical=False
+        )
+    version = {'version': None}
+    assert {**actual['metadata'], **version} == {**expected['metadata'], **version}
+
+    assert actual['sketches'].keys() == expected['sketches'].keys()
+    for name, values in expected['sketches'].items():
+        if isinstance(values, list):
+            assert actual['sketches'][name] == values
+        elif np.issubdtype(values.dtype, np.floating):
+            np.testing.assert_allclose(actual['sketches'][name], values, rtol=1e-9)
+        else:
+            np.testing.assert_array_equal(actual['sketches'][name], values)
+
+
+@pytest.fixture
+def csv_path(tmp_path, transactions):
+    path = tmp_path / 'data.csv'
+    transactions.to_csv(path, index=False)
+    return str(path)
+
+
+def import_csv(importer, path, out_dir, chunk_size=None):
+    importer.load_and_process_data(path, chunk_size, str(out_dir / 'snapshot'), str(out_dir / 'data.json'))
+    return read_snapshot(str(out_dir / 'snapshot'), mmap=False)
+
+
+@pytest.mark.parametrize('chunk_size', [97, 1000])
+def test_chunked_import_matches_single_pass(importer, csv_path, tmp_path, chunk_size):
+    batch = import_csv(importer, csv_path, tmp_path / 'batch')
+    chunked = import_csv(importer, csv_path, tmp_path / 'chunked', chunk_size)
+
+    assert_same_output(chunked, batch)
+
+
+def test_invoices_split_across_chunks_are_merged(importer, csv_path, tmp_path, transactions):
+    # Chunks of 50 lines cut through many invoices
+    chunked = import_csv(importer, csv_path, tmp_path / 'chunked', 50)
+
+    lines = transactions.dropna(subset=['CustomerID'])
+    assert len(chunked['sales']) == lines['InvoiceNo'].nunique()
+    assert chunked['sales']['Quantity'].sum() == lines['Quantity'].sum()
+
+
+def test_chunks_fold_into_the_state_in_batches(importer, transactions, monkeypatch):
+    merges = []
+    merge_partials = importer.merge_partials
+    monkeypatch.setattr(importer, 'merge_partials', lambda state, partial: merges.append(1) or merge_partials(state, partial))
+    chunks = [transactions.iloc[i:i + 50] for i in range(0, len(transactions), 50)]
+
+    state, _, _, _ = importer.merge_chunks(chunks)
+
+    # Each merge waits for as many partial rows as the state holds
+    assert len(merges) < len(chunks) / 4
+    assert len(state['invoices']) == transactions.dropna(subset=['CustomerID'])['InvoiceNo'].nunique()
+
+
+def test_delta_matches_full_import(importer, transactions, tmp_path):
+    # The split cuts through an invoice, and most customers and products are in both parts
+    split = len(transactions) * 3 // 4
+    transactions.iloc[:split].to_csv(tmp_path / 'base.csv', index=False)
+    transactions.iloc[split:].to_csv(tmp_path / 'delta.csv', index=False)
+    transactions.to_csv(tmp_path / 'full.csv', index=False)
+    snapshot_dir = str(tmp_path / 'incremental' / 'snapshot')
+    json_path = str(tmp_path / 'incremental' / 'data.json')
+
+    import_csv(importer, str(tmp_path / 'base.csv'), tmp_path / 'incremental', 200)
+    importer.apply_delta(str(tmp_path / 'delta.csv'), 50, snapshot_dir, json_path)
+    full = import_csv(importer, str(tmp_path / 'full.csv'), tmp_path / 'full')
+
+    assert_same_output(read_snapshot(snapshot_dir, mmap=False), full)
+
+
+def test_delta_links_the_columns_it_leaves_unchanged(importer, transactions, tmp_path):
+    # More lines for the last invoice: no new invoice, customer, product or day
+    extra = transactions[transactions['InvoiceNo'] == transactions['InvoiceNo'].iloc[-1]]
+    transactions.to_csv(tmp_path / 'base.csv', index=False)
+    extra.to_csv(tmp_path / 'delta.csv', index=False)
+    pd.concat([transactions, extra]).to_csv(tmp_path / 'full.csv', index=False)
+    snapshot_dir = tmp_path / 'incremental' / 'snapshot'
+
+    before = import_csv(importer, str(tmp_path / 'base.csv'), tmp_path / 'incremental')['metadata']['version']
+    after = importer.apply_delta(str(tmp_path / 'delta.csv'), None, str(snapshot_dir), str(tmp_path / 'data.json'))
+    full = import_csv(importer, str(tmp_path / 'full.csv'), tmp_path / 'full')
+
+    def inode(version, path):
+        return os.stat(snapshot_dir / version / path).st_ino
+
+    version = read_snapshot(str(snapshot_dir))['metadata']['version']
+    for path in ('sales/InvoiceNo.codes.npy', 'sales/InvoiceDate.npy', 'customers/first_purchase.npy',
+                 'product_daily/date.npy', 'state/invoices/CustomerID.npy'):
+        assert inode(version, path) == inode(before, path)
+    for path in ('sales/Quantity.npy', 'customers/total_items.npy', 'product_daily/quantity.npy'):
+        assert inode(version, path) != inode(before, path)
+    assert after['metadata']['total_sales'] == full['metadata']['total_sales']
+    assert_same_output(read_snapshot(str(snapshot_dir), mmap=False), full)
+
+
+def test_delta_without_transactions_writes_nothing(importer, transactions, tmp_path):
+    transactions.to_csv(tmp_path / 'base.csv', index=False)
+    transactions.iloc[:5].assign(CustomerID=np.nan).to_csv(tmp_path / 'delta.csv', index=False)
+    snapshot_dir = str(tmp_path / 'out' / 'snapshot')
+    before = import_csv(importer, str(tmp_path / 'base.csv'), tmp_path / 'out')
+
+    assert importer.apply_delta(str(tmp_path / 'delta.csv'), None, snapshot_dir, str(tmp_path / 'out' / 'data.json')) is None
+    assert read_snapshot(snapshot_dir)['metadata']['version'] == before['metadata']['version']
+
+
+def test_json_keeps_days_since_last_order(importer, csv_path, tmp_path):
+    import_csv(importer, csv_path, tmp_path)
+
+    with open(tmp_path / 'data.json') as f:
+        customers = pd.DataFrame(json.load(f)['customers'])
+    expected = (pd.Timestamp.now() - pd.to_datetime(customers['last_purchase'])).dt.days
+    assert (customers['days_since_last_order'] - expected).abs().max() <= 1
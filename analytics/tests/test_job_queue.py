@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from conftest import make_transactions
+from ingest import build_dataset
+from job_queue import STALE_SECONDS, InvalidParams, JobQueue
+from snapshot import write_snapshot
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(db_path=str(tmp_path / 'jobs.db'), concurrency=1)
+
+
+@pytest.mark.parametrize('model, params', [
+    ('forecast', {'days': 0}),
+    ('forecast', {'days': 366}),
+    ('forecast', {'days': '28'}),
+    ('forecast', {'order': 'best'}),
+    ('forecast', {'horizon': 2}),
+    ('segments', {'mode': 'fast'}),
+    ('demand', {'horizon': 7}),
+    ('churn', {'limit': True}),
+    ('churn', {'cursor': '-5'})
+])
+def test_submit_rejects_params_the_model_does_not_take(queue, model, params):
+    with pytest.raises(InvalidParams):
+        queue.submit(model, params)
+    assert queue.list() == []
+
+
+def test_submit_queues_valid_params(queue):
+    job = queue.submit('demand', {'limit': 5, 'cursor': '10', 'horizon': 3}, 'v1')
+
+    assert job['status'] == 'queued' and job['stage'] is None
+    assert job['params'] == {'limit': 5, 'cursor': '10', 'horizon': 3}
+    with pytest.raises(ValueError, match='Unknown model'):
+        queue.submit('regression')
+
+
+def test_cancel_queued_and_running_jobs(queue):
+    queued = queue.submit('churn')
+    running = queue.submit('segments')
+    assert queue._claim()['id'] == queued['id']
+
+    assert queue.cancel(queued['id'])['status'] == 'cancelling'
+    assert queue.cancel(running['id'])['status'] == 'cancelled'
+    assert queue.cancel('missing') is None
+    assert queue._claim() is None
+
+
+def test_stale_jobs_are_reclaimed(queue):
+    running = queue.submit('churn')
+    cancelling = queue.submit('segments')
+    queue._claim()
+    queue._claim()
+    queue.cancel(cancelling['id'])
+    assert queue._claim() is None
+
+    # Their API process stopped sending heartbeats
+    stale = time.time() - STALE_SECONDS - 1
+    queue._execute("UPDATE jobs SET heartbeat_at = ?, progress = 0.5, stage = 'running'", (stale,))
+
+    reclaimed = queue._claim()
+    assert reclaimed['id'] == running['id']
+    assert queue.get(running['id'])['stage'] is None
+    assert queue.get(running['id'])['progress'] == 0
+    # A stale job that was being cancelled is finished instead of rerun
+    assert queue._claim() is None
+    assert queue.get(cancelling['id'])['status'] == 'cancelled'
+
+
+def test_run_reports_each_stage(tmp_path, queue):
+    snapshot_dir = str(tmp_path / 'snapshot')
+    output, _ = build_dataset(make_transactions())
+    version = write_snapshot(output, snapshot_dir)
+    queue.snapshot_dir, queue.json_path = snapshot_dir, None
+    stages = []
+    update = queue._update
+    queue._update = lambda job_id, **fields: stages.append(fields.get('stage')) or update(job_id, **fields)
+
+    job = queue.submit('segments', {'mode': 'full'})
+    queue._run(queue._claim())
+
+    job = queue.get(job['id'])
+    assert job['status'] == 'succeeded' and job['progress'] == 1.0
+    assert job['result']['dataset_version'] == version
+    assert [stage for stage in stages if stage] == ['loading', 'running', 'saving']
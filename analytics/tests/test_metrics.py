@@ -0,0 +1,86 @@
+import os
+import time
+
+import pytest
+
+from metrics import Histogram, Metrics, MetricsMiddleware, render_family
+from profiling import RequestProfiler
+
+pytest.importorskip('httpx')
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(seconds, '/ml/churn')
+
+    assert histogram.render() == [
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{route="/ml/churn",le="0.1"} 2',
+        'latency_seconds_bucket{route="/ml/churn",le="1.0"} 3',
+        'latency_seconds_bucket{route="/ml/churn",le="+Inf"} 4',
+        'latency_seconds_sum{route="/ml/churn"} 3.65',
+        'latency_seconds_count{route="/ml/churn"} 4'
+    ]
+
+
+def test_families_escape_labels_and_skip_missing_values():
+    lines = render_family('ml_dataset_info', 'gauge', 'Version', [({'version': 'a"b\\c'}, 1), ({'version': 'x'}, None)])
+
+    assert lines[2:] == ['ml_dataset_info{version="a\\"b\\\\c"} 1']
+
+
+def test_collectors_are_read_on_render():
+    metrics = Metrics()
+    metrics.add_collector(lambda: [('ml_jobs', 'gauge', 'Jobs', [({'status': 'queued'}, 3)])])
+    metrics.add_collector(lambda: 1 / 0)
+
+    text = metrics.render()
+    assert 'ml_jobs{status="queued"} 3\n' in text
+    assert '# collector failed: division by zero' in text
+    assert 'ml_http_requests_in_flight 0' in text
+
+
+def app_with(metrics, profiler=None):
+    app = FastAPI()
+    if profiler is not None:
+        app.router.route_class = profiler.route_class()
+
+    @app.get('/ml/jobs/{job_id}')
+    def get_job(job_id: str):
+        time.sleep(0.01 if job_id == 'slow' else 0)
+        return {'id': job_id}
+
+    app.add_middleware(MetricsMiddleware, metrics=metrics, profiler=profiler)
+    return app
+
+
+def test_requests_are_labelled_by_route_template():
+    metrics = Metrics()
+    client = TestClient(app_with(metrics))
+    for job_id in ('a', 'b'):
+        client.get(f'/ml/jobs/{job_id}')
+    client.get('/missing')
+
+    text = metrics.render()
+    assert 'ml_http_request_duration_seconds_count{method="GET",route="/ml/jobs/{job_id}",status="200"} 2' in text
+    assert 'route="unmatched",status="404"' in text
+    assert metrics.in_flight == 0
+
+
+def test_profiler_keeps_the_slowest_requests(tmp_path):
+    profiler = RequestProfiler(header=True, keep=1, output_dir=str(tmp_path))
+    client = TestClient(app_with(Metrics(), profiler))
+
+    client.get('/ml/jobs/fast')
+    client.get('/ml/jobs/slow', headers={'X-Profile': '1'})
+    client.get('/ml/jobs/fast', headers={'X-Profile': '1'})
+
+    profiles = profiler.profiles()
+    assert [profile['path'] for profile in profiles] == ['/ml/jobs/slow']
+    assert profiles[0]['route'] == '/ml/jobs/{job_id}' and 'get_job' in profiles[0]['stats']
+    assert [name.endswith('.prof') for name in os.listdir(tmp_path)] == [True]
+    assert profiler.status()['kept'] == 1
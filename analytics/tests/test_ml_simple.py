@@ -0,0 +1,78 @@
+import pytest
+
+from conftest import make_transactions
+from feature_store import CHURN_DAYS, dataset_end
+from ingest import build_dataset
+from ml_simple import (SEGMENT_NAMES, simple_anomalies, simple_churn, simple_demand, simple_forecast,
+                       simple_segments)
+from snapshot import read_snapshot, write_snapshot
+
+
+@pytest.fixture(scope='module')
+def data(tmp_path_factory):
+    output, _ = build_dataset(make_transactions(invoices=1500, customers=300))
+    snapshot_dir = str(tmp_path_factory.mktemp('simple') / 'snapshot')
+    write_snapshot(output, snapshot_dir)
+    return read_snapshot(snapshot_dir)
+
+
+@pytest.fixture(scope='module')
+def recency(data):
+    return (dataset_end(data) - data['customers']['last_purchase']).dt.days
+
+
+def test_no_data_is_an_error():
+    for model in (simple_forecast, simple_churn, simple_segments, simple_demand, simple_anomalies):
+        assert model(None)['error'] == 'No data loaded'
+
+
+def test_churn_counts_customers_past_the_churn_window(data, recency):
+    result = simple_churn(data)
+
+    assert result['total_customers'] == len(data['customers'])
+    assert result['at_risk_count'] == (recency > CHURN_DAYS).sum()
+
+
+def test_segments_bucket_by_recency_and_orders(data, recency):
+    orders = data['customers']['order_count']
+    expected = {
+        'Champions': ((recency < 30) & (orders > 5)).sum(),
+        'Loyal': ((recency >= 30) & (recency < 60)).sum(),
+        'At-Risk': ((recency >= 60) & (recency < 90)).sum(),
+        'Lost': (recency >= 90).sum()
+    }
+
+    segments = simple_segments(data)['segments']
+    assert list(segments) == SEGMENT_NAMES
+    assert {name: segment['count'] for name, segment in segments.items()} == expected
+
+
+def test_anomalies_are_three_deviations_above_positive_sales(data):
+    totals = data['sales']['total_amount']
+    positive = totals[totals > 0]
+    threshold = positive.mean() + 3 * positive.std(ddof=0)
+
+    result = simple_anomalies(data)
+    assert result['total_transactions'] == len(totals)
+    assert result['anomalies_detected'] == (totals > threshold).sum()
+
+
+def test_demand_pages_through_every_product(data):
+    first = simple_demand(data, limit=25)
+    second = simple_demand(data, limit=25, cursor=first['next_cursor'])
+
+    names = [row['product_name'] for row in first['predictions'].records() + second['predictions'].records()]
+    assert names == data['products']['name'].tolist()[:len(names)]
+    assert len(names) == min(50, len(data['products']))
+    row = first['predictions'].records()[0]
+    assert row['predicted_demand'] == int(row['current_stock'] * 1.15)
+
+
+def test_forecast_continues_the_recent_level(data):
+    # Last 30 days of revenue, days without sales counted as 0
+    daily = data['sales'].set_index('InvoiceDate')['total_amount'].resample('D').sum()
+
+    result = simple_forecast(data, days=10)
+    assert len(result['forecast']) == 10 and min(result['forecast']) >= 0
+    assert result['total_predicted_revenue'] == pytest.approx(sum(result['forecast']), abs=0.05)
+    assert result['daily_average'] == pytest.approx(daily.iloc[-30:].mean(), abs=0.01)
@@ -0,0 +1,69 @@
+import os
+import time
+
+import pytest
+
+from model_registry import get_model, latest_model, load_model
+
+FEATURES = ['recency', 'frequency']
+PARAMS = {'C': 1.0}
+
+
+@pytest.fixture
+def models_dir(tmp_path):
+    return str(tmp_path / 'models')
+
+
+def trainer():
+    fits = []
+
+    def train(data, params):
+        fits.append(data['metadata']['version'])
+        return {'coef': [params['C'], len(fits)]}, {'accuracy': 0.9}
+    return train, fits
+
+
+def dataset(version):
+    return {'metadata': {'version': version}}
+
+
+def test_models_are_trained_once_per_version_and_config(models_dir):
+    train, fits = trainer()
+
+    model, metadata = get_model('churn', dataset('v1'), PARAMS, FEATURES, train, models_dir)
+    again, _ = get_model('churn', dataset('v1'), PARAMS, FEATURES, train, models_dir)
+    get_model('churn', dataset('v2'), PARAMS, FEATURES, train, models_dir)
+    get_model('churn', dataset('v2'), {'C': 0.5}, FEATURES, train, models_dir)
+    get_model('churn', dataset('v2'), PARAMS, FEATURES + ['monetary'], train, models_dir)
+
+    assert fits == ['v1', 'v2', 'v2', 'v2']
+    assert again == model
+    assert metadata['dataset_version'] == 'v1' and metadata['metrics'] == {'accuracy': 0.9}
+    assert metadata['params'] == PARAMS and metadata['features'] == FEATURES
+
+
+def test_unknown_models_are_not_found(models_dir):
+    assert load_model('churn', 'v1', PARAMS, FEATURES, models_dir) is None
+    assert latest_model('churn', PARAMS, FEATURES, models_dir) is None
+
+
+def test_latest_model_is_the_newest_with_this_config(models_dir):
+    train, _ = trainer()
+    for version in ('v1', 'v2'):
+        get_model('churn', dataset(version), PARAMS, FEATURES, train, models_dir)
+        time.sleep(0.01)
+    get_model('churn', dataset('v3'), {'C': 0.5}, FEATURES, train, models_dir)
+
+    model, metadata = latest_model('churn', PARAMS, FEATURES, models_dir)
+    assert metadata['dataset_version'] == 'v2' and model['coef'] == [1.0, 2]
+
+
+def test_old_versions_are_pruned(models_dir):
+    train, _ = trainer()
+    for i in range(5):
+        get_model('churn', dataset(f'v{i}'), PARAMS, FEATURES, train, models_dir)
+        time.sleep(0.01)
+
+    files = sorted(os.listdir(os.path.join(models_dir, 'churn')))
+    assert [name.split('-')[0] for name in files] == ['v2', 'v2', 'v3', 'v3', 'v4', 'v4']
+    assert load_model('churn', 'v0', PARAMS, FEATURES, models_dir) is None
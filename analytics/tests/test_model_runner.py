@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from conftest import make_transactions
+from ingest import build_dataset
+from model_runner import ModelPoolSaturated, ModelRunner, run_full_model
+from snapshot import write_snapshot
+
+
+@pytest.fixture(scope='module')
+def snapshot_dir(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('runner') / 'snapshot')
+    output, _ = build_dataset(make_transactions())
+    write_snapshot(output, path)
+    return path
+
+
+@pytest.fixture
+def runner(snapshot_dir):
+    runner = ModelRunner(max_workers=1, max_pending=2, timeout=60, snapshot_dir=snapshot_dir, json_path=None)
+    yield runner
+    runner.shutdown()
+
+
+def test_identical_runs_share_one_computation(runner):
+    async def submit():
+        first = runner.submit('segments', [('mode', 'full')], 'v1')
+        same = runner.submit('segments', [('mode', 'full')], 'v1')
+        other = runner.submit('segments', [('mode', 'full')], 'v2')
+        assert runner.pending == 2
+        return first is same, first is other, await first, await other
+
+    shared, crossed, result, _ = asyncio.run(submit())
+
+    assert shared and not crossed
+    assert result['dataset_version']
+    assert runner.pending == 0
+
+
+def test_saturated_pool_refuses_new_runs(runner):
+    async def submit():
+        runner.submit('segments', [('mode', 'full')], 'v1')
+        runner.submit('segments', [('mode', 'minibatch')], 'v1')
+        # Joining a pending run still works, a new one doesn't
+        runner.submit('segments', [('mode', 'full')], 'v1')
+        with pytest.raises(ModelPoolSaturated):
+            runner.submit('churn', [], 'v1')
+        await asyncio.gather(*runner._inflight.values())
+
+    asyncio.run(submit())
+
+
+def test_timed_out_caller_still_gets_the_result_stored(runner):
+    stored = []
+    runner.timeout = 0.01
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await runner.run('segments', [('mode', 'full')], 'v1', on_result=stored.append)
+        await asyncio.gather(*runner._inflight.values())
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert len(stored) == 1 and 'error' not in stored[0]
+
+
+@pytest.mark.parametrize('days', [0, -1, 366])
+def test_forecast_rejects_bad_days(snapshot_dir, days):
+    with pytest.raises(ValueError, match='days must be between 1 and 365'):
+        run_full_model('forecast', [('days', days)], snapshot_dir, None)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('statsmodels')
+
+import order_selection
+from order_selection import (MAX_FITS, _neighbours, differencing, fit_series, model_name, seasonal_differencing,
+                             select_order)
+
+
+def daily(values, start='2011-01-01'):
+    return pd.Series(values, index=pd.date_range(start, periods=len(values), freq='D'))
+
+
+@pytest.fixture
+def ar1():
+    rng = np.random.default_rng(0)
+    values = np.zeros(200)
+    for t in range(1, len(values)):
+        values[t] = 0.7 * values[t - 1] + rng.normal()
+    return values + 100
+
+
+def test_differencing_follows_kpss(ar1):
+    walk = np.cumsum(np.random.default_rng(1).normal(size=300))
+
+    assert differencing(ar1) == 0
+    assert differencing(walk) == 1
+    assert differencing(np.ones(50)) == 0
+
+
+def test_seasonal_differencing_needs_a_strong_week():
+    rng = np.random.default_rng(2)
+    week = np.tile([10.0, 12, 11, 13, 30, 40, 5], 12)
+
+    assert seasonal_differencing(week + rng.normal(scale=0.5, size=len(week))) == 1
+    assert seasonal_differencing(rng.normal(size=len(week))) == 0
+    assert seasonal_differencing(week[:14]) == 0
+
+
+def test_neighbours_stay_within_the_limits():
+    assert sorted(_neighbours((0, 0, 0, 0), seasonal=False)) == [(0, 1, 0, 0), (1, 0, 0, 0)]
+    assert (0, 0, 1, 0) in set(_neighbours((0, 0, 0, 0), seasonal=True))
+    assert all(point[0] <= order_selection.MAX_P for point in _neighbours((5, 0, 0, 0), seasonal=False))
+
+
+def test_model_names():
+    assert model_name((1, 1, 2), (0, 0, 0, 0)) == 'ARIMA(1,1,2)'
+    assert model_name((1, 0, 0), (1, 1, 0, 7)) == 'SARIMA(1,0,0)(1,1,0,7)'
+
+
+def test_search_finds_the_ar_term(ar1):
+    order, seasonal_order, params, info = select_order(ar1, n_jobs=1)
+
+    assert order[1] == 0 and order[0] >= 1
+    assert 0 < info['candidates_fitted'] <= MAX_FITS
+    assert params is not None and np.isfinite(info['search_aic'])
+
+
+def test_new_versions_warm_start_from_the_last_fit(ar1, monkeypatch):
+    monkeypatch.setattr(order_selection, 'APPEND_DAYS', 10)
+    key = 'ar1'
+    history = daily(ar1[:150])
+
+    fitted, info = fit_series(key, history, 'v1', order=(1, 0, 0))
+    assert info['fit'] == 'fit' and info['model'] == 'ARIMA(1,0,0)'
+    assert fit_series(key, history, 'v1', order=(1, 0, 0))[1]['fit'] == 'cached'
+    assert fit_series(key, history, 'v2', order=(1, 0, 0))[1]['fit'] == 'reused'
+
+    appended, info = fit_series(key, daily(ar1[:155]), 'v3', order=(1, 0, 0))
+    assert info['fit'] == 'append' and info['fitted_days'] == 150 and info['history_days'] == 155
+    np.testing.assert_allclose(appended.params, fitted.params)
+
+    refitted, info = fit_series(key, daily(ar1[:180]), 'v4', order=(1, 0, 0))
+    assert info['fit'] == 'warm_refit' and info['fitted_days'] == 180
+    assert refitted.params['ar.L1'] == pytest.approx(fitted.params['ar.L1'], abs=0.2)
+
+    # Changed history is fitted from scratch
+    assert fit_series(key, daily(ar1[:180] + 1), 'v5', order=(1, 0, 0))[1]['fit'] == 'fit'
+    assert fit_series(key, daily(ar1[:180], start='2010-12-01'), 'v6', order=(1, 0, 0))[1]['fit'] == 'fit'
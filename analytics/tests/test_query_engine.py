@@ -0,0 +1,84 @@
+import pytest
+
+from conftest import make_transactions
+from ingest import build_dataset
+from query_engine import QueryEngine, QueryError
+
+
+@pytest.fixture(scope='module')
+def data():
+    output, _ = build_dataset(make_transactions(invoices=600))
+    return output
+
+
+@pytest.fixture(scope='module')
+def engine(data):
+    return QueryEngine(data, backend='sqlite')
+
+
+@pytest.mark.parametrize('metrics, group_by, filters, source', [
+    (['revenue'], ['product', 'month'], {}, 'monthly_product'),
+    (['revenue'], ['product'], {'start': '2011-01'}, 'monthly_product'),
+    (['revenue'], ['product'], {'start': '2011-01-15'}, 'product_daily'),
+    (['quantity'], ['week'], {'product': ['22001']}, 'product_daily'),
+    (['revenue', 'invoices'], ['country', 'day'], {}, 'daily_country'),
+    (['invoices'], [], {'country': 'France'}, 'daily_country'),
+    (['customers'], ['country'], {}, 'sales'),
+    (['revenue'], ['customer'], {}, 'sales'),
+])
+def test_smallest_table_that_answers_the_query(engine, metrics, group_by, filters, source):
+    assert engine.build(metrics, group_by, filters)[2] == source
+
+
+@pytest.mark.parametrize('kwargs, message', [
+    ({'metrics': ['profit']}, 'Unknown'),
+    ({'metrics': ['revenue'], 'group_by': ['day', 'month']}, 'at most one'),
+    ({'metrics': ['invoices'], 'group_by': ['product']}, 'No table'),
+    ({'metrics': ['revenue'], 'group_by': ['country'], 'order_by': 'quantity'}, 'order_by'),
+])
+def test_invalid_requests_are_refused(engine, kwargs, message):
+    with pytest.raises(QueryError, match=message):
+        engine.build(**kwargs)
+
+
+def test_filters_are_bound_parameters(engine):
+    sql, params, _ = engine.build(['revenue'], ['country'], {'country': ['France', "x' OR 1=1"],
+                                                             'customer': 12001, 'end': '2011-01'})
+
+    assert "WHERE country IN (?, ?) AND customer IN (?) AND day <= ?" in sql
+    assert params == ['France', "x' OR 1=1", 12001.0, '2011-01-31']
+
+
+def test_revenue_by_country_matches_the_sales(engine, data):
+    sales = data['sales']
+    expected = sales.groupby('Country')['total_amount'].sum()
+
+    result = engine.run(['revenue', 'invoices'], ['country'], limit=10)
+    assert result['source'] == 'daily_country' and result['columns'] == ['country', 'revenue', 'invoices']
+    assert [row[0] for row in result['rows']] == list(expected.sort_values(ascending=False).index)
+    for country, revenue, invoices in result['rows']:
+        assert revenue == pytest.approx(expected[country])
+        assert invoices == (sales['Country'] == country).sum()
+
+
+def test_filtered_months_match_the_sales(engine, data):
+    sales = data['sales']
+    france = sales[(sales['Country'] == 'France') & (sales['InvoiceDate'] >= '2011-01-01')]
+    expected = france.groupby(france['InvoiceDate'].dt.strftime('%Y-%m'))['CustomerID'].nunique()
+
+    result = engine.run(['customers'], ['month'], {'country': 'France', 'start': '2011-01-01'}, descending=False)
+    assert result['source'] == 'sales'
+    assert result['rows'] == [[month, count] for month, count in expected.items()]
+
+
+def test_product_months_match_the_daily_table(engine, data):
+    daily = data['product_daily']
+    product = daily[daily['product_id'] == '22003']
+    expected = product.groupby(product['date'].dt.strftime('%Y-%m'))['quantity'].sum()
+
+    result = engine.run(['quantity'], ['month'], {'product': '22003'}, descending=False)
+    assert result['source'] == 'monthly_product'
+    assert result['rows'] == [[month, quantity] for month, quantity in expected.items()]
+
+    top = engine.run(['revenue'], ['product'], limit=3)['rows']
+    assert len(top) == 3 and top == sorted(top, key=lambda row: -row[1])
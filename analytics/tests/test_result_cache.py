@@ -0,0 +1,82 @@
+import gzip
+
+from result_cache import ResultCache
+
+
+def counting(body, cacheable=True):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return body, cacheable
+    return compute, calls
+
+
+def test_entries_are_computed_once_per_key():
+    cache = ResultCache()
+    compute, calls = counting(b'{"forecast": []}')
+
+    first = cache.get_or_compute('/ml/forecast', [('days', 7), ('shape', 'columns')], 'v1', compute)
+    again = cache.get_or_compute('/ml/forecast', [('shape', 'columns'), ('days', 7)], 'v1', compute)
+
+    assert again is first and len(calls) == 1
+    assert cache.stats() == {'entries': 1, 'max_entries': 256, 'hits': 1, 'misses': 1, 'hit_ratio': 0.5}
+
+
+def test_etags_follow_endpoint_params_and_version():
+    cache = ResultCache()
+    compute, calls = counting(b'{}')
+    etags = {
+        cache.get_or_compute(endpoint, params, version, compute).etag
+        for endpoint, params, version in [('/ml/churn', [], 'v1'), ('/ml/churn', [], 'v2'),
+                                          ('/ml/churn', [('limit', 5)], 'v1'), ('/ml/demand', [], 'v1')]
+    }
+    assert len(etags) == len(calls) == 4
+    assert all(etag.startswith('"') and etag.endswith('"') for etag in etags)
+
+
+def test_uncacheable_results_and_unknown_versions_are_not_stored():
+    cache = ResultCache()
+    error, calls = counting(b'{"error": "No data loaded"}', cacheable=False)
+    cache.get_or_compute('/ml/churn', [], 'v1', error)
+    cache.get_or_compute('/ml/churn', [], 'v1', error)
+    unversioned, _ = counting(b'{}')
+    cache.get_or_compute('/ml/churn', [], None, unversioned)
+
+    assert len(calls) == 2 and cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_entries_go_first():
+    cache = ResultCache(max_entries=2)
+    for endpoint in ('/ml/churn', '/ml/demand'):
+        cache.get_or_compute(endpoint, [], 'v1', counting(b'{}')[0])
+    cache.get(ResultCache.key('/ml/churn', [], 'v1'))
+    cache.get_or_compute('/ml/segments', [], 'v1', counting(b'{}')[0])
+
+    assert cache.get(ResultCache.key('/ml/demand', [], 'v1')) is None
+    assert cache.get(ResultCache.key('/ml/churn', [], 'v1')) is not None
+
+
+def test_evict_drops_one_version():
+    cache = ResultCache()
+    for version in ('v1', 'v2'):
+        cache.get_or_compute('/ml/churn', [], version, counting(b'{}')[0])
+    cache.evict('v1')
+
+    assert cache.get(ResultCache.key('/ml/churn', [], 'v1')) is None
+    assert cache.get(ResultCache.key('/ml/churn', [], 'v2')) is not None
+
+
+def test_compressed_variants_are_encoded_once():
+    entry = ResultCache().get_or_compute('/ml/churn', [], 'v1', counting(b'{"customers": []}' * 50)[0])
+    encoded = []
+
+    def encode(body, encoding):
+        encoded.append(encoding)
+        return gzip.compress(body)
+
+    body, etag = entry.variant('gzip', encode)
+    assert entry.variant('gzip', encode) == (body, etag)
+    assert encoded == ['gzip']
+    assert gzip.decompress(body) == entry.body
+    assert etag != entry.etag and entry.variant(None, encode) == (entry.body, entry.etag)
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import rollups
+from conftest import make_transactions
+from ingest import build_dataset
+from rollups import ALL, build_cube, country_rollup, cube, period_starts, rollup_series, update_cube
+
+
+@pytest.fixture(scope='module')
+def sales():
+    output, _ = build_dataset(make_transactions(invoices=600))
+    return output['sales']
+
+
+def test_period_starts():
+    dates = pd.to_datetime(['2011-03-06 23:59', '2011-03-07 00:00', '2011-03-31 12:00'])
+
+    assert [str(d)[:10] for d in period_starts(dates, 'week')] == ['2011-02-28', '2011-03-07', '2011-03-28']
+    assert [str(d)[:10] for d in period_starts(dates, 'month')] == ['2011-03-01'] * 3
+    with pytest.raises(ValueError, match='grain'):
+        period_starts(dates, 'year')
+
+
+def test_every_grain_adds_up_to_the_sales(sales):
+    table = build_cube(sales)
+
+    for grain in ('day', 'week', 'month'):
+        total = table[(table['grain'] == grain) & (table['country'] == ALL)]
+        by_country = table[(table['grain'] == grain) & (table['country'] != ALL)]
+        assert total['revenue'].sum() == pytest.approx(sales['total_amount'].sum())
+        assert by_country['quantity'].sum() == total['quantity'].sum() == sales['Quantity'].sum()
+        assert total['invoices'].sum() == len(sales)
+
+
+def test_distinct_customers_are_not_summed(sales):
+    table = build_cube(sales)
+    month = sales['InvoiceDate'].dt.to_period('M')
+    expected = sales.groupby(month)['CustomerID'].nunique()
+
+    totals = table[(table['grain'] == 'month') & (table['country'] == ALL)]
+    assert totals['customers'].tolist() == expected.tolist()
+    by_country = table[(table['grain'] == 'month') & (table['country'] != ALL)]
+    assert by_country['customers'].sum() >= totals['customers'].sum()
+
+
+def test_updating_matches_a_rebuild(sales):
+    # The delta lands mid-week across a month boundary
+    cut = sales['InvoiceDate'] < '2011-01-30'
+    old, delta = sales[cut], sales[~cut & (sales['InvoiceDate'] < '2011-02-03')]
+    combined = pd.concat([old, delta], ignore_index=True)
+
+    updated = update_cube(build_cube(old), combined, delta['InvoiceDate'])
+    rebuilt = build_cube(combined)
+    for column in ('grain', 'country'):
+        rebuilt[column] = np.asarray(rebuilt[column], dtype=object)
+    pd.testing.assert_frame_equal(updated, rebuilt)
+
+
+def test_series_fill_missing_periods_with_zero(sales):
+    quiet = sales[(sales['InvoiceDate'] < '2011-01-10') | (sales['InvoiceDate'] >= '2011-01-20')]
+    data = {'sales': quiet, 'rollup': build_cube(quiet), 'metadata': {}}
+
+    daily = rollup_series(data)
+    assert daily.index.freqstr == 'D' and (daily['2011-01-10':'2011-01-19'] == 0).all()
+    assert daily.sum() == pytest.approx(quiet['total_amount'].sum())
+
+    countries = country_rollup(data, 'quantity', 'week')
+    assert sorted(countries.columns) == sorted(quiet['Country'].unique())
+    assert countries.to_numpy().sum() == quiet['Quantity'].sum()
+
+
+def test_datasets_without_a_cube_build_it_once_per_version(sales, monkeypatch):
+    monkeypatch.setattr(rollups, '_built', {})
+    data = {'sales': sales, 'metadata': {'version': 'v1'}}
+
+    first = cube(data)
+    assert cube(data) is first
+    for i in range(rollups.CACHED_VERSIONS):
+        cube({'sales': sales, 'metadata': {'version': f'w{i}'}})
+    assert 'v1' not in rollups._built and len(rollups._built) == rollups.CACHED_VERSIONS
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import clustering
+from clustering import (MODEL_NAME, MINIBATCH_PARAMS, assign_segments, name_segments, segment_customers,
+                        segment_params, stratified_sample)
+from conftest import make_transactions
+from feature_store import build_features, customer_features, dataset_end
+from ingest import build_dataset, state_tables
+from model_registry import load_model
+from snapshot import read_snapshot, write_snapshot
+
+
+@pytest.fixture(scope='module')
+def data(tmp_path_factory):
+    output, state = build_dataset(make_transactions(invoices=1500, customers=300))
+    snapshot_dir = str(tmp_path_factory.mktemp('segments') / 'snapshot')
+    write_snapshot(output, snapshot_dir, state=state_tables(state))
+    return read_snapshot(snapshot_dir)
+
+
+def test_recency_counts_to_last_sale(data):
+    features = customer_features(data)
+    end = dataset_end(data)
+    expected = (end - data['customers']['last_purchase']).dt.days
+
+    np.testing.assert_array_equal(features['recency'], expected.to_numpy(dtype=np.float32))
+    assert features['recency'].min() == 0
+    assert end == data['sales']['InvoiceDate'].max()
+
+
+def test_recency_to_a_given_end():
+    customers = pd.DataFrame({
+        'customer_id': [1.0, 2.0],
+        'last_purchase': pd.to_datetime(['2011-01-01 10:00', '2011-01-20 09:00'])
+    })
+    features = build_features({'customers': customers}, end='2011-01-31 08:00')
+
+    assert features['recency'].tolist() == [29.0, 10.0]
+
+
+def test_assigned_segments_match_segment_customers(data):
+    assigned = assign_segments(data['customers'], data, 'full')
+    report = segment_customers(data, 'full')
+
+    counts = assigned['segment_name'].value_counts()
+    for name, segment in report['segments'].items():
+        assert counts.get(name, 0) == segment['count']
+
+
+def test_assigning_some_customers_matches_everyone(data):
+    everyone = assign_segments(data['customers'], data, 'full').set_index('customer_id')
+    some = data['customers'].iloc[::7][['customer_id', 'last_purchase', 'order_count']]
+
+    assigned = assign_segments(some, data, 'full').set_index('customer_id')
+
+    pd.testing.assert_frame_equal(assigned, everyone.loc[assigned.index])
+
+
+def test_assign_needs_last_purchase(data):
+    customers = data['customers'][['customer_id', 'order_count']].assign(days_since_last_order=10)
+
+    with pytest.raises(ValueError):
+        assign_segments(customers, data, 'full')
+
+
+def test_stratified_sample_keeps_cluster_shares():
+    labels = np.repeat([0, 1, 2], [900, 95, 5])
+
+    sample = stratified_sample(labels, 100)
+    counts = np.bincount(labels[sample])
+    assert counts.tolist() == [90, 10, 2]
+    assert len(np.unique(sample)) == len(sample)
+    assert len(stratified_sample(labels[:50], 100)) == 50
+
+
+def test_segment_names_are_distinct_and_ordered():
+    stats = pd.DataFrame({'recency': [200.0, 10.0, 80.0, 35.0], 'frequency': [1.0, 9.0, 2.0, 4.0]})
+
+    assert name_segments(stats) == {0: 'Lost', 1: 'Champions', 2: 'At-Risk', 3: 'Loyal'}
+    assert name_segments(stats.iloc[:2]) == {0: 'Segment 0', 1: 'Segment 1'}
+
+
+def test_auto_mode_switches_to_minibatch_for_large_bases(data, monkeypatch):
+    assert segment_params(data, 'auto')['n_init'] == 10
+    monkeypatch.setattr(clustering, 'MINIBATCH_MIN_CUSTOMERS', len(data['customers']))
+    assert segment_params(data, 'auto') is MINIBATCH_PARAMS
+    with pytest.raises(ValueError):
+        segment_params(data, 'fastest')
+
+
+def test_minibatch_refit_warm_starts_from_the_last_model(data, tmp_path):
+    report = segment_customers(data, 'minibatch')
+    assert report['algorithm'] == 'Mini-batch K-means'
+    assert sum(segment['count'] for segment in report['segments'].values()) == report['total_customers']
+
+    # The next dataset version starts from these centroids
+    output, _ = build_dataset(make_transactions(invoices=1600, customers=300, seed=1))
+    write_snapshot(output, str(tmp_path))
+    newer = read_snapshot(str(tmp_path))
+    segment_customers(newer, 'minibatch')
+
+    _, metadata = load_model(MODEL_NAME, newer['metadata']['version'], MINIBATCH_PARAMS, clustering.FEATURES)
+    assert metadata['metrics']['warm_started']
+    assert metadata['metrics']['silhouette_sample'] == len(newer['customers'])
@@ -0,0 +1,100 @@
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import serialization
+from serialization import Table, accepted_encoding, compress, dumps, page_bounds, paginate
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def backend(request, monkeypatch):
+    """Encode with orjson and with the stdlib fallback"""
+    if request.param == 'json':
+        monkeypatch.setattr(serialization, 'orjson', None)
+    elif serialization.orjson is None:
+        pytest.skip('orjson is not installed')
+    return request.param
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'customer_id': [12346.0, 12347.0, 12348.0, 12349.0],
+        'country': pd.Categorical(['France', 'EIRE', 'France', 'Spain']),
+        'last_purchase': pd.to_datetime(['2011-01-18 10:01', '2011-12-07 15:52', '2011-09-25 13:13', '2011-11-21 09:51']),
+        'churn_probability': np.array([0.9, 0.1, 0.4, 0.7], dtype=np.float32)
+    })
+
+
+def test_numpy_and_pandas_values(backend, frame):
+    result = {
+        'count': np.int64(4),
+        'share': np.float64(0.25),
+        'flags': np.array([True, False]),
+        'dates': frame['last_purchase'].to_numpy()[:1],
+        'countries': frame['country'][:2],
+        'at': pd.Timestamp('2011-12-09 12:50')
+    }
+
+    assert json.loads(dumps(result)) == {
+        'count': 4, 'share': 0.25, 'flags': [True, False], 'dates': ['2011-01-18T10:01:00'],
+        'countries': ['France', 'EIRE'], 'at': '2011-12-09T12:50:00'
+    }
+
+
+def test_tables_encode_in_either_shape(backend, frame):
+    table = Table.from_frame(frame, ['customer_id', 'country'])
+
+    assert json.loads(dumps({'customers': table})) == {'customers': [
+        {'customer_id': 12346.0, 'country': 'France'}, {'customer_id': 12347.0, 'country': 'EIRE'},
+        {'customer_id': 12348.0, 'country': 'France'}, {'customer_id': 12349.0, 'country': 'Spain'}
+    ]}
+    assert json.loads(dumps({'customers': table}, shape='columns'))['customers'] == {
+        'columns': ['customer_id', 'country'],
+        'rows': [[12346.0, 'France'], [12347.0, 'EIRE'], [12348.0, 'France'], [12349.0, 'Spain']]
+    }
+
+
+def test_unknown_types_are_refused(backend):
+    with pytest.raises(TypeError):
+        dumps({'value': object()})
+
+
+def test_pages_rank_by_a_column(frame):
+    first, cursor = paginate(frame, ['customer_id'], 2, by='churn_probability')
+    second, last = paginate(frame, ['customer_id'], 2, cursor, by='churn_probability')
+
+    assert [row[0] for row in first.rows() + second.rows()] == [12346.0, 12349.0, 12348.0, 12347.0]
+    assert (cursor, last) == ('2', None)
+    assert paginate(frame, ['customer_id'], 3, by='churn_probability', ascending=True)[0].rows()[0] == (12347.0,)
+
+
+@pytest.mark.parametrize('cursor', ['-1', 'abc', 1.5j])
+def test_bad_cursors_are_refused(cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        page_bounds(10, cursor)
+
+
+def test_page_size_is_clamped():
+    assert page_bounds(0, None) == (0, 1)
+    assert page_bounds(10 ** 6, '20') == (20, serialization.MAX_PAGE_SIZE)
+
+
+@pytest.mark.parametrize('header, encoding', [
+    ('gzip, deflate', 'gzip'),
+    ('gzip;q=0, deflate', None),
+    ('identity', None),
+    (None, None)
+])
+def test_accepted_encoding(header, encoding, monkeypatch):
+    monkeypatch.setattr(serialization, 'brotli', None)
+    assert accepted_encoding(header) == encoding
+
+
+def test_compress_round_trips():
+    body = dumps({'values': list(range(1000))})
+    assert gzip.decompress(compress(body, 'gzip')) == body
+    assert compress(body, None) is body
@@ -0,0 +1,154 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_transactions
+from ingest import build_dataset
+from sketches import (
+    CMS_WIDTH, HLL_PRECISION, CountMinSketch, HeavyHitters, HyperLogLog, TDigest,
+    amount_quantiles, build_sketches, distinct_counts, sketch_product_days, update_sketches
+)
+
+# Standard error of a HyperLogLog count
+HLL_ERROR = 1.04 / math.sqrt(1 << HLL_PRECISION)
+
+
+@pytest.fixture(scope='module')
+def weighted_keys():
+    """Zipf-distributed keys with a weight each, and each key's true total"""
+    rng = np.random.default_rng(0)
+    keys = rng.zipf(1.3, 200_000)
+    keys = keys[keys < 100_000]
+    weights = rng.uniform(1, 10, len(keys))
+    return keys, weights, pd.Series(weights).groupby(keys).sum()
+
+
+@pytest.mark.parametrize('n', [100, 5000, 200_000])
+def test_hyperloglog_within_three_standard_errors(n):
+    sketch = HyperLogLog()
+    sketch.add(np.arange(n) * 7.0)
+    sketch.add(np.arange(n // 2) * 7.0)  # repeats don't count
+
+    assert abs(sketch.count() / n - 1) <= 3 * HLL_ERROR
+
+
+def test_hyperloglog_merge_is_union():
+    evens, odds, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    evens.add(np.arange(0, 20_000, 2))
+    odds.add(np.arange(1, 20_000, 2))
+    both.add(np.arange(20_000))
+
+    np.testing.assert_array_equal(evens.merge(odds).registers, both.registers)
+
+
+def test_count_min_overestimates_within_bound(weighted_keys):
+    keys, weights, totals = weighted_keys
+    sketch = CountMinSketch()
+    for part in np.array_split(np.arange(len(keys)), 7):
+        sketch.add(keys[part], weights[part])
+
+    excess = sketch.estimate(totals.index.to_numpy()) - totals.to_numpy()
+    assert excess.min() >= -1e-6 * weights.sum()
+    assert excess.max() <= math.e / CMS_WIDTH * weights.sum()
+
+
+def test_heavy_hitters_finds_top_keys(weighted_keys):
+    keys, weights, totals = weighted_keys
+    parts = np.array_split(np.arange(len(keys)), 10)
+    merged = HeavyHitters()
+    for part in parts:
+        sketch = HeavyHitters()
+        sketch.add(keys[part], weights[part])
+        merged = merged.merge(sketch)
+
+    top = merged.top(10)
+    assert [key for key, _ in top] == [str(key) for key in totals.nlargest(10).index]
+    for (key, estimate), total in zip(top, totals.nlargest(10)):
+        assert total <= estimate <= total + math.e / CMS_WIDTH * weights.sum()
+
+
+def test_tdigest_rank_error():
+    values = np.random.default_rng(0).lognormal(3, 1, 100_000)
+    digest = TDigest()
+    for part in np.array_split(values, 10):
+        chunk = TDigest()
+        chunk.add(part)
+        digest = digest.merge(chunk)
+
+    ordered = np.sort(values)
+    quantiles = np.array([0.001, 0.01, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999])
+    ranks = np.searchsorted(ordered, digest.quantile(quantiles)) / len(values)
+    assert np.abs(ranks - quantiles).max() <= 0.001
+    assert digest.quantile([0, 1]).tolist() == [values.min(), values.max()]
+    assert digest.count == len(values)
+
+
+def test_blocks_sketch_like_one_pass():
+    output, _ = build_dataset(make_transactions(invoices=2000))
+    sales, product_daily = output['sales'], output['product_daily']
+    whole = build_sketches(sales, product_daily)
+    blocks = build_sketches(sales, product_daily, block_rows=97)
+
+    for name in ('hll_customers', 'hll_invoices'):
+        np.testing.assert_array_equal(blocks[name], whole[name])
+    for name in ('cms_products', 'cms_countries'):
+        np.testing.assert_allclose(blocks[name], whole[name])
+
+
+@pytest.fixture(scope='module')
+def split_sales():
+    """Sales and product days, split mid-January into stored history and a delta"""
+    output, _ = build_dataset(make_transactions(invoices=2000))
+    sales, product_daily = output['sales'], output['product_daily']
+    cut = pd.Timestamp('2011-01-15')
+    stored = build_sketches(sales[sales['InvoiceDate'] < cut], product_daily[product_daily['date'] < cut])
+    delta = (sales[sales['InvoiceDate'] >= cut], sketch_product_days(product_daily[product_daily['date'] >= cut]))
+    return sales, stored, delta, build_sketches(sales, product_daily)
+
+
+def test_delta_merges_into_stored_months(split_sales):
+    sales, stored, (added, products), whole = split_sales
+
+    updated = update_sketches(stored, sales, added, sales['InvoiceDate'][:0], products)
+
+    for name in ('periods', 'hll_customers', 'hll_invoices'):
+        np.testing.assert_array_equal(updated[name], whole[name])
+    for name in ('cms_products', 'cms_countries'):
+        np.testing.assert_allclose(updated[name], whole[name])
+    assert updated['top_products'] == whole['top_products']
+    assert updated['top_countries'] == whole['top_countries']
+    merged = amount_quantiles({'sketches': updated, 'metadata': {}}, start='2011-01', end='2011-01')
+    expected = amount_quantiles({'sketches': whole, 'metadata': {}}, start='2011-01', end='2011-01')
+    assert merged['invoices'] == expected['invoices']
+    for q, value in expected['quantiles'].items():
+        assert merged['quantiles'][q] == pytest.approx(value, rel=0.05)
+
+
+def test_extended_invoices_rebuild_their_month(split_sales):
+    sales, stored, (added, products), whole = split_sales
+    extended = pd.Series(pd.to_datetime(['2011-01-20']))
+
+    updated = update_sketches(stored, sales, added, extended, products)
+
+    # January is sketched again from its sales, exactly as in one pass
+    january = np.flatnonzero(whole['periods'] == np.datetime64('2011-01-01'))[0]
+    digest = whole['amount_digest'][january]
+    used = digest[:, 1] > 0
+    np.testing.assert_allclose(updated['amount_digest'][january][used], digest[used])
+    np.testing.assert_allclose(updated['cms_products'], whole['cms_products'])
+
+
+def test_missing_customers_are_not_counted():
+    sales = pd.DataFrame({
+        'InvoiceNo': ['1', '2', '3', '4'],
+        'InvoiceDate': pd.to_datetime(['2011-01-03'] * 4),
+        'CustomerID': [12001.0, 12002.0, np.nan, np.nan],
+        'Country': ['France'] * 4,
+        'total_amount': [10.0, 20.0, 30.0, 40.0]
+    })
+
+    counts = distinct_counts({'sales': sales, 'metadata': {}})
+    assert counts['customers'] == 2
+    assert counts['invoices'] == 4
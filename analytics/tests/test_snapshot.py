@@ -0,0 +1,101 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from snapshot import current_version, load_dataset, read_snapshot, read_state, source_version, write_snapshot
+
+
+@pytest.fixture
+def output():
+    sales = pd.DataFrame({
+        'InvoiceNo': ['536365', '536366', '536367', '536368'],
+        'InvoiceDate': pd.to_datetime(['2010-12-01 08:26', '2010-12-01 08:28', '2010-12-02 09:00', '2010-12-03 10:15']).astype('datetime64[ns]'),
+        'CustomerID': [17850.0, 17850.0, 13047.0, np.nan],
+        'Country': ['United Kingdom', 'United Kingdom', None, 'France'],
+        'Quantity': np.array([6, 2, 32, 1], dtype=np.int64),
+        'total_amount': [15.3, 11.1, 54.08, 2.5],
+        'returned': [False, False, True, False]
+    })
+    return {'sales': sales, 'customers': pd.DataFrame({'customer_id': [17850.0, 13047.0]}),
+            'metadata': {'total_sales': 4}, 'sketches': {'hll': np.arange(8, dtype=np.uint8), 'months': ['2010-12']}}
+
+
+def test_round_trip_keeps_values_and_types(output, tmp_path):
+    version = write_snapshot(output, str(tmp_path))
+    data = read_snapshot(str(tmp_path), mmap=False)
+
+    sales = data['sales']
+    assert isinstance(sales['InvoiceNo'].dtype, pd.CategoricalDtype)
+    assert sales['Country'].isna().tolist() == [False, False, True, False]
+    strings = ['InvoiceNo', 'Country']
+    for column in strings:
+        pd.testing.assert_series_equal(sales[column].astype(object), output['sales'][column].astype(object))
+    pd.testing.assert_frame_equal(sales.drop(columns=strings), output['sales'].drop(columns=strings))
+    assert data['metadata'] == {'total_sales': 4, 'version': version}
+    np.testing.assert_array_equal(data['sketches']['hll'], output['sketches']['hll'])
+    assert data['sketches']['months'] == ['2010-12']
+    assert data['products'].empty
+
+
+def memory_mapped(values):
+    while values is not None:
+        if isinstance(values, np.memmap):
+            return True
+        values = values.base
+    return False
+
+
+def test_columns_are_memory_mapped(output, tmp_path):
+    write_snapshot(output, str(tmp_path))
+
+    assert memory_mapped(read_snapshot(str(tmp_path))['sales']['total_amount'].to_numpy())
+    assert not memory_mapped(read_snapshot(str(tmp_path), mmap=False)['sales']['total_amount'].to_numpy())
+
+
+def test_new_versions_replace_current_and_old_ones_are_pruned(output, tmp_path):
+    versions = [write_snapshot(output, str(tmp_path), keep=2) for _ in range(3)]
+
+    assert current_version(str(tmp_path)) == source_version(str(tmp_path), None) == versions[-1]
+    assert sorted(name for name in os.listdir(tmp_path) if name != 'CURRENT') == versions[1:]
+    assert read_snapshot(str(tmp_path), version=versions[1])['metadata']['version'] == versions[1]
+
+
+def test_state_is_stored_with_the_snapshot(output, tmp_path):
+    write_snapshot(output, str(tmp_path / 'without'))
+    assert read_state(str(tmp_path / 'without')) == (None, {'total_sales': 4})
+
+    invoices = pd.DataFrame({'InvoiceNo': ['a', 'b'], 'Quantity': [3, 4]})
+    write_snapshot(output, str(tmp_path / 'with'), state={'invoices': invoices})
+    state, _ = read_state(str(tmp_path / 'with'), mmap=False)
+    # State strings come back as plain objects, not categories
+    pd.testing.assert_frame_equal(state['invoices'], invoices)
+
+
+def test_unknown_format_is_refused(output, tmp_path):
+    version = write_snapshot(output, str(tmp_path))
+    manifest = tmp_path / version / 'metadata.json'
+    manifest.write_text(json.dumps({**json.loads(manifest.read_text()), 'format': 'columnar-v0'}))
+
+    with pytest.raises(ValueError, match='Unsupported snapshot format'):
+        read_snapshot(str(tmp_path))
+
+
+def test_load_dataset_falls_back_to_json(output, tmp_path):
+    snapshot_dir, json_path = str(tmp_path / 'snapshot'), str(tmp_path / 'processed_data.json')
+    assert load_dataset(snapshot_dir, json_path) is None
+    assert source_version(snapshot_dir, json_path) is None
+
+    customers = [{'customer_id': 1.0, 'last_purchase': '2010-12-03', 'days_since_last_order': 5000}]
+    with open(json_path, 'w') as f:
+        json.dump({'customers': customers, 'metadata': {'total_sales': 4}}, f)
+    data = load_dataset(snapshot_dir, json_path)
+
+    assert data['metadata']['version'] == source_version(snapshot_dir, json_path)
+    assert data['customers']['last_purchase'].dtype.kind == 'M'
+    assert 'days_since_last_order' not in data['customers']
+
+    write_snapshot(output, snapshot_dir)
+    assert load_dataset(snapshot_dir, json_path)['metadata']['version'] == current_version(snapshot_dir)
@@ -0,0 +1,5 @@
+-- Incremental analytics pulls read sales_items in (created_at, id) order
+-- after a watermark; this index serves both the filter and the ordering
+CREATE INDEX IF NOT EXISTS idx_sales_items_created_at_id ON sales_items(created_at, id);
+
+ANALYZE sales_items;
@@ -1,84 +1,290 @@
 import pandas as pd
+import argparse
 import json
-from datetime import datetime
 import os
+import sys
+from datetime import datetime
+
+# Shared snapshot writer lives in the analytics package
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'analytics'))
+
+from db_source import PULL_METHOD, SalesSource
+from ingest import (
+    STATE_KEYS, build_output, clean_data, combine_partials, daily_product_sales,
+    finalize_partials, merge_delta, merge_partials, partial_aggregates, partial_rows,
+    state_tables, update_output
+)
+from sketches import merge_periods, sketch_product_days
+from snapshot import TABLES, read_snapshot, read_state, write_snapshot
 
 # Configuration
 DATASET_PATH = "E:/BI PROJECT/ecom-dash/database/datasets/data.csv"
 OUTPUT_JSON = "E:/BI PROJECT/ecom-dash/database/datasets/processed_data.json"
+OUTPUT_SNAPSHOT = "E:/BI PROJECT/ecom-dash/database/datasets/snapshot"
+WRITE_JSON = True  # keep processed_data.json as a fallback for older readers
+# processed_data.json is one document, so refreshing it means rewriting all
+# of history; deltas leave it as the last full import wrote it unless set
+DELTA_JSON = False
+CHUNK_SIZE = None  # rows per chunk for streaming ingest; None loads the whole file
+
+# Read identifiers as strings so every chunk agrees on their type
+CSV_DTYPES = {'InvoiceNo': str, 'StockCode': str}
+
+def merge_chunks(chunks, state=None):
+    """
+    Clean each chunk of raw transactions and merge its partial aggregates
+    into `state`. Returns (state, product sketches, first date, last date),
+    the sketches being {month: PeriodSketches} of the chunks' product days.
+    """
+    total_rows = 0
+    date_min = date_max = None
+    # Chunk partials wait here and are folded into the state together once
+    # they hold as many rows as the state, so merging stays linear in the
+    # input instead of copying the whole state on every chunk
+    pending, pending_rows = [], 0
+    sketches = {}
+    
+    for i, chunk in enumerate(chunks, start=1):
+        total_rows += len(chunk)
+        chunk = clean_data(chunk)
+        if chunk.empty:
+            continue
+        
+        chunk_min, chunk_max = chunk['InvoiceDate'].min(), chunk['InvoiceDate'].max()
+        date_min = chunk_min if date_min is None else min(date_min, chunk_min)
+        date_max = chunk_max if date_max is None else max(date_max, chunk_max)
+        
+        partial = partial_aggregates(chunk)
+        pending.append(partial)
+        pending_rows += partial_rows(partial)
+        if pending_rows >= partial_rows(state):
+            state = fold_pending(state, sketches, pending)
+            pending, pending_rows = [], 0
+            print(f"   ...chunk {i}: {total_rows} records read, {len(state['invoices'])} invoices")
+    
+    if pending:
+        state = fold_pending(state, sketches, pending)
+    
+    print(f"✅ Loaded {total_rows} records")
+    
+    return state, sketches, date_min, date_max
+
+def fold_pending(state, sketches, pending):
+    """Merge buffered chunk partials into the state, sketching their product days on the way"""
+    combined = combine_partials(pending)
+    merge_periods(sketches, sketch_product_days(daily_product_sales(combined)))
+    return merge_partials(state, combined)
 
-def load_and_process_data():
+def stream_partials(dataset_path, chunk_size=None, state=None):
+    """
+    Stream the CSV in chunks of `chunk_size` rows (whole file if None),
+    merging partial aggregates into `state` as it goes. Peak memory is
+    bounded by the chunk size plus the size of the aggregates, not by the
+    size of the file.
+    """
+    if chunk_size:
+        reader = pd.read_csv(dataset_path, encoding='ISO-8859-1', dtype=CSV_DTYPES, chunksize=chunk_size)
+    else:
+        reader = [pd.read_csv(dataset_path, encoding='ISO-8859-1', dtype=CSV_DTYPES)]
+    
+    return merge_chunks(reader, state)
+
+def print_statistics(output):
+    """Print a short summary of the processed dataset"""
+    metadata = output['metadata']
+    print(f"📊 Statistics:")
+    print(f"   - Total Sales: {metadata['total_sales']}")
+    print(f"   - Total Customers: {metadata['total_customers']}")
+    print(f"   - Total Products: {metadata['total_products']}")
+    print(f"   - Date Range: {metadata['date_range']['start']} to {metadata['date_range']['end']}")
+
+def save_output(output, snapshot_dir=OUTPUT_SNAPSHOT, json_path=OUTPUT_JSON, state=None,
+                unchanged=None, write_json=WRITE_JSON):
+    """
+    Write the columnar snapshot and, optionally, the JSON fallback.
+    `unchanged` lists what the previous version already has (see write_snapshot).
+    """
+    version = write_snapshot(output, snapshot_dir, state=state_tables(state), unchanged=unchanged)
+    print(f"✅ Snapshot {version} saved to {snapshot_dir}")
+    
+    if write_json:
+        records = {
+            table: output[table].to_dict('records')
+            for table in ('sales', 'products', 'product_daily')
+        }
+        # The backend's JSON readers expect recency as of this run
+        customers = output['customers'].assign(
+            days_since_last_order=(datetime.now() - output['customers']['last_purchase']).dt.days
+        )
+        records['customers'] = customers.to_dict('records')
+        with open(json_path, 'w') as f:
+            json.dump({**records, 'metadata': output['metadata']}, f, default=str)
+        
+        print(f"✅ Processed data saved to {json_path}")
+
+def load_and_process_data(dataset_path=DATASET_PATH, chunk_size=CHUNK_SIZE,
+                          snapshot_dir=OUTPUT_SNAPSHOT, json_path=OUTPUT_JSON):
     """Load Kaggle dataset and transform for SalesRadar"""
     print("📥 Loading Kaggle E-Commerce Dataset...")
     
-    # Load data
-    df = pd.read_csv(DATASET_PATH, encoding='ISO-8859-1')
-    
-    print(f"✅ Loaded {len(df)} records")
-    
-    # Clean data
-    df = df.dropna(subset=['CustomerID', 'InvoiceNo'])
-    df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
-    
-    # Create sales summary
-    sales_summary = df.groupby('InvoiceNo').agg({
-        'InvoiceDate': 'first',
-        'CustomerID': 'first',
-        'Country': 'first',
-        'Quantity': 'sum',
-        'UnitPrice': 'mean'
-    }).reset_index()
-    
-    sales_summary['total_amount'] = sales_summary['Quantity'] * sales_summary['UnitPrice']
-    sales_summary['profit'] = sales_summary['total_amount'] * 0.3  # 30% profit margin
-    
-    # Create customers data
-    customers = df.groupby('CustomerID').agg({
-        'Country': 'first',
-        'InvoiceDate': ['min', 'max', 'count'],
-        'Quantity': 'sum'
-    }).reset_index()
-    
-    customers.columns = ['customer_id', 'country', 'first_purchase', 'last_purchase', 'order_count', 'total_items']
-    customers['days_since_last_order'] = (datetime.now() - pd.to_datetime(customers['last_purchase'])).dt.days
-    
-    # Create products data
-    products = df.groupby('StockCode').agg({
-        'Description': 'first',
-        'UnitPrice': 'mean',
-        'Quantity': 'sum'
-    }).reset_index()
-    
-    products.columns = ['product_id', 'name', 'price', 'total_sold']
-    
-    # Prepare JSON output
-    output = {
-        'sales': sales_summary.to_dict('records'),
-        'customers': customers.to_dict('records'),
-        'products': products.head(100).to_dict('records'),
-        'metadata': {
-            'total_sales': len(sales_summary),
-            'total_customers': len(customers),
-            'total_products': len(products),
-            'date_range': {
-                'start': df['InvoiceDate'].min().isoformat(),
-                'end': df['InvoiceDate'].max().isoformat()
-            }
-        }
-    }
+    if chunk_size:
+        print(f"🔁 Streaming in chunks of {chunk_size} rows")
+        state, sketches, date_min, date_max = stream_partials(dataset_path, chunk_size)
+        sales_summary, customers, products = finalize_partials(state)
+    else:
+        # Load data
+        df = pd.read_csv(dataset_path, encoding='ISO-8859-1', dtype=CSV_DTYPES)
+        
+        print(f"✅ Loaded {len(df)} records")
+        
+        # Clean data
+        df = clean_data(df)
+        state = partial_aggregates(df)
+        sales_summary, customers, products = finalize_partials(state)
+        sketches = None
+        date_min, date_max = df['InvoiceDate'].min(), df['InvoiceDate'].max()
     
-    # Save to JSON
-    with open(OUTPUT_JSON, 'w') as f:
-        json.dump(output, f, indent=2, default=str)
+    output = build_output(sales_summary, customers, products, daily_product_sales(state), date_min, date_max, sketches)
+    save_output(output, snapshot_dir, json_path, state)
     
-    print(f"✅ Processed data saved to {OUTPUT_JSON}")
-    print(f"📊 Statistics:")
-    print(f"   - Total Sales: {len(sales_summary)}")
-    print(f"   - Total Customers: {len(customers)}")
-    print(f"   - Total Products: {len(products)}")
-    print(f"   - Date Range: {output['metadata']['date_range']['start']} to {output['metadata']['date_range']['end']}")
+    print_statistics(output)
+    
+    return output
+
+def apply_delta(delta_path, chunk_size=CHUNK_SIZE, snapshot_dir=OUTPUT_SNAPSHOT, json_path=OUTPUT_JSON):
+    """
+    Merge a file of new transactions into the current snapshot without
+    re-reading history. Only invoices/customers/products present in the
+    delta are regrouped; everything else is carried over from the stored
+    aggregate state. Returns None (and writes nothing) if the file has no
+    usable transactions.
+    """
+    print(f"📥 Applying delta {delta_path}...")
+    
+    state, metadata = stored_state(snapshot_dir)
+    # Chunks merge into the delta's own aggregates; history is touched once
+    delta, sketches, date_min, date_max = stream_partials(delta_path, chunk_size)
+    if delta is None:
+        print("✅ No new transactions")
+        return None
+    
+    return save_delta(state, delta, sketches, metadata, date_min, date_max, snapshot_dir, json_path)
+
+def stored_state(snapshot_dir):
+    """Aggregate state (indexed by key) and metadata of the current snapshot"""
+    # In memory, since merging updates the rows of touched keys in place
+    state, metadata = read_state(snapshot_dir, mmap=False)
+    if state is None:
+        raise ValueError("Current snapshot has no aggregate state; run a full import first")
+    
+    missing = set(STATE_KEYS) - set(state)
+    if missing:
+        raise ValueError(f"Snapshot state lacks {sorted(missing)}; run a full import first")
+    
+    return {key: state[key].set_index(STATE_KEYS[key]) for key in STATE_KEYS}, metadata
+
+def save_delta(state, delta, sketches, metadata, date_min, date_max, snapshot_dir, json_path, source=None):
+    """
+    Write a snapshot with a delta's partial aggregates (and product
+    sketches) merged into the stored state. Only the delta's keys are
+    finalized: their rows are patched into the current version's tables,
+    its rollup periods and sketch months are updated, and column files
+    the delta didn't change are linked rather than written again.
+    `delta` is None when there is nothing to merge but the metadata moves on.
+    """
+    # Widen the stored date range by whatever the delta covered
+    date_range = metadata['date_range']
+    date_min = min(d for d in (pd.Timestamp(date_range['start']), date_min) if d is not None)
+    date_max = max(d for d in (pd.Timestamp(date_range['end']), date_max) if d is not None)
+    
+    previous = read_snapshot(snapshot_dir)
+    if delta is None:
+        output = {**previous, 'metadata': {**metadata}}
+        unchanged = {'tables': {table: list(previous[table].columns) for table in TABLES if table in previous},
+                     'state': {key: list(STATE_KEYS[key]) + list(state[key].columns) for key in state},
+                     'sketches': list(previous.get('sketches', {}))}
+    else:
+        state, state_unchanged = merge_delta(state, delta)
+        output, tables_unchanged = update_output(previous, state, delta, sketches, date_min, date_max)
+        unchanged = {'tables': tables_unchanged, 'state': state_unchanged}
+    if source:
+        output['metadata']['source'] = source
+    
+    save_output(output, snapshot_dir, json_path, state, unchanged, write_json=WRITE_JSON and DELTA_JSON)
+    if WRITE_JSON and not DELTA_JSON:
+        print(f"ℹ️  {json_path} left as the last full import wrote it (set DELTA_JSON to refresh it)")
+    
+    print_statistics(output)
     
     return output
 
+def load_from_database(url, snapshot_dir=OUTPUT_SNAPSHOT, json_path=OUTPUT_JSON, method=PULL_METHOD):
+    """Full pull of every sales line from the application database"""
+    print(f"📥 Pulling sales lines from the database ({method})...")
+    
+    source = SalesSource(url)
+    try:
+        state, sketches, date_min, date_max = merge_chunks(source.iter_lines(method=method))
+    finally:
+        source.close()
+    if state is None:
+        raise ValueError("The database has no sales lines")
+    
+    sales_summary, customers, products = finalize_partials(state)
+    output = build_output(sales_summary, customers, products, daily_product_sales(state), date_min, date_max, sketches)
+    # Where the next incremental pull starts
+    output['metadata']['source'] = {'type': 'database', 'watermark': source.watermark}
+    save_output(output, snapshot_dir, json_path, state)
+    
+    print_statistics(output)
+    
+    return output
+
+def apply_database_delta(url, snapshot_dir=OUTPUT_SNAPSHOT, json_path=OUTPUT_JSON, method=PULL_METHOD):
+    """
+    Incremental pull: merge the sales lines created after the current
+    snapshot's watermark. Returns None (and writes nothing) if there are
+    no new lines.
+    """
+    state, metadata = stored_state(snapshot_dir)
+    watermark = metadata.get('source', {}).get('watermark')
+    if watermark is None:
+        raise ValueError("Current snapshot wasn't pulled from the database; run a full --database import first")
+    
+    print(f"📥 Pulling sales lines since {watermark['created_at']}...")
+    source = SalesSource(url)
+    try:
+        delta, sketches, date_min, date_max = merge_chunks(source.iter_lines(watermark, method))
+    finally:
+        source.close()
+    if source.lines_pulled == 0:
+        print("✅ No new sales lines")
+        return None
+    
+    # Lines pulled but all dropped by cleaning still move the watermark on
+    return save_delta(state, delta, sketches, metadata, date_min, date_max, snapshot_dir, json_path,
+                      source={'type': 'database', 'watermark': source.watermark})
+
 if __name__ == "__main__":
-    data = load_and_process_data()
+    parser = argparse.ArgumentParser(description="Import the Kaggle e-commerce dataset for SalesRadar")
+    parser.add_argument('--input', default=DATASET_PATH, help='Path to the raw CSV')
+    parser.add_argument('--delta', help='Merge this CSV of new transactions into the current snapshot')
+    parser.add_argument('--database', help='Pull from this database (postgresql://... or sqlite:///path) instead of a CSV')
+    parser.add_argument('--incremental', action='store_true',
+                        help='With --database, only pull lines created since the current snapshot')
+    parser.add_argument('--pull-method', choices=['cursor', 'copy'], default=PULL_METHOD,
+                        help='With --database: server-side cursor or COPY (Postgres only)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='Stream the CSV in chunks of this many rows (default: load whole file)')
+    parser.add_argument('--snapshot-dir', default=OUTPUT_SNAPSHOT, help='Output snapshot directory')
+    parser.add_argument('--json', default=OUTPUT_JSON, help='Output JSON fallback path')
+    args = parser.parse_args()
+    
+    if args.database and args.incremental:
+        data = apply_database_delta(args.database, args.snapshot_dir, args.json, args.pull_method)
+    elif args.database:
+        data = load_from_database(args.database, args.snapshot_dir, args.json, args.pull_method)
+    elif args.delta:
+        data = apply_delta(args.delta, args.chunk_size, args.snapshot_dir, args.json)
+    else:
+        data = load_and_process_data(args.input, args.chunk_size, args.snapshot_dir, args.json)